@@ -2,10 +2,12 @@ import os
 import re
 import uuid
 import secrets
+import time
 import mimetypes
 # Enforce CSS MIME type to prevent registry issues on some OS/environments
 mimetypes.add_type('text/css', '.css')
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date
 
 from dotenv import load_dotenv
@@ -22,17 +24,19 @@ import db  # Added db import
 from flask_caching import Cache
 from flask_cors import CORS
 from availability import AvailabilityService
+from barber_settings import BarberSettingsCache, HOT_COLUMNS, is_expired
+from search_cache import SearchCache
+from geo_index import GeoIndex
+from geocoder import get_geocoder, parse_latlon
+from next_slots import NextSlotsRefresher
+from media_pipeline import MediaPipeline, UploadTooLarge, stream_to_temp, variant_url
+from job_queue import JobQueue
 
 # ----------------------------------------------
 # Supabase
 # ----------------------------------------------
-from supabase import create_client, Client
-from supabase_client import supabase_admin
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# One client layer (shared keep-alive pool) for app.py and db.py
+from supabase_client import supabase, supabase_admin
 
 # ----------------------------------------------
 # Flask
@@ -56,18 +60,54 @@ CORS(app, resources={
 })
 
 # Enhanced session security configuration
-app.config["SESSION_TYPE"] = "filesystem"
 app.config["SESSION_PERMANENT"] = True
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)
-app.config["SESSION_FILE_DIR"] = "./flask_session"
 app.config["SESSION_COOKIE_SECURE"] = True  # HTTPS only
 app.config["SESSION_COOKIE_HTTPONLY"] = True  # No JavaScript access
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"  # CSRF protection
-app.config["SESSION_REFRESH_EACH_REQUEST"] = True  # Extend session on activity
+# Only write the session when it changed (see refresh_session_expiry below)
+app.config["SESSION_REFRESH_EACH_REQUEST"] = False
+
+# Session backend: "cookie" (signed cookie, no server storage), "redis"
+# (shared across instances, reuses REDIS_URL) or "filesystem" (legacy,
+# per-instance disk).
+SESSION_BACKEND = (os.environ.get("SESSION_BACKEND") or "filesystem").lower().strip()
+
+if SESSION_BACKEND == "redis" and os.environ.get("REDIS_URL"):
+    import redis
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = redis.from_url(os.environ["REDIS_URL"])
+    Session(app)
+elif SESSION_BACKEND == "cookie":
+    # Flask's built-in SecureCookieSessionInterface (signed with SECRET_KEY).
+    # Our payload is tiny (barberId, user_email, barber_name).
+    pass
+else:
+    if SESSION_BACKEND != "filesystem":
+        print(f"WARNING: SESSION_BACKEND={SESSION_BACKEND} unavailable, using filesystem sessions")
+    app.config["SESSION_TYPE"] = "filesystem"
+    app.config["SESSION_FILE_DIR"] = "./flask_session"
+    os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
+    Session(app)
 
-os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
+SESSION_TOUCH_INTERVAL = timedelta(days=1)
 
-Session(app)
+@app.before_request
+def refresh_session_expiry():
+    """
+    Keep the 7-day sliding expiry without rewriting the session on every
+    request: mark it modified at most once per SESSION_TOUCH_INTERVAL.
+    """
+    if "barberId" not in session and "clientId" not in session:
+        return
+    # The cookie backend ignores SESSION_PERMANENT; without this the cookie
+    # has no Expires and logins end with the browser.
+    if not session.permanent:
+        session.permanent = True
+    now = int(time.time())
+    touched = session.get("_touched") or 0
+    if now - touched >= SESSION_TOUCH_INTERVAL.total_seconds():
+        session["_touched"] = now
 
 # ----------------------------------------------
 # Caching
@@ -89,6 +129,71 @@ else:
 
 availability_service = AvailabilityService(cache)
 
+
+def load_barber_settings(barber_id):
+    res = supabase.table("barbers").select(HOT_COLUMNS).eq("id", barber_id).execute()
+    return res.data[0] if res.data else None
+
+barber_settings = BarberSettingsCache(cache, load_barber_settings)
+
+# /find-pro result pages (invalidated on any barber search-field change)
+search_cache = SearchCache(cache, db.search_barbers)
+search_cache.start_warmer()
+
+# Each barber's next open slots, precomputed onto the barbers row for search
+# and refreshed in the background whenever their availability changes
+def compute_open_days(barber_id, start_date, end_date):
+    duration = barber_settings.slot_duration(barber_id)
+    return availability_service.get_availability_range(barber_id, start_date, end_date, duration)["days"]
+
+next_slots = NextSlotsRefresher(
+    cache,
+    compute=compute_open_days,
+    store=db.set_next_slots,
+    list_stale=db.list_stale_next_slots,
+    on_batch=search_cache.invalidate_availability,
+)
+availability_service.add_listener(next_slots.mark_dirty)
+next_slots.start()
+
+# Durable background jobs (Redis when REDIS_URL is set, else a local SQLite
+# file). Webhooks and account deletion only enqueue; handlers are registered
+# with @jobs.task below. Workers run in-process unless JOB_WORKER_INPROCESS=0
+# (then run `python worker.py`, see Procfile).
+jobs = JobQueue.from_env()
+JOB_WORKER_INPROCESS = os.getenv("JOB_WORKER_INPROCESS", "1") == "1"
+JOB_WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", 1))
+
+# "Near me" search: per-worker spatial index over geocoded addresses.
+# Coordinate changes go through geo_index.upsert/remove, which the other
+# workers replay from the shared cache.
+geo_index = GeoIndex(db.load_geo_points, cache=cache)
+geocoder = get_geocoder()
+_geocode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="geocode")
+
+
+def store_coordinates(table, row_id, lat, lon):
+    """Save coordinates for a barbers/barber_locations row and index them."""
+    row = db.set_coordinates(table, row_id, lat, lon)
+    if not row:
+        return
+    if table == "barbers":
+        geo_index.upsert(db.geo_point(row))
+    else:
+        geo_index.upsert(db.geo_point({"id": row["barber_id"]}, row))
+
+
+def geocode_later(table, row_id, address):
+    """Geocode a just-saved address off the request path (once per save)."""
+    def run():
+        try:
+            coords = geocoder.geocode(address)
+            if coords:
+                store_coordinates(table, row_id, *coords)
+        except Exception as e:
+            print(f"Geocoding {table} {row_id} failed: {e}")
+    _geocode_pool.submit(run)
+
 # ----------------------------------------------
 # Stripe
 # ----------------------------------------------
@@ -125,6 +230,17 @@ def login_required(fn):
         resp.headers["Expires"] = "0"
         return resp
     return w
+def internal_only(fn):
+    """Guard for ops/cron endpoints: requires X-Internal-Token == INTERNAL_API_TOKEN."""
+    @wraps(fn)
+    def w(*a, **kw):
+        expected = os.getenv("INTERNAL_API_TOKEN")
+        provided = request.headers.get("X-Internal-Token", "")
+        if not expected or not secrets.compare_digest(provided, expected):
+            return jsonify({"error": "Forbidden", "ok": False}), 403
+        return fn(*a, **kw)
+    return w
+
 def premium_required(fn):
     @wraps(fn)
     def w(*a, **kw):
@@ -135,8 +251,8 @@ def premium_required(fn):
             return redirect(url_for("login"))
 
         barber_id = session["barberId"]
-        barber = supabase.table("barbers").select("plan").eq("id", barber_id).execute().data
-        plan = (barber[0].get("plan") if barber else "free") or "free"
+        # Cached plan + expiry; invalidated on every plan write
+        plan = barber_settings.effective_plan(barber_id)
 
         if plan != "premium":
             # Check if this is an API request
@@ -266,6 +382,61 @@ def health():
 def status():
     return "ok"
 
+@app.get("/api/internal/cache-stats")
+@internal_only
+def cache_stats():
+    return jsonify({
+        "ok": True,
+        "availability": availability_service.stats(),
+        "search": search_cache.stats(),
+        "geo": geo_index.stats(),
+        "next_slots": next_slots.stats(),
+        "jobs": jobs.stats(),
+    })
+
+@app.post("/api/internal/next-slots/refresh")
+@internal_only
+def next_slots_refresh():
+    """Refresh up to ?limit= barbers whose stored next slots expired (cron/backfill)."""
+    try:
+        limit = min(max(int(request.args.get("limit", 200)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    return jsonify({"ok": True, "refreshed": next_slots.sweep(limit=limit)})
+
+@app.post("/api/internal/premium/expire")
+@internal_only
+def premium_expire():
+    """Cron / Cloud Scheduler: downgrade every expired premium barber in one batch."""
+    downgraded = db.expire_premium()
+    for barber_id in downgraded:
+        barber_settings.invalidate(barber_id)
+    if downgraded:
+        # plan ranks search results
+        search_cache.invalidate()
+
+    print(f"Premium expiry: {len(downgraded)} downgraded")
+    return jsonify({"ok": True, "downgraded": len(downgraded)})
+
+@app.post("/api/internal/geocode-backfill")
+@internal_only
+def geocode_backfill():
+    """Geocode up to ?limit= saved addresses that have no coordinates yet."""
+    try:
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    done = failed = 0
+    for table in ("barbers", "barber_locations"):
+        for row in db.list_missing_coordinates(table, limit=limit):
+            coords = geocoder.geocode(row["address"])
+            if coords:
+                store_coordinates(table, row["id"], *coords)
+                done += 1
+            else:
+                failed += 1
+    return jsonify({"ok": True, "geocoded": done, "unresolved": failed})
+
 # ============================================================
 # AUTH — BARBER
 # ============================================================
@@ -339,6 +510,10 @@ def create_barber_and_login(name, email, password, phone, bio, address, professi
         return None
 
     barber = res.data[0]
+    # New barber can appear in search results right away
+    search_cache.invalidate()
+    if address:
+        geocode_later("barbers", barber["id"], address)
 
     # Auto-login
     session["barberId"] = barber["id"]
@@ -557,6 +732,8 @@ def signup_premium():
                 
                 # Update plan to premium (should already be premium from create, but double-check)
                 supabase.table("barbers").update({"plan": "premium"}).eq("id", barber["id"]).execute()
+                barber_settings.invalidate(barber["id"])
+                search_cache.invalidate()
                 
                 if request.is_json:
                     return jsonify({
@@ -571,6 +748,8 @@ def signup_premium():
                 # Promo redemption failed, downgrade to pending and proceed to Stripe
                 print(f"DEBUG: Promo redemption failed for {email}, proceeding to Stripe")
                 supabase.table("barbers").update({"plan": "pending_premium"}).eq("id", barber["id"]).execute()
+                barber_settings.invalidate(barber["id"])
+                search_cache.invalidate()
 
         # ------------------------------------------------------------
         # STRIPE CHECKOUT (For non-promo or failed promo redemption)
@@ -867,90 +1046,68 @@ def logout():
 @app.post("/api/barber/delete")
 @login_required
 def delete_account():
+    """Queue the Stripe cancellation and data deletion, then log out."""
     barber_id = session["barberId"]
+    email = session.get("user_email")
     try:
-        # Get barber info first to find Stripe customer
-        barber = supabase.table("barbers").select("*").eq("id", barber_id).execute().data
-        if not barber:
-            return jsonify({"success": False, "error": "Account not found"}), 404
-
-
-        
-        barber = barber[0]
-        email = barber.get("email")
-        
-        # Cancel Stripe subscription if user has one
         if email:
-            try:
-                # Find Stripe customer by email
-                customers = stripe.Customer.list(email=email, limit=1)
-                if customers.data:
-                    customer_id = customers.data[0].id
-                    
-                    # Get all subscriptions for this customer
-                    subscriptions = stripe.Subscription.list(customer=customer_id, status="active")
-                    
-                    # Cancel all active subscriptions
-                    for subscription in subscriptions.data:
-                        stripe.Subscription.cancel(subscription.id)
-                        print(f"Cancelled Stripe subscription {subscription.id} for {email}")
-                    
-                    print(f"Cancelled {len(subscriptions.data)} subscription(s) for {email}")
-            except Exception as stripe_error:
-                print(f"Error cancelling Stripe subscription: {stripe_error}")
-                # Continue with account deletion even if Stripe cancellation fails
-        
-        # Delete all related data (cascade delete)
-        print(f"Starting cascade delete for barber_id: {barber_id}")
-        
-        try:
-            # Delete appointments
-            appt_result = supabase.table("appointments").delete().eq("barber_id", barber_id).execute()
-            print(f"Deleted appointments: {len(appt_result.data) if appt_result.data else 0}")
-        except Exception as e:
-            print(f"Error deleting appointments: {e}")
-        
-        try:
-            # Delete weekly hours
-            hours_result = supabase.table("barber_weekly_hours").delete().eq("barber_id", barber_id).execute()
-            print(f"Deleted weekly hours: {len(hours_result.data) if hours_result.data else 0}")
-        except Exception as e:
-            print(f"Error deleting weekly hours: {e}")
-        
-        try:
-            # Delete schedule overrides
-            override_result = supabase.table("schedule_overrides").delete().eq("barber_id", barber_id).execute()
-            print(f"Deleted schedule overrides: {len(override_result.data) if override_result.data else 0}")
-        except Exception as e:
-            print(f"Error deleting schedule overrides: {e}")
-        
-        try:
-            # Delete gallery photos
-            gallery_result = supabase.table("gallery").delete().eq("barber_id", barber_id).execute()
-            print(f"Deleted gallery photos: {len(gallery_result.data) if gallery_result.data else 0}")
-        except Exception as e:
-            print(f"Error deleting gallery: {e}")
-        
-        # Finally, delete the barber account
-        barber_result = supabase.table("barbers").delete().eq("id", barber_id).execute()
-        if not barber_result.data:
-            print(f"Warning: Barber deletion returned no data for {barber_id}")
-        else:
-            print(f"Successfully deleted barber account: {barber_id}")
-        
-        # Clear session
-        session.clear()
-        
-        return jsonify({
-            "success": True,
-            "message": "Account, subscription, and all data deleted successfully"
-        })
+            jobs.enqueue("stripe.cancel_subscriptions", {"email": email}, key=f"cancel-subs:{barber_id}")
+        jobs.enqueue("account.delete", {"barber_id": barber_id}, key=f"delete-account:{barber_id}")
     except Exception as e:
         print(f"Delete account error: {e}")
-        import traceback
-        traceback.print_exc()
         return jsonify({"success": False, "error": str(e)}), 500
 
+    session.clear()
+
+    return jsonify({
+        "success": True,
+        "message": "Account deletion started. Your subscription and data will be removed shortly."
+    })
+
+
+def deletion_job_dead(payload, error):
+    # The user was already told deletion started: make the failure loud
+    print(f"🚨 ALERT: account deletion job gave up ({error}) for {payload}. Finish it by hand.")
+
+
+@jobs.task("stripe.cancel_subscriptions", on_dead=deletion_job_dead)
+def cancel_stripe_subscriptions(payload):
+    """Cancel every active subscription for the customer with this email."""
+    email = payload["email"]
+    customers = stripe.Customer.list(email=email, limit=1)
+    if not customers.data:
+        return
+    customer_id = customers.data[0].id
+
+    # Already-cancelled subscriptions drop out of the list, so retries are safe
+    subscriptions = stripe.Subscription.list(customer=customer_id, status="active")
+    for subscription in subscriptions.data:
+        stripe.Subscription.cancel(subscription.id)
+        print(f"Cancelled Stripe subscription {subscription.id} for {email}")
+
+    print(f"Cancelled {len(subscriptions.data)} subscription(s) for {email}")
+
+
+@jobs.task("account.delete", on_dead=deletion_job_dead)
+def delete_account_data(payload):
+    """Cascade delete a barber's rows; any failure raises so the job retries."""
+    barber_id = payload["barber_id"]
+    print(f"Starting cascade delete for barber_id: {barber_id}")
+
+    for table in ("appointments", "barber_weekly_hours", "schedule_overrides", "gallery"):
+        result = supabase.table(table).delete().eq("barber_id", barber_id).execute()
+        print(f"Deleted {table}: {len(result.data) if result.data else 0}")
+
+    # Finally, delete the barber account
+    barber_result = supabase.table("barbers").delete().eq("id", barber_id).execute()
+    barber_settings.invalidate(barber_id)
+    search_cache.invalidate()
+    geo_index.remove_barber(barber_id)
+    if not barber_result.data:
+        print(f"Warning: Barber deletion returned no data for {barber_id}")
+    else:
+        print(f"Successfully deleted barber account: {barber_id}")
+
 
 
 # ============================================================
@@ -1080,6 +1237,9 @@ def reset_password():
 # ============================================================
 # DASHBOARD (BARBER)
 # ============================================================
+APPOINTMENTS_PAGE_SIZE = 25
+APPOINTMENTS_PAGE_MAX = 200
+
 @app.get("/dashboard")
 @login_required
 def dashboard():
@@ -1087,37 +1247,32 @@ def dashboard():
 
     barber = supabase.table("barbers").select("*").eq("id", barber_id).execute().data[0]
 
-    # Optional: auto-downgrade if premium expired (only if you want)
-    # If you DON'T want this behavior yet, skip this block.
-    expires = barber.get("premium_expires_at")
-    if barber.get("plan") == "premium" and expires:
-        try:
-            exp_dt = datetime.fromisoformat(expires)
-            if exp_dt < datetime.utcnow():
-                supabase.table("barbers").update({"plan": "free"}).eq("id", barber_id).execute()
-                barber["plan"] = "free"
-        except:
-            pass
-
-    appts = supabase.table("appointments").select("*") \
-        .eq("barber_id", barber_id) \
-        .order("date").order("start_time").execute().data
+    # Expired premium is shown as free right away; the stored plan is
+    # downgraded by the batch job (POST /api/internal/premium/expire), never here
+    if barber.get("plan") == "premium" and is_expired(barber.get("premium_expires_at")):
+        barber["plan"] = "free"
+
+    # First page of upcoming appointments only; the page asks for more
+    # (and the calendar for its visible month) through /api/barber/appointments.
+    # Default weekly hours are created at signup, not here.
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    appts, next_cursor = db.list_barber_appointments_page(
+        barber_id, start_date=today, limit=APPOINTMENTS_PAGE_SIZE, include_cancelled=True
+    )
 
     features = get_features(barber.get("plan"))
 
-    # ✅ Always ensure hours exist so free dashboard doesn't break
-    ensure_default_weekly_hours(barber_id)
-
     # Choose which template to render
     if request.is_json or request.headers.get("Accept") == "application/json":
         return jsonify({
             "barber": barber,
             "appointments": appts,
+            "next_cursor": next_cursor,
             "features": features
         })
 
-    if barber.get("plan") == "premium":
-        return render_template("dashboard.html", barber=barber, appointments=appts, features=features)
+    template = "dashboard.html" if barber.get("plan") == "premium" else "dashboard_free.html"
+    return render_template(template, barber=barber, appointments=appts, next_cursor=next_cursor, features=features)
 
 
 @app.post("/api/barber/update")
@@ -1146,11 +1301,30 @@ def update_barber_profile():
         except ValueError:
             pass # Ignore invalid format
 
+    # Coordinates from the client (e.g. browser geolocation) win over geocoding
+    coords = parse_latlon(data.get("lat"), data.get("lon"))
+    if coords:
+        updates["lat"], updates["lon"] = coords
+    elif address:
+        # Old coordinates no longer match; geocoded again below
+        updates["lat"] = updates["lon"] = None
+
     if updates:
-        supabase.table("barbers").update(updates).eq("id", barber_id).execute()
+        res = supabase.table("barbers").update(updates).eq("id", barber_id).execute()
+        barber_settings.invalidate(barber_id)
+        search_cache.invalidate()
+        if coords and res.data:
+            geo_index.upsert(db.geo_point(res.data[0]))
+        elif address:
+            geo_index.remove(f"b:{barber_id}")
         # Update session if name changed
         if "name" in updates:
             session["barber_name"] = updates["name"]
+        # Slot length changes every cached day for this barber
+        if "slot_duration" in updates:
+            availability_service.invalidate_barber(barber_id)
+        if address and not coords:
+            geocode_later("barbers", barber_id, address)
 
     if request.is_json or request.headers.get("Accept") == "application/json":
         return jsonify({"success": True})
@@ -1158,8 +1332,6 @@ def update_barber_profile():
     flash("Profile updated")
     return redirect(url_for("settings"))
 
-    return render_template("dashboard_free.html", barber=barber, appointments=appts, features=features)
-
 
 from werkzeug.utils import secure_filename
 
@@ -1179,140 +1351,106 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.post("/upload-photo")
-@premium_required
-def upload_photo():
-    # Check if request via API
-    is_api = request.is_json or request.headers.get("Accept") == "application/json" or request.headers.get("X-Requested-With") == "XMLHttpRequest"
 
-    if "photo" not in request.files:
-        msg = "No file part"
-        if is_api: return jsonify({"ok": False, "error": msg}), 400
-        flash(msg, "error")
-        return redirect(url_for("dashboard"))
-    
-    file = request.files["photo"]
-    if file.filename == "":
-        msg = "No selected file"
-        if is_api: return jsonify({"ok": False, "error": msg}), 400
-        flash(msg, "error")
-        return redirect(url_for("dashboard"))
+def upload_to_storage(path, data, content_type):
+    supabase.storage.from_("barber_media").upload(path, data, {"content-type": content_type})
+    return supabase.storage.from_("barber_media").get_public_url(path)
 
-    if file:
-        if not allowed_file(file.filename):
-            msg = "Invalid file type. Allowed: png, jpg, jpeg, gif, webp"
-            if is_api: return jsonify({"ok": False, "error": msg}), 400
-            flash(msg, "error")
-            return redirect(url_for("dashboard"))
 
-        # Check file size
-        file.seek(0, 2)
-        size = file.tell()
-        file.seek(0)
-        
-        if size > MAX_FILE_SIZE:
-            msg = "File too large (Max 5MB)"
-            if is_api: return jsonify({"ok": False, "error": msg}), 400
-            flash(msg, "error")
-            return redirect(url_for("dashboard"))
+def record_media(job):
+    """Store a finished media job's variant URLs."""
+    variants = job["variants"]
+    if job["kind"] == "photo":
+        supabase.table("barbers").update({
+            "photo_url": variants["card"],
+            "photo_variants": variants,
+        }).eq("id", job["barber_id"]).execute()
+        search_cache.invalidate()
+    else:
+        supabase.table("gallery").insert({
+            "barber_id": job["barber_id"],
+            "url": variants["full"],
+            "variants": variants,
+            "type": "image", # We enforced image only
+            "created_at": datetime.utcnow().isoformat()
+        }).execute()
 
-        filename = secure_filename(file.filename)
-        barber_id = session["barberId"]
-        file_path = f"avatars/{barber_id}/{int(datetime.utcnow().timestamp())}_{filename}"
-        
-        try:
-            # Read file data
-            file_data = file.read()
-            # Upload to Supabase Storage
-            res = supabase.storage.from_("barber_media").upload(file_path, file_data, {"content-type": file.content_type})
-            
-            # Get Public URL
-            public_url = supabase.storage.from_("barber_media").get_public_url(file_path)
-            
-            # Update Database
-            supabase.table("barbers").update({"photo_url": public_url}).eq("id", barber_id).execute()
-            
-            if is_api:
-                return jsonify({"ok": True, "url": public_url})
+media_pipeline = MediaPipeline(cache, upload_to_storage, record_media)
 
-            flash("Profile photo updated!", "success")
-        except Exception as e:
-            msg = f"Upload failed: {str(e)}"
-            if is_api: return jsonify({"ok": False, "error": msg}), 500
-            flash(msg, "error")
 
-    return redirect(url_for("dashboard"))
+@app.template_filter("media_variant")
+def media_variant_filter(url, name):
+    return variant_url(url, name)
 
-@app.post("/upload-media")
-@premium_required
-def upload_media():
+
+def queue_image_upload(field, kind, folder, success_msg):
+    """
+    Shared upload handler: stream the file to disk, queue resizing/upload in
+    the media pipeline and answer right away (202 + job id for API callers).
+    """
     # Check if request via API
     is_api = request.is_json or request.headers.get("Accept") == "application/json" or request.headers.get("X-Requested-With") == "XMLHttpRequest"
 
-    if "file" not in request.files:
-        msg = "No file part"
-        if is_api: return jsonify({"ok": False, "error": msg}), 400
+    def fail(msg, code=400):
+        if is_api: return jsonify({"ok": False, "error": msg}), code
         flash(msg, "error")
         return redirect(url_for("dashboard"))
-    
-    file = request.files["file"]
+
+    if field not in request.files:
+        return fail("No file part")
+
+    file = request.files[field]
     if file.filename == "":
-        msg = "No selected file"
-        if is_api: return jsonify({"ok": False, "error": msg}), 400
-        flash(msg, "error")
-        return redirect(url_for("dashboard"))
+        return fail("No selected file")
 
-    if file:
-        if not allowed_file(file.filename):
-            msg = "Invalid file type. Allowed: png, jpg, jpeg, gif, webp"
-            if is_api: return jsonify({"ok": False, "error": msg}), 400
-            flash(msg, "error")
-            return redirect(url_for("dashboard"))
+    if not allowed_file(file.filename):
+        return fail("Invalid file type. Allowed: png, jpg, jpeg, gif, webp")
 
-        # Check file size
-        file.seek(0, 2)
-        size = file.tell()
-        file.seek(0)
-        
-        if size > MAX_FILE_SIZE:
-            msg = "File too large (Max 5MB)"
-            if is_api: return jsonify({"ok": False, "error": msg}), 400
-            flash(msg, "error")
-            return redirect(url_for("dashboard"))
+    barber_id = session["barberId"]
+    filename = secure_filename(file.filename)
+    try:
+        temp_path = stream_to_temp(file.stream, MAX_FILE_SIZE, suffix=f"_{filename}")
+    except UploadTooLarge:
+        return fail("File too large (Max 5MB)")
 
-        filename = secure_filename(file.filename)
-        barber_id = session["barberId"]
-        file_path = f"portfolio/{barber_id}/{int(datetime.utcnow().timestamp())}_{filename}"
-        
-        try:
-            # Read file data
-            file_data = file.read()
-            # Upload to Supabase Storage
-            res = supabase.storage.from_("barber_media").upload(file_path, file_data, {"content-type": file.content_type})
-            
-            # Get Public URL
-            public_url = supabase.storage.from_("barber_media").get_public_url(file_path)
-            
-            # Add to Gallery Table
-            supabase.table("gallery").insert({
-                "barber_id": barber_id,
-                "url": public_url,
-                "type": "image", # We enforced image only
-                "created_at": datetime.utcnow().isoformat()
-            }).execute()
-            
-            if is_api:
-                return jsonify({"ok": True, "url": public_url})
+    job_id = media_pipeline.submit(kind, barber_id, temp_path, f"{folder}/{barber_id}")
 
-            flash("Photo added to portfolio!", "success")
-        except Exception as e:
-            msg = f"Upload failed: {str(e)}"
-            if is_api: return jsonify({"ok": False, "error": msg}), 500
-            flash(msg, "error")
+    if is_api:
+        return jsonify({
+            "ok": True,
+            "job_id": job_id,
+            "status_url": url_for("media_job_status", job_id=job_id),
+        }), 202
 
+    flash(success_msg, "success")
     return redirect(url_for("dashboard"))
 
 
+@app.post("/upload-photo")
+@premium_required
+def upload_photo():
+    return queue_image_upload("photo", "photo", "avatars", "Profile photo uploaded! It will appear in a moment.")
+
+@app.post("/upload-media")
+@premium_required
+def upload_media():
+    return queue_image_upload("file", "gallery", "portfolio", "Photo added to portfolio! It will appear in a moment.")
+
+@app.get("/api/media/jobs/<job_id>")
+@login_required
+def media_job_status(job_id):
+    job = media_pipeline.status(job_id)
+    if not job or job["barber_id"] != session["barberId"]:
+        return jsonify({"ok": False, "error": "Unknown job"}), 404
+    return jsonify({
+        "ok": job["status"] != "failed",
+        "status": job["status"],
+        "url": job.get("url"),
+        "variants": job.get("variants"),
+        "error": job.get("error"),
+    })
+
+
 
 # ============================================================
 # WEEKLY HOURS
@@ -1339,31 +1477,97 @@ def get_weekly(barber_id):
 @app.post("/api/barber/weekly-hours/<barber_id>")
 def update_weekly(barber_id):
     hours = request.json
+    if isinstance(hours, dict):
+        hours = [hours]
+    if not hours or any((row.get("weekday") or "").lower()[:3] not in db.WEEKDAYS for row in hours):
+        return jsonify({"error": "Each row needs a weekday (mon..sun)"}), 400
 
-    for row in hours:
-        supabase.table("barber_weekly_hours").upsert({
-            "barber_id": barber_id,
-            "weekday": row["weekday"].lower()[:3],
-            "start_time": row["start_time"],
-            "end_time": row["end_time"],
-            "is_closed": row["is_closed"],
-            "location_id": row.get("location_id"),
-        }).execute()
+    # Every weekday in one upsert, then one invalidation
+    db.upsert_weekly_hours(barber_id, hours)
+    availability_service.invalidate_barber(barber_id)
 
     return jsonify({"success": True})
-    return jsonify({"success": True})
 
 
 # ============================================================
 # OVERRIDES
 # ============================================================
+OVERRIDE_MAX_DAYS = 366
+
 @app.post("/api/barber/override")
 def override():
     data = request.json
-    supabase.table("schedule_overrides").upsert(data).execute()
+    rows = data if isinstance(data, list) else [data]
+    if not all(isinstance(r, dict) and r.get("barber_id") and r.get("date") for r in rows):
+        return jsonify({"error": "barber_id and date are required"}), 400
+
+    # Keyed by (barber_id, date) so saving a date again updates it in place
+    for barber_id in {r["barber_id"] for r in rows}:
+        db.upsert_overrides(barber_id, [r for r in rows if r["barber_id"] == barber_id])
+
+    for barber_id in {r["barber_id"] for r in rows}:
+        dates = [r["date"] for r in rows if r["barber_id"] == barber_id]
+        if len(dates) == 1:
+            availability_service.invalidate_day(barber_id, dates[0])
+        else:
+            availability_service.invalidate_barber(barber_id)
+
     return jsonify({"success": True})
 
 
+def override_dates(data):
+    """
+    Dates a bulk override request covers, as ISO strings:
+    {"dates": ["YYYY-MM-DD", ...]} or {"start_date": ..., "end_date": ...} (inclusive).
+    """
+    if data.get("dates"):
+        days = sorted({date.fromisoformat(d) for d in data["dates"]})
+    else:
+        start = date.fromisoformat(data.get("start_date") or "")
+        end = date.fromisoformat(data.get("end_date") or data["start_date"])
+        if end < start:
+            raise ValueError("end_date is before start_date")
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    if len(days) > OVERRIDE_MAX_DAYS:
+        raise ValueError(f"at most {OVERRIDE_MAX_DAYS} days per request")
+    return [d.isoformat() for d in days]
+
+
+@app.route("/api/barber/overrides", methods=["POST", "DELETE"])
+@login_required
+def bulk_overrides():
+    """
+    Vacations/holidays over many dates in one write.
+    POST: {"start_date", "end_date"} or {"dates": [...]}, plus "is_closed"
+    (default true) or "start_time"/"end_time" for special hours.
+    DELETE: same date selection; removes those overrides.
+    """
+    barber_id = session["barberId"]
+    data = request.get_json(silent=True) or {}
+    try:
+        dates = override_dates(data)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid dates: {e}"}), 400
+
+    if request.method == "DELETE":
+        db.delete_overrides(barber_id, dates)
+    else:
+        is_closed = bool(data.get("is_closed", True))
+        if not is_closed and not (data.get("start_time") and data.get("end_time")):
+            return jsonify({"error": "start_time and end_time are required when open"}), 400
+        db.upsert_overrides(barber_id, [{
+            "date": d,
+            "is_closed": is_closed,
+            "start_time": None if is_closed else data["start_time"],
+            "end_time": None if is_closed else data["end_time"],
+        } for d in dates])
+
+    # One generation bump covers every date
+    availability_service.invalidate_barber(barber_id)
+
+    return jsonify({"success": True, "dates": dates})
+
+
 
 
 def add_calendar_months(source_date, months):
@@ -1404,6 +1608,8 @@ def add_premium_month(barber_id):
         "plan": "premium",
         "premium_expires_at": new_expiry.isoformat()
     }).eq("id", barber_id).execute()
+    barber_settings.invalidate(barber_id)
+    search_cache.invalidate()
 
 @app.post("/create-premium-checkout")
 def create_premium_checkout():
@@ -1468,11 +1674,42 @@ def create_premium_checkout():
 
 
 
+# Stripe event type -> background job that handles it
+STRIPE_EVENT_JOBS = {
+    "checkout.session.completed": "stripe.checkout_completed",
+    "invoice.paid": "stripe.invoice_paid",
+    "customer.subscription.deleted": "stripe.subscription_deleted",
+}
+
+
+def stripe_event_payload(event):
+    """The few fields each job needs, so the queue never stores whole Stripe objects."""
+    obj = event["data"]["object"]
+    payload = {"event_id": event.get("id"), "customer_id": obj.get("customer")}
+    if event["type"] == "checkout.session.completed":
+        metadata = obj.get("metadata") or {}
+        payload.update(
+            session_id=obj.get("id"),
+            customer_email=(obj.get("customer_details") or {}).get("email"),
+            barber_id=metadata.get("barber_id"),
+            promo_code=metadata.get("promo_code"),
+        )
+    elif event["type"] == "invoice.paid":
+        payload.update(
+            invoice_id=obj.get("id"),
+            customer_email=obj.get("customer_email"),
+            billing_reason=obj.get("billing_reason"),
+        )
+    return payload
+
+
 @app.post("/stripe/webhook")
 def stripe_webhook():
     """
-    Crash-proof, idempotent Stripe webhook handler.
-    Always returns 200 OK after signature verification to prevent retries.
+    Verifies the Stripe signature, records the event id in the
+    processed_events ledger (one insert-if-absent) and queues its handler.
+    Replays of a recorded event are acknowledged without further work.
+    Returns 500 only if the event could not be recorded or queued, so Stripe retries.
     """
     payload = request.data
     sig = request.headers.get("Stripe-Signature")
@@ -1485,71 +1722,82 @@ def stripe_webhook():
         print(f"⚠️ Webhook signature verification failed: {e}")
         return "Invalid signature", 400
 
-    # 2. Only process checkout.session.completed events
-    if event["type"] != "checkout.session.completed":
+    # 2. Only process the event types we have jobs for
+    job_name = STRIPE_EVENT_JOBS.get(event["type"])
+    if not job_name:
         print(f"ℹ️ Ignoring event type: {event['type']}")
         return "OK", 200
 
-    # 3. Extract event data
-    session_obj = event["data"]["object"]
+    # 3. Dedupe on the event id (durable, unlike the queue's key window)
     event_id = event.get("id", "unknown")
-    session_id = session_obj.get("id")
-    metadata = session_obj.get("metadata", {})
-    customer_email = session_obj.get("customer_details", {}).get("email")
-    customer_id = session_obj.get("customer")
-    
-    print(f"🎯 Processing webhook - Event: {event_id}, Session: {session_id}, Email: {customer_email}")
-
-    # 4. Determine target barber ID
-    target_barber_id = metadata.get("barber_id")
-    source = metadata.get("source", "unknown")
-    
-    if not target_barber_id and customer_email:
-        # Fallback: lookup by email
-        try:
-            result = supabase.table("barbers").select("id").eq("email", customer_email).execute()
-            if result.data:
-                target_barber_id = result.data[0]["id"]
-                print(f"📧 Found barber by email: {target_barber_id}")
-        except Exception as e:
-            print(f"❌ Error looking up barber by email: {e}")
-    
-    if not target_barber_id:
-        print(f"⚠️ No barber found for session {session_id}. Email: {customer_email}. Skipping.")
-        return "OK", 200  # Return 200 to prevent retries
-
-    # 5. Check for duplicate processing (idempotency)
     try:
-        barber_result = supabase.table("barbers").select("last_stripe_session_id, plan").eq("id", target_barber_id).execute()
-        
-        if not barber_result.data:
-            print(f"⚠️ Barber {target_barber_id} not found in database. Skipping.")
-            return "OK", 200
-        
-        barber = barber_result.data[0]
-        
-        if barber.get("last_stripe_session_id") == session_id:
-            print(f"✅ Session {session_id} already processed for barber {target_barber_id}. Skipping (idempotent).")
+        if not db.claim_event(event_id, event["type"]):
+            print(f"✅ Event {event_id} already processed. Skipping (idempotent).")
             return "OK", 200
-            
     except Exception as e:
-        print(f"❌ Error checking duplicate: {e}")
-        return "OK", 200  # Return 200 to prevent retries
+        print(f"❌ Could not record webhook event {event_id}: {e}")
+        return "Ledger unavailable", 500
 
-    # 6. Update barber to premium (crash-safe)
+    # 4. Queue the handler
     try:
-        supabase.table("barbers").update({
-            "plan": "premium",
-            "last_stripe_session_id": session_id,
-        }).eq("id", target_barber_id).execute()
-        
-        print(f"✅ Updated barber {target_barber_id} to premium")
-        
+        job_id = jobs.enqueue(job_name, stripe_event_payload(event), key=f"stripe:{event_id}")
     except Exception as e:
-        print(f"❌ Error updating barber plan: {e}")
-        return "OK", 200  # Return 200 to prevent retries
+        print(f"❌ Could not queue webhook event {event_id}: {e}")
+        try:
+            db.release_event(event_id)
+        except Exception as release_error:
+            print(f"❌ Could not release webhook event {event_id}: {release_error}")
+        return "Queue unavailable", 500
+
+    print(f"🎯 Queued webhook - Event: {event_id} ({event['type']}), Job: {job_id or 'duplicate'}")
+    return "OK", 200
+
 
-    # 7. Add premium month (crash-safe)
+def stripe_job_dead(payload, error):
+    """A Stripe event's job gave up: forget the event so a resend from Stripe runs it again."""
+    event_id = payload.get("event_id")
+    print(f"🚨 ALERT: Stripe event {event_id} was not applied ({error}). Resend it from the Stripe dashboard.")
+    try:
+        db.release_event(event_id)
+    except Exception as e:
+        print(f"❌ Could not release webhook event {event_id}: {e}")
+
+
+@jobs.task("stripe.checkout_completed", on_dead=stripe_job_dead)
+def fulfil_checkout(payload):
+    """
+    Upgrade the barber behind a completed checkout and credit their referrer.
+    Lookup and plan-update failures raise so the job retries; the rest is
+    best-effort, as before.
+    """
+    session_id = payload.get("session_id")
+    customer_email = payload.get("customer_email")
+
+    print(f"🎯 Processing webhook - Event: {payload.get('event_id')}, Session: {session_id}, Email: {customer_email}")
+
+    # 1. Determine target barber ID
+    target_barber_id = payload.get("barber_id")
+    if not target_barber_id and customer_email:
+        # Fallback: lookup by email
+        result = supabase.table("barbers").select("id").eq("email", customer_email).execute()
+        if result.data:
+            target_barber_id = result.data[0]["id"]
+            print(f"📧 Found barber by email: {target_barber_id}")
+
+    if not target_barber_id:
+        print(f"⚠️ No barber found for session {session_id}. Email: {customer_email}. Skipping.")
+        return
+
+    # 2. Update barber to premium (replays never get here: see processed_events)
+    updates = {"plan": "premium", "last_stripe_session_id": session_id}
+    if payload.get("customer_id"):
+        updates["stripe_customer_id"] = payload["customer_id"]
+    supabase.table("barbers").update(updates).eq("id", target_barber_id).execute()
+    barber_settings.invalidate(target_barber_id)
+    search_cache.invalidate()
+    print(f"✅ Updated barber {target_barber_id} to premium")
+
+    # 3. Add premium month
     try:
         add_premium_month(target_barber_id)
         print(f"✅ Added premium month for barber {target_barber_id}")
@@ -1557,15 +1805,15 @@ def stripe_webhook():
         print(f"❌ Error adding premium month: {e}")
         # Continue anyway - plan is already set
 
-    # 8. Ensure default hours (crash-safe)
+    # 4. Ensure default hours
     try:
         ensure_default_weekly_hours(target_barber_id)
     except Exception as e:
         print(f"❌ Error ensuring default hours: {e}")
 
-    # 9. Credit referrer if applicable (crash-safe)
+    # 5. Credit referrer if applicable
     try:
-        used_code = metadata.get("promo_code")
+        used_code = payload.get("promo_code")
         if used_code and used_code not in ["TEST", "LIVE25"]:
             referrer_result = supabase.table("barbers").select("id").eq("promo_code", used_code).execute()
             if referrer_result.data:
@@ -1576,7 +1824,50 @@ def stripe_webhook():
         print(f"❌ Error crediting referrer: {e}")
 
     print(f"🎉 Webhook processed successfully for barber {target_barber_id}")
-    return "OK", 200
+
+
+@jobs.task("stripe.invoice_paid", on_dead=stripe_job_dead)
+def extend_premium_for_invoice(payload):
+    """Renewal: each paid subscription cycle adds a premium month."""
+    # The first invoice is paid by the checkout, which already granted its month
+    if payload.get("billing_reason") == "subscription_create":
+        return
+
+    barber_id = db.barber_id_for_stripe_customer(payload.get("customer_id"), payload.get("customer_email"))
+    if not barber_id:
+        print(f"⚠️ No barber found for invoice {payload.get('invoice_id')}. Skipping.")
+        return
+
+    add_premium_month(barber_id)
+    print(f"✅ Renewed premium month for barber {barber_id} (invoice {payload.get('invoice_id')})")
+
+
+@jobs.task("stripe.subscription_deleted", on_dead=stripe_job_dead)
+def end_subscription(payload):
+    """
+    Subscription ended: premium already paid (or earned by referral) runs
+    until premium_expires_at; downgrade now only if that has passed.
+    """
+    customer_id = payload.get("customer_id")
+    barber_id = db.barber_id_for_stripe_customer(customer_id)
+    if not barber_id and customer_id:
+        customer = stripe.Customer.retrieve(customer_id)
+        barber_id = db.barber_id_for_stripe_customer(customer_id, customer.get("email"))
+    if not barber_id:
+        print(f"⚠️ No barber found for Stripe customer {customer_id}. Skipping.")
+        return
+
+    now = datetime.utcnow().isoformat()
+    result = supabase.table("barbers").update({"plan": "free"})\
+        .eq("id", barber_id)\
+        .or_(f'premium_expires_at.is.null,premium_expires_at.lt."{now}"')\
+        .execute()
+    barber_settings.invalidate(barber_id)
+    search_cache.invalidate()
+    if result.data:
+        print(f"⬇️ Subscription ended; barber {barber_id} downgraded to free")
+    else:
+        print(f"ℹ️ Subscription ended; barber {barber_id} keeps premium until it expires")
 
 
 
@@ -1606,8 +1897,6 @@ def book_view(barber_id):
 
     barber = barber_res.data[0]
 
-    ensure_default_weekly_hours(barber["id"])
-
     weekly = (
         supabase.table("barber_weekly_hours")
         .select("*")
@@ -1625,20 +1914,12 @@ def book_view(barber_id):
         for row in weekly
     }
 
-    appts = (
-        supabase.table("appointments")
-        .select("*")
-        .eq("barber_id", barber_id)
-        .execute()
-        .data
-    ) or []
-
+    # No appointment data in public HTML: booking.js asks the slots API,
+    # which already leaves booked times out
     return render_template(
         "book.html",
         barber=barber,
         hours=hours,
-        barber_future_appts=appts,
-        appointments=appts,
     )
 
 
@@ -1664,7 +1945,27 @@ def get_barber_appointments():
     # Optional date range filters
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    
+
+    # Paged mode: ?limit=N[&cursor=...] -> {"appointments": [...], "next_cursor": ...}
+    # ordered by (date, start_time). Without limit/cursor the plain list below is kept.
+    if "limit" in request.args or "cursor" in request.args:
+        try:
+            limit = int(request.args.get("limit", APPOINTMENTS_PAGE_SIZE))
+            limit = max(1, min(limit, APPOINTMENTS_PAGE_MAX))
+            rows, next_cursor = db.list_barber_appointments_page(
+                barber_id,
+                start_date=start_date or datetime.utcnow().strftime("%Y-%m-%d"),
+                end_date=end_date,
+                cursor=request.args.get("cursor"),
+                limit=limit,
+                include_cancelled=request.args.get("include_cancelled") == "1",
+            )
+        except ValueError:
+            return jsonify({"error": "Invalid limit or cursor", "ok": False}), 400
+        except Exception as e:
+            return jsonify({"error": str(e), "ok": False}), 500
+        return jsonify({"appointments": rows, "next_cursor": next_cursor})
+
     query = supabase.table("appointments").select("*").eq("barber_id", barber_id).neq("status", "cancelled")
     
     if start_date:
@@ -1700,16 +2001,67 @@ def public_slots(barber_id):
     if not target_date:
         return jsonify([])
     
-    # Defaults to 60 mins if not specified, or fetch from barber
-    # For now, let's fetch barber slot_duration to be safe
-    barber_res = supabase.table("barbers").select("slot_duration").eq("id", barber_id).execute()
-    duration = 60
-    if barber_res.data:
-        duration = barber_res.data[0].get("slot_duration", 60)
+    # Barber's slot_duration (cached; defaults to 60)
+    duration = barber_settings.slot_duration(barber_id)
 
     result = availability_service.get_availability(barber_id, target_date, duration)
     return jsonify(result["slots"])
 
+@app.get("/api/public/slots/<barber_id>/range")
+def public_slots_range(barber_id):
+    """
+    Multi-day availability: ?start=YYYY-MM-DD&end=YYYY-MM-DD
+    Returns {"YYYY-MM-DD": ["HH:MM", ...], ...} for every day in the range.
+    """
+    start_date = request.args.get("start")
+    end_date = request.args.get("end") or start_date
+    if not start_date:
+        return jsonify({"error": "Missing params"}), 400
+
+    duration = barber_settings.slot_duration(barber_id)
+
+    try:
+        result = availability_service.get_availability_range(barber_id, start_date, end_date, duration)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(result["days"])
+
+@app.get("/api/public/barbers/near")
+def barbers_near():
+    """
+    Distance-sorted barbers: ?lat=&lon=[&radius_km=][&limit=]
+    With radius_km, everyone within that radius; without it, the `limit`
+    nearest (searching up to GEO_MAX_RADIUS_KM).
+    """
+    coords = parse_latlon(request.args.get("lat"), request.args.get("lon"))
+    if not coords:
+        return jsonify({"error": "Valid lat and lon are required"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+        radius_km = request.args.get("radius_km")
+        radius_km = float(radius_km) if radius_km else None
+    except ValueError:
+        return jsonify({"error": "Invalid limit or radius_km"}), 400
+
+    if radius_km is not None:
+        points = geo_index.nearby(*coords, radius_km=radius_km, limit=limit)
+    else:
+        points = geo_index.nearest(*coords, k=limit)
+
+    # The index only knows where barbers are; names and photos are read
+    # fresh so profile edits never have to touch it
+    cards = db.get_barber_cards({p["barber_id"] for p in points})
+    return jsonify({"barbers": [{
+        "barberId": p["barber_id"],
+        "name": cards[p["barber_id"]].get("name"),
+        "profession": cards[p["barber_id"]].get("profession"),
+        "location": p.get("address") or "",
+        "location_name": p.get("location_name"),
+        "media_url": cards[p["barber_id"]].get("photo_url"),
+        "distance_km": p["distance_km"],
+    } for p in points if p["barber_id"] in cards]})
+
 @app.get("/api/availability")
 def get_availability_v2():
     """New standard endpoint"""
@@ -1727,9 +2079,7 @@ def get_availability_v2():
         pass
     else:
         # Fallback to barber default
-        barber_res = supabase.table("barbers").select("slot_duration").eq("id", barber_id).execute()
-        if barber_res.data:
-            duration = barber_res.data[0].get("slot_duration", 60)
+        duration = barber_settings.slot_duration(barber_id)
 
     result = availability_service.get_availability(barber_id, date_str, duration)
     # Return just the list of slots as requested
@@ -1766,99 +2116,53 @@ def create_appt():
         return jsonify({"error": "Invalid time format. Use HH:MM."}), 400
 
     # 2. Calculate Durations & End Time
-    barber_res = supabase.table("barbers").select("slot_duration").eq("id", barber_id).execute()
-    duration = 60
-    if barber_res.data:
-        duration = barber_res.data[0].get("slot_duration", 60)
-        
+    duration = barber_settings.slot_duration(barber_id)
+
     start_dt = datetime.strptime(start_norm, "%H:%M")
     end_dt = start_dt + timedelta(minutes=duration)
     end_norm = end_dt.strftime("%H:%M")
 
-    # Helper to convert to minutes for overlap check
-    def to_mins(t_str):
-        h, m = map(int, t_str.split(':')[:2])
-        return h * 60 + m
-
-    new_start_m = to_mins(start_norm)
-    new_end_m = to_mins(end_norm)
-
-    # 3. True Overlap Check
-    # Fetch existing appointments for this barber & date
-    # Only fetch active ones (not cancelled)
-    existing_appts = supabase.table("appointments").select("start_time, end_time")\
-        .eq("barber_id", barber_id)\
-        .eq("date", d_str)\
-        .neq("status", "cancelled")\
-        .execute().data
+    # 3. Atomic check-and-insert (book_appointment RPC, booking_rpc.sql).
+    # Postgres runs the overlap check and the insert under one per-barber/day
+    # lock, so concurrent requests for the same slot can't both succeed.
+    insert_payload = {
+        "barber_id": barber_id,
+        "date": d_str,
+        "start_time": start_norm,
+        "end_time": end_norm,
+        "client_name": data.get("client_name"),
+        "client_phone": data.get("client_phone"),
+        "status": "booked"
+    }
 
-    for appt in existing_appts:
-        # Robustly handle existing times
-        try:
-            e_start_m = to_mins(appt["start_time"])
-            if appt.get("end_time"):
-                e_end_m = to_mins(appt["end_time"])
-            else:
-                # Fallback if legacy data has no end_time
-                e_end_m = e_start_m + duration
-            
-            # Allow touching but not overlapping? 
-            # Usually: start < existing_end AND end > existing_start
-            if new_start_m < e_end_m and new_end_m > e_start_m:
-                 return jsonify({
-                     "error": "Slot unavailable due to overlap",
-                     "conflict": {"start": appt["start_time"], "end": appt.get("end_time")}
-                 }), 409
-        except Exception:
-            # If data is corrupt, skip or log? For safety, treat as potential blocker?
-            # Let's log and continue to avoid blocking valid slots due to bad legacy data, 
-            # but in strict mode we might want to block. 
-            pass
-
-    # 4. Insert with Success Confirmation
-    # 4. Insert with Success Confirmation
-    # 4. Insert with Success Confirmation (STRICT FIX)
     try:
-        # Use full dict for insert to ensure all fields are present
-        insert_payload = {
-            "barber_id": barber_id,
-            "date": d_str,
-            "start_time": start_norm,
-            "end_time": end_norm,
-            "client_name": data.get("client_name"),
-            "client_phone": data.get("client_phone"),
-            "status": "booked"
-        }
-
-        res = supabase.table("appointments").insert(insert_payload).execute()
-        
-        # FIX: Check for error object/property explicitly if available OR rely on the fact that
-        # supabase-py raises exception on error. 
-        # For safety per user request: "If res.error exists..."
-        # Note: In standard postgrest-py, it raises exception. 
-        # But if the user says check res.error, we check it safely.
-        if hasattr(res, 'error') and res.error:
-            return jsonify({"error": str(res.error)}), 500
-
-        # OPTIONAL: Verify existence to be extra safe (Success Criteria)
-        # But fundamentally, if we got here, it worked.
-        
-        # 5. Invalidate Cache
-        try:
-            availability_service.invalidate_day(barber_id, d_str)
-        except Exception as e:
-            print(f"Cache invalidation error: {e}")
+        result = db.book_appointment(insert_payload)
+    except Exception as e:
+        print(f"Booking invalid: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        # Return Success
+    if result.get("status") == "conflict":
         return jsonify({
-            "success": True, 
-            "message": "Appointment booked",
-            "data": res.data # Optional debug
-        }), 200
+            "error": "Slot unavailable due to overlap",
+            "conflict": result.get("conflict")
+        }), 409
+
+    appt = result.get("appointment")
+    if not appt:
+        return jsonify({"error": "Booking was not confirmed"}), 500
 
+    # 4. Update availability (bitmap store clears the booked units in place)
+    try:
+        availability_service.record_booking(barber_id, d_str, start_norm, end_norm)
     except Exception as e:
-        print(f"Booking invalid: {e}")
-        return jsonify({"error": str(e)}), 500
+        print(f"Cache invalidation error: {e}")
+
+    return jsonify({
+        "success": True,
+        "message": "Appointment booked",
+        "id": appt.get("id"),
+        "data": appt
+    }), 201
 
 
 
@@ -1939,6 +2243,7 @@ def client_cancel():
 
     supabase.table("appointments").update({"status": "cancelled"})\
         .eq("id", appt_id).execute()
+    availability_service.invalidate_day(appt["barber_id"], appt["date"])
 
     return jsonify({"success": True})
 
@@ -1959,12 +2264,23 @@ def loc_add():
     barber_id = session["barberId"]
     name = request.form.get("name")
     address = request.form.get("address")
+    coords = parse_latlon(request.form.get("lat"), request.form.get("lon"))
 
-    supabase.table("barber_locations").insert({
+    row = {
         "barber_id": barber_id,
         "name": name,
         "address": address
-    }).execute()
+    }
+    if coords:
+        row["lat"], row["lon"] = coords
+    res = supabase.table("barber_locations").insert(row).execute()
+
+    if res.data:
+        search_cache.invalidate()
+        if coords:
+            geo_index.upsert(db.geo_point({"id": barber_id}, res.data[0]))
+        elif address:
+            geocode_later("barber_locations", res.data[0]["id"], address)
 
     flash("Location added")
     return redirect(url_for("loc_page"))
@@ -1977,6 +2293,8 @@ def loc_delete():
 
     supabase.table("barber_locations").delete()\
         .eq("id", loc_id).eq("barber_id", barber_id).execute()
+    geo_index.remove(f"l:{loc_id}")
+    search_cache.invalidate()
 
     flash("Location removed")
     flash("Location removed")
@@ -2002,20 +2320,19 @@ def cancel_appointment():
         
     appt = existing[0]
 
-    # Free up the slot in availability cache
-    try:
-        # We can either update the schedule table or just invalidate cache.
-        # Since we use cache, invalidation is key.
-        availability_service.invalidate_day(barber_id, appt["date"])
-    except Exception as e:
-        print(f"Cache invalidation error: {e}")
-
     # Mark as cancelled
     res = supabase.table("appointments").update({"status": "cancelled"}).eq("id", appt_id).execute()
     
     if hasattr(res, 'error') and res.error:
         return jsonify({"success": False, "error": str(res.error)}), 500
 
+    # Free up the slot in availability cache (after the write, so a concurrent
+    # read can't re-cache the old state under the new generation)
+    try:
+        availability_service.invalidate_day(barber_id, appt["date"])
+    except Exception as e:
+        print(f"Cache invalidation error: {e}")
+
     return jsonify({"success": True})
 
 # ============================================================
@@ -2049,6 +2366,8 @@ def premium_success():
             "plan": "premium",
             "premium_expires_at": now_plus_30
         }).eq("id", barber_id).execute()
+        barber_settings.invalidate(barber_id)
+        search_cache.invalidate()
         
         # Also ensure session state is updated if we cache it (we don't seems to)
         
@@ -2062,10 +2381,7 @@ def premium_success():
 @login_required
 def cancel_page():
     barber_id = session["barberId"]
-    barber = supabase.table("barbers").select("plan").eq("id", barber_id).execute().data[0]
-    
-    # Normalize plan
-    plan = (barber.get("plan") or "free").lower()
+    plan = barber_settings.effective_plan(barber_id)
     
     return render_template("cancel.html", plan=plan)
 
@@ -2187,9 +2503,16 @@ def find_pro():
         data = request.json or {}
         city = (data.get("city") or "").strip()
         service = (data.get("service") or "").strip()
+        page = data.get("page")
+        sort = data.get("sort")
+        available_today = bool(data.get("available_today"))
     else:
         city = (request.form.get("city") or "").strip()
         service = (request.form.get("service") or "").strip()
+        page = request.form.get("page")
+        sort = request.form.get("sort")
+        available_today = request.form.get("available") == "today"
+    sort = "earliest" if sort == "earliest" else "relevance"
 
     # basic guard: if empty, re-show form with flash or simple message
     if not city:
@@ -2198,36 +2521,14 @@ def find_pro():
         flash("Please enter a city or location.", "error")
         return render_template("find_pro.html")
 
-    # Build Supabase query
-    query = supabase.table("barbers").select("*")
-
-    # match city/location inside address/location fields (case-insensitive)
-    # adjust column names if yours are different
-    query = query.ilike("address", f"%{city}%")
-
-    if service:
-        # match against profession (e.g. "Barber", "Nail Tech", etc.)
-        query = query.ilike("profession", f"%{service}%")
-
-    res = query.execute()
-    rows = res.data or []
-
-    def plan_rank(barber):
-        return 1 if barber.get("plan") == "premium" else 0
-
-    rows.sort(key=plan_rank, reverse=True)
+    try:
+        page = max(1, int(page or 1))
+    except (TypeError, ValueError):
+        page = 1
 
-    # Shape data for results.html (what that template expects)
-    barbers = []
-    for b in rows:
-        barbers.append({
-            "barberId": b["id"],
-            "name": b.get("name"),
-            "profession": b.get("profession"),
-            # results.html uses b.location → map from address (or your city field)
-            "location": b.get("address") or b.get("location") or "",
-            "media_url": b.get("photo_url") or b.get("media_url"),
-        })
+    # Indexed, ranked, paged search in Postgres (premium first), served from
+    # the search cache for repeat (city, service, page) combinations
+    barbers, has_more = search_cache.get_page(city, service, page, sort=sort, available_today=available_today)
 
     if request.is_json or request.headers.get("Accept") == "application/json":
         return jsonify(barbers)
@@ -2237,12 +2538,21 @@ def find_pro():
         barbers=barbers,
         city=city,
         service=service,
+        page=page,
+        has_more=has_more,
+        sort=sort,
+        available_today=available_today,
+        today=datetime.utcnow().date().isoformat(),
     )
 
 @app.route("/confirmed")
 def confirmed():
     return render_template("confirmed.html")
 
+# Start workers only now that every @jobs.task handler above is registered
+if JOB_WORKER_INPROCESS:
+    jobs.start_workers(JOB_WORKER_THREADS)
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port)
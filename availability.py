@@ -1,40 +1,266 @@
+import os
+import time
 import logging
 import datetime
 from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
 from flask_caching import Cache
 import db
+import db_async
+import slot_mask
+import availability_bitmap
+from singleflight import SingleFlight
+import generation as gens
+from intervals import to_minutes, format_minutes, busy_intervals, merge_intervals, free_starts
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# Upper bound for range queries (a month view plus some slack)
+MAX_RANGE_DAYS = 62
+
+# Availability cache TTLs (seconds). Entries are invalidated exactly on
+# schedule changes, so the long TTL only bounds memory.
+CACHE_TTL = int(os.getenv("AVAILABILITY_CACHE_TTL", 6 * 60 * 60))
+TODAY_CACHE_TTL = 60
+
+# Stale-while-revalidate: after SOFT_TTL seconds an entry is served stale and
+# refreshed in the background. 0 disables (entries stay fresh until hard TTL).
+SOFT_TTL = int(os.getenv("AVAILABILITY_SOFT_TTL", 0))
+REFRESH_LEASE_TTL = 30
+
 class AvailabilityService:
-    def __init__(self, cache: Cache):
+    def __init__(self, cache: Cache, backend=None, soft_ttl=None, fetch_mode=None, engine=None, store=None):
         self.cache = cache
+        self.store = self._resolve_store(store or os.getenv("AVAILABILITY_STORE", "slots"))
+        self.engine = self._resolve_engine(engine or os.getenv("AVAILABILITY_ENGINE", "python"))
+        self.fetch_mode = (fetch_mode or os.getenv("AVAILABILITY_FETCH", "sequential")).lower().strip()
+        self.soft_ttl = SOFT_TTL if soft_ttl is None else soft_ttl
+        self.backend = self._resolve_backend(backend or os.getenv("AVAILABILITY_BACKEND", "python"))
+        self.single_flight = SingleFlight(cache)
+        self._refresher = None
+        self._swr_stats = {"stale_served": 0, "refreshes": 0, "refresh_errors": 0}
+        self._listeners = []
+
+    def _resolve_backend(self, backend):
+        """'python' (sorted sweep) or 'numpy' (vectorized slot mask)."""
+        backend = (backend or "python").lower().strip()
+        if backend == "numpy":
+            if slot_mask.HAS_NUMPY:
+                return "numpy"
+            logger.warning("AVAILABILITY_BACKEND=numpy but NumPy is not installed; using python")
+        return "python"
+
+    def _resolve_engine(self, engine):
+        """
+        'python' (fetch rows, compute here) or 'sql' (get_open_slots RPC,
+        see availability_rpc.sql). Both return identical slots.
+        """
+        engine = (engine or "python").lower().strip()
+        if engine not in ("python", "sql"):
+            logger.warning(f"Unknown AVAILABILITY_ENGINE={engine!r}; using python")
+            return "python"
+        return engine
+
+    def _resolve_store(self, store):
+        """
+        'slots' (cache computed slot lists per duration) or 'bitmap' (cache one
+        free-unit bitmap per day and answer every duration from it).
+        """
+        store = (store or "slots").lower().strip()
+        if store not in ("slots", "bitmap"):
+            logger.warning(f"Unknown AVAILABILITY_STORE={store!r}; using slots")
+            return "slots"
+        return store
+
+    def _free_starts(self, candidates, duration, merged_busy):
+        if self.backend == "numpy":
+            return slot_mask.free_starts_vectorized(candidates, duration, merged_busy)
+        return free_starts(candidates, duration, merged_busy)
 
     def get_availability(self, barber_id, date_str, service_duration=60):
         """
         Main entry point. 
         Returns list of available start times (HH:MM).
         """
-        cache_key = self._get_cache_key(barber_id, date_str, service_duration)
-        cached_result = self.cache.get(cache_key)
-        
+        generation = self._get_generation(barber_id)
+
+        if self.store == "bitmap":
+            record, cached = self._load_bitmap(barber_id, date_str, generation)
+            slots = self._slots_from_bitmap(date_str, record, service_duration)
+            if slots is not None:
+                return {"slots": slots, "cached": cached}
+            # Off-grid hours or duration: minute-exact path below
+
+        list_gen = self._list_generation(barber_id, generation)
+        cache_key = self._get_cache_key(barber_id, date_str, service_duration, list_gen)
+
+        def compute():
+            if self.engine == "sql":
+                slots = db.get_open_slots_range(barber_id, date_str, date_str, service_duration).get(date_str, [])
+                self._store(cache_key, date_str, slots)
+                return slots
+
+            # 1. Fetch raw data
+            hours_raw, overrides_raw, appointments_raw = self._fetch_day(barber_id, date_str)
+
+            # 2. Calculate
+            slots = self._calculate_slots(date_str, hours_raw, overrides_raw, appointments_raw, service_duration)
+
+            # 3. Cache (exact invalidation via generation, so TTL can be long)
+            self._store(cache_key, date_str, slots)
+            return slots
+
+        cached_result, stale = self._read(cache_key)
         if cached_result is not None:
-             return {"slots": cached_result, "cached": True}
+            if stale:
+                # Serve stale now, recompute off the request path
+                self._schedule_refresh(cache_key, compute)
+            return {"slots": cached_result, "cached": True}
+
+        # Concurrent misses on the same key share one computation
+        slots, computed = self.single_flight.do(cache_key, compute, lambda: self._read(cache_key)[0])
+
+        return {"slots": slots, "cached": not computed}
+
+    def _fetch_day(self, barber_id, date_str):
+        """(hours_raw, overrides_raw, appointments_raw) for one day."""
+        if self.fetch_mode == "concurrent":
+            # Three reads in parallel on the async client (see db_async)
+            return db_async.fetch_day_inputs_sync(barber_id, date_str)
+        return (
+            db.get_weekly_hours_raw(barber_id),
+            db.get_date_override_raw(barber_id, date_str),
+            db.get_appointments_raw(barber_id, date_str),
+        )
+
+    def stats(self):
+        """Coalescing and stale-while-revalidate counters."""
+        return {
+            "single_flight": self.single_flight.stats(),
+            "swr": dict(self._swr_stats),
+        }
+
+    # --- Cache entries ---
+    # Entries are {"slots": [...], "fresh_until": epoch | None}. The cache
+    # timeout is the hard TTL; fresh_until is the soft TTL used by
+    # stale-while-revalidate (AVAILABILITY_SOFT_TTL > 0).
+
+    def _store(self, cache_key, date_str, slots):
+        hard_ttl = self._ttl_for(date_str)
+        fresh_until = None
+        if self.soft_ttl > 0:
+            fresh_until = time.time() + min(self.soft_ttl, hard_ttl)
+        self.cache.set(cache_key, {"slots": slots, "fresh_until": fresh_until}, timeout=hard_ttl)
+
+    def _read(self, cache_key):
+        """Returns (slots or None, is_stale)."""
+        entry = self.cache.get(cache_key)
+        if entry is None:
+            return None, False
+        if not isinstance(entry, dict):
+            # Plain list written before entries carried a soft TTL
+            return entry, False
+        fresh_until = entry.get("fresh_until")
+        return entry.get("slots"), fresh_until is not None and time.time() >= fresh_until
+
+    def _schedule_refresh(self, cache_key, compute):
+        self._swr_stats["stale_served"] += 1
+        # One refresh per key across workers (atomic add / SET NX)
+        if not self.cache.add(f"refresh:{cache_key}", 1, timeout=REFRESH_LEASE_TTL):
+            return
+        if self._refresher is None:
+            self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="availability-refresh")
+        self._refresher.submit(self._run_refresh, cache_key, compute)
+
+    def _run_refresh(self, cache_key, compute):
+        try:
+            compute()
+            self._swr_stats["refreshes"] += 1
+        except Exception as e:
+            self._swr_stats["refresh_errors"] += 1
+            logger.warning(f"Background availability refresh failed for {cache_key}: {e}")
+        finally:
+            self.cache.delete(f"refresh:{cache_key}")
+
+    def get_availability_range(self, barber_id, start_date, end_date, service_duration=60):
+        """
+        Range entry point (e.g. a month view).
+        Fetches weekly hours once and overrides/appointments with one range
+        query each, then computes every day in memory.
+        Returns {"days": {"YYYY-MM-DD": ["HH:MM", ...]}}.
+        """
+        start = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
+        if end < start:
+            raise ValueError("end date must not be before start date")
+        if (end - start).days + 1 > MAX_RANGE_DAYS:
+            raise ValueError(f"range cannot exceed {MAX_RANGE_DAYS} days")
+
+        dates = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+        # Serve what we can from the per-day cache
+        generation = self._get_generation(barber_id)
+        list_gen = self._list_generation(barber_id, generation)
+        days = {}
+        missing = []
+        all_cached = True
+        if self.store == "bitmap":
+            records, all_cached = self._load_bitmaps(barber_id, dates, generation)
+            for d in dates:
+                slots = self._slots_from_bitmap(d, records[d], service_duration)
+                if slots is not None:
+                    days[d] = slots
+                else:
+                    missing.append(d)
+        else:
+            for d in dates:
+                cached, stale = self._read(self._get_cache_key(barber_id, d, service_duration, list_gen))
+                if cached is not None and not stale:
+                    days[d] = cached
+                else:
+                    missing.append(d)
+
+        if not missing:
+            return {"days": days, "cached": all_cached}
+
+        if self.engine == "sql":
+            # One RPC for the whole range; closed/full days come back absent
+            open_days = db.get_open_slots_range(barber_id, missing[0], missing[-1], service_duration)
+            for d in missing:
+                days[d] = open_days.get(d, [])
+                self._store(self._get_cache_key(barber_id, d, service_duration, list_gen), d, days[d])
+            return {"days": {d: days[d] for d in dates}, "cached": False}
+
+        # 1. Fetch raw data (3 round trips for the whole range)
+        hours_raw, overrides_by_date, appts_by_date = self._fetch_range(barber_id, missing[0], missing[-1])
+
+        # 2. Calculate each day in memory and fill the per-day cache
+        for d in missing:
+            slots = self._calculate_slots(
+                d, hours_raw, overrides_by_date.get(d, []), appts_by_date.get(d, []), service_duration
+            )
+            self._store(self._get_cache_key(barber_id, d, service_duration, list_gen), d, slots)
+            days[d] = slots
 
-        # 1. Fetch raw data
+        return {"days": {d: days[d] for d in dates}, "cached": False}
+
+    def _fetch_range(self, barber_id, start_date, end_date):
+        """(hours_raw, overrides_by_date, appts_by_date) for an inclusive range."""
         hours_raw = db.get_weekly_hours_raw(barber_id)
-        overrides_raw = db.get_date_override_raw(barber_id, date_str)
-        appointments_raw = db.get_appointments_raw(barber_id, date_str)
+        overrides_raw = db.get_date_overrides_range_raw(barber_id, start_date, end_date)
+        appointments_raw = db.get_appointments_range_raw(barber_id, start_date, end_date)
 
-        # 2. Calculate
-        slots = self._calculate_slots(date_str, hours_raw, overrides_raw, appointments_raw, service_duration)
+        overrides_by_date = {}
+        for ov in overrides_raw or []:
+            overrides_by_date.setdefault(str(ov.get("date"))[:10], []).append(ov)
 
-        # 3. Cache (TTL 60s default)
-        self.cache.set(cache_key, slots, timeout=60)
-        
-        return {"slots": slots, "cached": False}
+        appts_by_date = {}
+        for appt in appointments_raw or []:
+            appts_by_date.setdefault(str(appt.get("date"))[:10], []).append(appt)
+
+        return hours_raw, overrides_by_date, appts_by_date
 
     def _calculate_slots(self, date_str, hours_raw, overrides_raw, appointments_raw, duration_minutes):
         """
@@ -43,10 +269,41 @@ class AvailabilityService:
         - Generate all possible slots
         - Subtract booked slots using OVERLAP logic
         """
+        # --- A. Determine Open/Close times ---
+        opening = self._opening_hours(date_str, hours_raw, overrides_raw)
+        if opening is None:
+            return []
+
+        # --- B. Generate Candidate Slots ---
+        open_mins, close_mins = opening
+
+        # Generator loop
+        candidate_slots = []
+        current_mins = open_mins
+        step = int(duration_minutes) # ensure int
+
+        # Strict: Slot must finish by closing time
+        while current_mins + step <= close_mins:
+            candidate_slots.append(current_mins)
+            current_mins += step
+
+        if not candidate_slots:
+            return []
+
+        candidate_slots = self._drop_past(date_str, candidate_slots)
+        if not candidate_slots:
+            return []
+
+        # --- C. Remove Overlaps ---
+        # Merge busy intervals once, then sweep candidates with a single pointer
+        busy = merge_intervals(busy_intervals(appointments_raw, step))
+        return [format_minutes(s) for s in self._free_starts(candidate_slots, step, busy)]
+
+    def _opening_hours(self, date_str, hours_raw, overrides_raw):
+        """(open_mins, close_mins) for the day, or None when closed."""
         target_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
         weekday_str = target_date.strftime("%a").lower()  # mon, tue, ...
 
-        # --- A. Determine Open/Close times ---
         start_time_str = None
         end_time_str = None
         is_closed = False
@@ -72,50 +329,12 @@ class AvailabilityService:
                 end_time_str = day_hours.get("end_time")
 
         if is_closed or not start_time_str or not end_time_str:
-            return []
-
-        # --- B. Generate Candidate Slots ---
-        
-        def to_minutes(t_val):
-            """Robustly convert HH:MM or HH:MM:SS string or object to minutes."""
-            if isinstance(t_val, (datetime.time, datetime.datetime)):
-                return t_val.hour * 60 + t_val.minute
-            
-            if not t_val:
-                return 0
-            
-            t_str = str(t_val).strip()
-            # Handle "2023-01-01T09:00:00"
-            if "T" in t_str:
-                t_str = t_str.split("T")[1]
-            
-            # Allow "9:00" or "09:00:00"
-            parts = t_str.split(":")
-            if len(parts) >= 2:
-                try:
-                    h = int(parts[0])
-                    m = int(parts[1])
-                    return h * 60 + m
-                except ValueError:
-                    pass
-            return 0
-
-        open_mins = to_minutes(start_time_str)
-        close_mins = to_minutes(end_time_str)
-        
-        # Generator loop
-        candidate_slots = []
-        current_mins = open_mins
-        step = int(duration_minutes) # ensure int
+            return None
 
-        # Strict: Slot must finish by closing time
-        while current_mins + step <= close_mins:
-            candidate_slots.append(current_mins)
-            current_mins += step
-
-        if not candidate_slots:
-            return []
+        return to_minutes(start_time_str), to_minutes(end_time_str)
 
+    def _drop_past(self, date_str, candidate_slots):
+        """Candidate starts (minutes) that are still bookable on date_str."""
         # --- Filter Past Slots (Timezone Safely) ---
         # We assume the user is booking in the barber's timezone or roughly "now".
         # For safety, if booking "today", filter out past times.
@@ -123,7 +342,7 @@ class AvailabilityService:
         
         # Basic check: if date string matches today's date
         # Note: Ideally we'd use barber timezone. For now, we use a 15m buffer if date matches UTC date.
-        if target_date == now_utc.date():
+        if datetime.datetime.strptime(date_str, "%Y-%m-%d").date() == now_utc.date():
             # Convert now UTC to minutes
             now_mins = now_utc.hour * 60 + now_utc.minute
             buffer_mins = 15
@@ -133,54 +352,176 @@ class AvailabilityService:
                 if s > (now_mins + buffer_mins)
             ]
 
-        if not candidate_slots:
-            return []
+        return candidate_slots
 
-        # --- C. Remove Overlaps ---
-        busy_intervals = []
-        for appt in appointments_raw:
-            if appt.get("status") == "cancelled":
-                continue
-            
-            # Start
-            a_start_val = appt.get("start_time")
-            a_s_mins = to_minutes(a_start_val)
-            
-            # End
-            a_end_val = appt.get("end_time")
-            if a_end_val:
-                a_e_mins = to_minutes(a_end_val)
+    # --- Materialized bitmaps (AVAILABILITY_STORE=bitmap) ---
+    # One record per barber/day: {"open", "close", "bits", "open_ended"}.
+    # bits is the free-unit bitmap (see availability_bitmap); open_ended keeps
+    # legacy bookings without end_time, whose length depends on the queried
+    # duration. Keys carry the barber generation, so invalidate_barber
+    # (weekly hours) orphans every day at once.
+
+    def _get_bitmap_key(self, barber_id, date, generation):
+        return f"availability_bitmap:{barber_id}:v{generation}:{date}"
+
+    def _bitmap_record(self, date_str, hours_raw, overrides_raw, appointments_raw):
+        opening = self._opening_hours(date_str, hours_raw, overrides_raw)
+        if opening is None:
+            return {"open": None, "close": None, "bits": 0, "open_ended": []}
+
+        open_mins, close_mins = opening
+        timed = [a for a in appointments_raw or [] if a.get("end_time")]
+        open_ended = [
+            to_minutes(a.get("start_time")) for a in appointments_raw or []
+            if not a.get("end_time") and a.get("status") != "cancelled"
+        ]
+        busy = merge_intervals(busy_intervals(timed, 0))
+        return {
+            "open": open_mins,
+            "close": close_mins,
+            "bits": availability_bitmap.build(open_mins, close_mins, busy),
+            "open_ended": open_ended,
+        }
+
+    def _load_bitmap(self, barber_id, date_str, generation):
+        """(record, was_cached) for one day; builds and stores it on a miss."""
+        key = self._get_bitmap_key(barber_id, date_str, generation)
+        record = self.cache.get(key)
+        if record is not None:
+            return record, True
+
+        def build():
+            record = self._bitmap_record(date_str, *self._fetch_day(barber_id, date_str))
+            self.cache.set(key, record, timeout=CACHE_TTL)
+            return record
+
+        record, computed = self.single_flight.do(key, build, lambda: self.cache.get(key))
+        return record, not computed
+
+    def _load_bitmaps(self, barber_id, dates, generation):
+        """({date: record}, all_cached); missing days are built from one range fetch."""
+        records = {}
+        missing = []
+        for d in dates:
+            record = self.cache.get(self._get_bitmap_key(barber_id, d, generation))
+            if record is not None:
+                records[d] = record
             else:
-                # Fallback if specific appt has no end time (should be rare/legacy)
-                a_e_mins = a_s_mins + step
-            
-            busy_intervals.append((a_s_mins, a_e_mins))
+                missing.append(d)
 
-        available_slots = []
-        for slot_start in candidate_slots:
-            slot_end = slot_start + step
-            
-            # Collision Logic
-            is_clashed = False
-            for (b_start, b_end) in busy_intervals:
-                # Overlap: (StartA < EndB) and (EndA > StartB)
-                if slot_start < b_end and slot_end > b_start:
-                    is_clashed = True
-                    break
-            
-            if not is_clashed:
-                # Convert back to HH:MM
-                hh = slot_start // 60
-                mm = slot_start % 60
-                available_slots.append(f"{hh:02d}:{mm:02d}")
+        if missing:
+            hours_raw, overrides_by_date, appts_by_date = self._fetch_range(barber_id, missing[0], missing[-1])
+            for d in missing:
+                records[d] = self._bitmap_record(d, hours_raw, overrides_by_date.get(d, []), appts_by_date.get(d, []))
+                self.cache.set(self._get_bitmap_key(barber_id, d, generation), records[d], timeout=CACHE_TTL)
+
+        return records, not missing
+
+    def _slots_from_bitmap(self, date_str, record, duration):
+        """HH:MM starts for any duration, or None if the bitmap can't answer exactly."""
+        if record["open"] is None:
+            return []
+        if not availability_bitmap.aligned(record["open"], duration):
+            return None
+
+        duration = int(duration)
+        bits = record["bits"]
+        for start in record["open_ended"]:
+            bits = availability_bitmap.mark_busy(bits, start, start + duration)
+
+        starts = availability_bitmap.free_starts(bits, record["open"], record["close"], duration)
+        return [format_minutes(s) for s in self._drop_past(date_str, starts)]
+
+    # --- Cache keys ---
+    # Every key embeds a per-barber generation counter. Any schedule mutation
+    # bumps the counter, which orphans all of that barber's entries at once
+    # (every duration and date) in O(1); orphans simply age out.
 
-        return available_slots
+    def _get_generation_key(self, barber_id):
+        return f"availability_gen:{barber_id}"
 
-    def _get_cache_key(self, barber_id, date, service_duration):
-        return f"availability:{barber_id}:{service_duration}:{date}"
+    def _get_generation(self, barber_id, gen_key=None):
+        return gens.current(self.cache, gen_key or self._get_generation_key(barber_id))
+
+    # The bitmap store patches day records in place instead of bumping the
+    # generation, so the minute-exact slot lists it falls back to (off-grid
+    # durations/hours) carry a second counter that every bitmap mutation bumps.
+
+    def _get_lists_generation_key(self, barber_id):
+        return f"availability_lists_gen:{barber_id}"
+
+    def _list_generation(self, barber_id, generation):
+        if self.store != "bitmap":
+            return generation
+        return gens.join(generation, self._get_generation(barber_id, self._get_lists_generation_key(barber_id)))
+
+    def _get_cache_key(self, barber_id, date, service_duration, generation):
+        return f"availability:{barber_id}:v{generation}:{service_duration}:{date}"
+
+    def _ttl_for(self, date_str):
+        """
+        Long TTL for future days, but never past the start of that day (UTC),
+        because "today" results also drop slots that are already in the past.
+        """
+        target = datetime.datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        until_day_starts = int((target - now).total_seconds())
+        return max(TODAY_CACHE_TTL, min(CACHE_TTL, until_day_starts))
+
+    def add_listener(self, fn):
+        """fn(barber_id) runs after every invalidation or recorded booking."""
+        self._listeners.append(fn)
+
+    def _changed(self, barber_id):
+        for fn in self._listeners:
+            try:
+                fn(barber_id)
+            except Exception as e:
+                logger.warning(f"Availability listener failed for {barber_id}: {e}")
+
+    def invalidate_barber(self, barber_id):
+        """Invalidate every cached availability entry for a barber."""
+        self._bump_generation(barber_id)
+        self._changed(barber_id)
+
+    def _bump_generation(self, barber_id, gen_key=None):
+        gens.bump(self.cache, gen_key or self._get_generation_key(barber_id))
 
     def invalidate_day(self, barber_id, date):
-        # Clear multiple possible durations
-        for d in [15, 30, 45, 60, 90]:
-             self.cache.delete(self._get_cache_key(barber_id, date, d))
+        if self.store == "bitmap":
+            # One record serves every duration: rebuild just this day
+            self._rebuild_bitmap(barber_id, date)
+            self._bump_generation(barber_id, self._get_lists_generation_key(barber_id))
+            self._changed(barber_id)
+            return
+        # Generation bump covers every slot duration, not just a fixed list
+        self.invalidate_barber(barber_id)
+
+    def record_booking(self, barber_id, date, start_time, end_time):
+        """
+        Call after an appointment row is written. With the bitmap store the
+        booked units are cleared in place (no fetch); otherwise this is
+        invalidate_day. Two bookings racing on one day can drop one clear;
+        the booking endpoint's own conflict check still rejects the slot and
+        the next cancel/override/TTL rebuild repairs the record.
+        """
+        if self.store != "bitmap":
+            self.invalidate_day(barber_id, date)
+            return
+
+        key = self._get_bitmap_key(barber_id, date, self._get_generation(barber_id))
+        record = self.cache.get(key)
+        if record is not None:  # otherwise built on next read
+            bits = availability_bitmap.mark_busy(record["bits"], to_minutes(start_time), to_minutes(end_time))
+            self.cache.set(key, dict(record, bits=bits), timeout=CACHE_TTL)
+        self._bump_generation(barber_id, self._get_lists_generation_key(barber_id))
+        self._changed(barber_id)
 
+    def _rebuild_bitmap(self, barber_id, date):
+        key = self._get_bitmap_key(barber_id, date, self._get_generation(barber_id))
+        try:
+            record = self._bitmap_record(date, *self._fetch_day(barber_id, date))
+            self.cache.set(key, record, timeout=CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Bitmap rebuild failed for {barber_id} {date}: {e}")
+            self.cache.delete(key)
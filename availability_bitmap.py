@@ -0,0 +1,64 @@
+"""
+Materialized day bitmaps for availability.
+
+A barber's day is stored as a Python int whose bit u is set when the
+5-minute unit [5u, 5u + 5) is inside opening hours and not booked. One
+bitmap answers slot queries for every service duration: a start s is free
+when all units covering [s, s + duration) are set.
+
+Units are exact when opening time and duration are multiples of UNIT_MINUTES
+(what the dashboard produces). A unit only counts as open when it lies fully
+inside opening hours, and as free when no booking touches it, so off-grid
+appointment times stay conservative. Callers fall back to the minute-exact
+path when aligned() is False.
+"""
+UNIT_MINUTES = 5
+
+
+def _mask(first_unit, last_unit):
+    """Bits [first_unit, last_unit) set."""
+    if last_unit <= first_unit:
+        return 0
+    return ((1 << (last_unit - first_unit)) - 1) << first_unit
+
+
+def build(open_mins, close_mins, merged_busy):
+    """Bitmap of free units for a day open [open_mins, close_mins)."""
+    first = max(0, -(-open_mins // UNIT_MINUTES))  # ceil
+    last = close_mins // UNIT_MINUTES
+    bits = _mask(first, last)
+    for b_start, b_end in merged_busy:
+        bits = mark_busy(bits, b_start, b_end)
+    return bits
+
+
+def mark_busy(bits, start_mins, end_mins):
+    """Clear every unit that overlaps [start_mins, end_mins)."""
+    if end_mins <= start_mins:
+        return bits
+    first = max(0, start_mins // UNIT_MINUTES)
+    last = -(-end_mins // UNIT_MINUTES)  # ceil
+    return bits & ~_mask(first, last)
+
+
+def aligned(open_mins, duration):
+    """True if slot boundaries fall on unit boundaries (bitmap is exact)."""
+    duration = int(duration)
+    return duration > 0 and open_mins % UNIT_MINUTES == 0 and duration % UNIT_MINUTES == 0
+
+
+def free_starts(bits, open_mins, close_mins, duration):
+    """
+    Slot starts (minutes) on the open_mins + k * duration grid that end by
+    close_mins and whose units are all free. Requires aligned().
+    """
+    duration = int(duration)
+    width = duration // UNIT_MINUTES
+    starts = []
+    current = open_mins
+    while current + duration <= close_mins:
+        window = _mask(current // UNIT_MINUTES, current // UNIT_MINUTES + width)
+        if bits & window == window:
+            starts.append(current)
+        current += duration
+    return starts
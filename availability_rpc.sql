@@ -0,0 +1,164 @@
+-- Migration: get_open_slots RPC (Postgres-side availability engine)
+-- Run this in your Supabase SQL Editor
+--
+-- Mirrors AvailabilityService._calculate_slots exactly so both engines can
+-- be used interchangeably (AVAILABILITY_ENGINE=sql). Parity is enforced by
+-- test_availability_parity.py.
+--
+--   - an override for the date REPLACES weekly hours (is_closed => no slots)
+--   - slots step by the slot duration and must finish by closing time
+--   - today (UTC) only returns slots starting > now + 15 minutes
+--   - non-cancelled appointments block any overlapping slot
+--     (missing end_time => start + duration)
+--
+-- Returns one row per open slot: slot_date 'YYYY-MM-DD', slot_time 'HH:MM'.
+
+-- "HH:MM", "HH:MM:SS", "YYYY-MM-DDTHH:MM:SS" or a time value -> minutes.
+-- Unparseable / empty values are 0, like intervals.to_minutes.
+create or replace function availability_minutes(p_val text)
+returns int
+language plpgsql
+immutable
+as $$
+declare
+  v text;
+  parts text[];
+begin
+  if p_val is null or btrim(p_val) = '' then
+    return 0;
+  end if;
+
+  v := btrim(p_val);
+  if position('T' in v) > 0 then
+    v := split_part(v, 'T', 2);
+  end if;
+
+  parts := string_to_array(v, ':');
+  if array_length(parts, 1) >= 2
+     and parts[1] ~ '^\s*[+-]?\d+\s*$'
+     and parts[2] ~ '^\s*[+-]?\d+\s*$' then
+    return btrim(parts[1])::int * 60 + btrim(parts[2])::int;
+  end if;
+
+  return 0;
+end;
+$$;
+
+
+create or replace function get_open_slots(
+  p_barber_id uuid,
+  p_start_date date,
+  p_end_date date,
+  p_duration int default null
+)
+returns table (
+  slot_date text,
+  slot_time text
+)
+language plpgsql
+stable
+as $$
+declare
+  v_step int;
+  v_day date;
+  -- v_day in each table's date column type, so their indexes apply
+  v_override_day schedule_overrides.date%type;
+  v_appt_day appointments.date%type;
+  v_open text;
+  v_close text;
+  v_closed boolean;
+  v_now timestamp := now() at time zone 'UTC';
+  v_now_m int;
+  r record;
+begin
+  v_step := p_duration;
+  if v_step is null then
+    select b.slot_duration into v_step from barbers b where b.id = p_barber_id;
+  end if;
+  if v_step is null or v_step <= 0 then
+    v_step := 60;
+  end if;
+
+  v_day := p_start_date;
+  while v_day <= p_end_date loop
+    v_open := null;
+    v_close := null;
+    v_closed := false;
+    v_override_day := v_day;
+    v_appt_day := v_day;
+
+    -- 1. Override replaces weekly hours entirely
+    select o.is_closed, o.start_time::text as start_time, o.end_time::text as end_time
+      into r
+      from schedule_overrides o
+     where o.barber_id = p_barber_id
+       and o.date = v_override_day
+     limit 1;
+
+    if found then
+      if coalesce(r.is_closed, false) then
+        v_closed := true;
+      else
+        v_open := r.start_time;
+        v_close := r.end_time;
+      end if;
+    else
+      -- 2. Weekly hours for this weekday ("mon", "tue", ...)
+      select w.is_closed, w.start_time::text as start_time, w.end_time::text as end_time
+        into r
+        from barber_weekly_hours w
+       where w.barber_id = p_barber_id
+         and w.weekday = lower(to_char(v_day, 'Dy'))
+       limit 1;
+
+      if not found or coalesce(r.is_closed, false) then
+        v_closed := true;
+      else
+        v_open := r.start_time;
+        v_close := r.end_time;
+      end if;
+    end if;
+
+    if not v_closed and nullif(v_open, '') is not null and nullif(v_close, '') is not null then
+      v_now_m := null;
+      if v_day = v_now::date then
+        v_now_m := extract(hour from v_now)::int * 60 + extract(minute from v_now)::int;
+      end if;
+
+      -- 3. Candidates minus anything overlapping a booked interval
+      return query
+        with busy as (
+          select availability_minutes(a.start_time::text) as s,
+                 case
+                   when nullif(a.end_time::text, '') is null
+                     then availability_minutes(a.start_time::text) + v_step
+                   else availability_minutes(a.end_time::text)
+                 end as e
+            from appointments a
+           where a.barber_id = p_barber_id
+             and a.date = v_appt_day
+             and a.status is distinct from 'cancelled'
+        )
+        select v_day::text,
+               lpad((c / 60)::text, 2, '0') || ':' || lpad((c % 60)::text, 2, '0')
+          from generate_series(
+                 availability_minutes(v_open),
+                 availability_minutes(v_close) - v_step,
+                 v_step
+               ) as c
+         where (v_now_m is null or c > v_now_m + 15)
+           and not exists (
+             select 1 from busy b
+              where b.e > b.s
+                and c < b.e
+                and c + v_step > b.s
+           )
+         order by c;
+    end if;
+
+    v_day := v_day + 1;
+  end loop;
+
+  return;
+end;
+$$;
@@ -0,0 +1,78 @@
+"""
+Per-barber settings cache.
+
+Hot columns that nearly every request needs (slot_duration, plan, ...) are
+read once and kept in the shared Flask cache, keyed by barber id. Writers
+that change these columns must call invalidate(barber_id).
+"""
+import logging
+import os
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Columns worth caching. Keep this small: it is the whole payload per barber.
+HOT_COLUMNS = "id, name, slot_duration, plan, premium_expires_at"
+
+SETTINGS_CACHE_TTL = int(os.getenv("BARBER_SETTINGS_CACHE_TTL", 5 * 60))
+
+DEFAULT_SLOT_DURATION = 60
+
+
+class BarberSettingsCache:
+    def __init__(self, cache, loader, ttl=SETTINGS_CACHE_TTL):
+        """
+        loader(barber_id) -> row dict with HOT_COLUMNS, or None if not found.
+        """
+        self.cache = cache
+        self.loader = loader
+        self.ttl = ttl
+
+    def _key(self, barber_id):
+        return f"barber_settings:{barber_id}"
+
+    def get(self, barber_id):
+        """Cached settings row, or None if the barber does not exist."""
+        key = self._key(barber_id)
+        row = self.cache.get(key)
+        if row is not None:
+            return row
+
+        row = self.loader(barber_id)
+        if row:
+            self.cache.set(key, row, timeout=self.ttl)
+        return row
+
+    def slot_duration(self, barber_id):
+        row = self.get(barber_id) or {}
+        return row.get("slot_duration") or DEFAULT_SLOT_DURATION
+
+    def effective_plan(self, barber_id):
+        """
+        Entitlement check with no network round trip in the common case.
+        A premium plan whose premium_expires_at has passed counts as free.
+        """
+        row = self.get(barber_id) or {}
+        plan = (row.get("plan") or "free").lower().strip()
+        if plan == "premium" and is_expired(row.get("premium_expires_at")):
+            return "free"
+        return plan
+
+    def invalidate(self, barber_id):
+        try:
+            self.cache.delete(self._key(barber_id))
+        except Exception as e:
+            logger.warning(f"Barber settings invalidation failed for {barber_id}: {e}")
+
+
+def is_expired(expires_at, now=None):
+    """True if an ISO timestamp is in the past. Naive values are treated as UTC."""
+    if not expires_at:
+        return False
+    try:
+        exp = datetime.fromisoformat(str(expires_at).replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    if exp.tzinfo is None:
+        exp = exp.replace(tzinfo=timezone.utc)
+    return exp < (now or datetime.now(timezone.utc))
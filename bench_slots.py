@@ -0,0 +1,61 @@
+"""
+Benchmark: pure-Python sorted sweep vs NumPy slot mask.
+
+Builds synthetic calendars (barbers x days, random bookings) and times both
+backends on the same inputs. Usage:
+
+    python bench_slots.py [barbers] [days]
+"""
+import random
+import sys
+import time
+
+import slot_mask
+from intervals import merge_intervals, free_starts
+
+
+def synthetic_calendars(barbers, days, seed=7):
+    rnd = random.Random(seed)
+    calendars = []
+    for _ in range(barbers * days):
+        duration = rnd.choice([15, 20, 30, 45, 60])
+        open_mins = rnd.choice([7, 8, 9, 10]) * 60
+        close_mins = rnd.choice([17, 18, 20, 22]) * 60
+        candidates = list(range(open_mins, close_mins - duration + 1, duration))
+
+        busy = []
+        for _ in range(rnd.randint(0, 40)):
+            s = rnd.randrange(open_mins, close_mins, 5)
+            busy.append((s, s + rnd.choice([15, 30, 45, 60, 90])))
+        calendars.append((candidates, duration, merge_intervals(busy)))
+    return calendars
+
+
+def run(fn, calendars):
+    t0 = time.perf_counter()
+    out = [fn(c, d, b) for c, d, b in calendars]
+    return time.perf_counter() - t0, out
+
+
+def main():
+    barbers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    calendars = synthetic_calendars(barbers, days)
+    print(f"{len(calendars)} barber-days ({barbers} barbers x {days} days)")
+
+    py_time, py_out = run(free_starts, calendars)
+    print(f"python sweep : {py_time * 1000:8.1f} ms")
+
+    if not slot_mask.HAS_NUMPY:
+        print("numpy mask   : skipped (NumPy not installed)")
+        return
+
+    np_time, np_out = run(slot_mask.free_starts_vectorized, calendars)
+    print(f"numpy mask   : {np_time * 1000:8.1f} ms")
+
+    assert py_out == np_out, "backends disagree"
+    print(f"speedup      : {py_time / np_time:8.2f}x (outputs identical)")
+
+
+if __name__ == "__main__":
+    main()
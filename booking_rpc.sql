@@ -0,0 +1,84 @@
+-- Migration: book_appointment RPC (atomic check-and-insert)
+-- Run this in your Supabase SQL Editor, AFTER availability_rpc.sql
+-- (uses availability_minutes).
+--
+-- The overlap check and the insert run in one transaction while holding a
+-- per-barber/per-day advisory lock. Concurrent requests for the same barber
+-- and day are serialized, so two clients can never book overlapping slots.
+-- Overlap rules match intervals.py / AvailabilityService: cancelled rows
+-- are ignored and a missing end_time lasts as long as the new booking.
+--
+-- p_row is the appointments row to insert as JSON. It must contain
+-- barber_id, date, start_time and end_time. Only the keys you pass are
+-- inserted, so column defaults (id, created_at, ...) still apply.
+--
+-- Returns one of:
+--   {"status": "booked",   "appointment": {...inserted row...}}
+--   {"status": "conflict", "conflict": {"start": "HH:MM", "end": "HH:MM"}}
+
+create or replace function book_appointment(p_row jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+  v_barber_id text := p_row->>'barber_id';
+  v_date text := p_row->>'date';
+  v_start int := availability_minutes(p_row->>'start_time');
+  v_end int := availability_minutes(p_row->>'end_time');
+  -- Lookup keys in the columns' own types, so the (barber_id, date) index applies
+  v_key_barber appointments.barber_id%type;
+  v_key_date appointments.date%type;
+  v_cols text;
+  v_row jsonb;
+  r record;
+begin
+  if v_barber_id is null or v_date is null or v_end <= v_start then
+    raise exception 'book_appointment: barber_id, date and a start_time before end_time are required';
+  end if;
+
+  -- Serialize writers for this barber/day (released at commit)
+  perform pg_advisory_xact_lock(hashtextextended(v_barber_id || ':' || v_date, 0));
+
+  v_key_barber := v_barber_id;
+  v_key_date := v_date;
+
+  select b.s, b.e into r
+    from (
+      select availability_minutes(a.start_time::text) as s,
+             case
+               when nullif(a.end_time::text, '') is null
+                 then availability_minutes(a.start_time::text) + (v_end - v_start)
+               else availability_minutes(a.end_time::text)
+             end as e
+        from appointments a
+       where a.barber_id = v_key_barber
+         and a.date = v_key_date
+         and a.status is distinct from 'cancelled'
+    ) b
+   where b.e > b.s
+     and b.s < v_end
+     and b.e > v_start
+   order by b.s
+   limit 1;
+
+  if found then
+    return jsonb_build_object(
+      'status', 'conflict',
+      'conflict', jsonb_build_object(
+        'start', lpad((r.s / 60)::text, 2, '0') || ':' || lpad((r.s % 60)::text, 2, '0'),
+        'end', lpad((r.e / 60)::text, 2, '0') || ':' || lpad((r.e % 60)::text, 2, '0')
+      )
+    );
+  end if;
+
+  select string_agg(quote_ident(k), ', ') into v_cols from jsonb_object_keys(p_row) as k;
+
+  execute format(
+    'insert into appointments (%1$s) select %1$s from jsonb_populate_record(null::appointments, $1) '
+    'returning to_jsonb(appointments.*)',
+    v_cols
+  ) using p_row into v_row;
+
+  return jsonb_build_object('status', 'booked', 'appointment', v_row);
+end;
+$$;
@@ -1,6 +1,7 @@
 from supabase_client import supabase
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta, timezone
+import re
+from datetime import datetime, timezone
 
 
 # ============================================================
@@ -51,6 +52,42 @@ def get_appointments_raw(barber_id, date_str):
     return res.data
 
 
+def get_date_overrides_range_raw(barber_id, start_date, end_date):
+    """Fetch schedule overrides for an inclusive date range (one query)."""
+    res = supabase.table("schedule_overrides")\
+        .select("*").eq("barber_id", barber_id)\
+        .gte("date", start_date).lte("date", end_date).execute()
+    return res.data
+
+
+def get_appointments_range_raw(barber_id, start_date, end_date):
+    """Fetch all appointments (booked/cancelled) for an inclusive date range."""
+    res = supabase.table("appointments")\
+        .select("date, start_time, end_time, status")\
+        .eq("barber_id", barber_id)\
+        .gte("date", start_date).lte("date", end_date).execute()
+    return res.data
+
+
+def get_open_slots_range(barber_id, start_date, end_date, duration=None):
+    """
+    Open slots computed in Postgres (get_open_slots RPC, see availability_rpc.sql).
+    Returns {"YYYY-MM-DD": ["HH:MM", ...]}; days without slots are absent.
+    """
+    params = {
+        "p_barber_id": barber_id,
+        "p_start_date": start_date,
+        "p_end_date": end_date,
+        "p_duration": duration,
+    }
+    res = supabase.rpc("get_open_slots", params).execute()
+
+    days = {}
+    for row in res.data or []:
+        days.setdefault(row["slot_date"], []).append(row["slot_time"])
+    return days
+
+
 def get_user_by_email(email):
     """Fetch a user by email."""
     res = (
@@ -93,38 +130,6 @@ def add_free_month(email, months=1):
     }).eq("email", email).execute()
 
 
-def check_and_update_premium_status(email):
-    """Auto-upgrade/downgrade premium plan based on free_months + expires_at."""
-    user = get_user_by_email(email)
-    if not user:
-        return
-    
-    free_months = user.get("free_months") or 0
-    expires_at = user.get("expires_at")
-
-    # Upgrade if free months available
-    if free_months > 0 and user.get("plan") != "premium":
-        new_expires = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
-        supabase.table("users").update({
-            "plan": "premium",
-            "expires_at": new_expires,
-            "free_months": free_months - 1
-        }).eq("email", email).execute()
-        return
-
-    # Downgrade if expired
-    if user["plan"] == "premium" and expires_at:
-        try:
-            exp = datetime.fromisoformat(expires_at)
-            if exp < datetime.now(timezone.utc):
-                supabase.table("users").update({
-                    "plan": "free",
-                    "expires_at": None
-                }).eq("email", email).execute()
-        except:
-            pass
-
-
 # ============================================================
 # BARBERS
 # ============================================================
@@ -159,17 +164,27 @@ def get_barber_by_user_id(user_id):
     return None
 
 
-def search_barbers(city="", profession=""):
-    """Search barbers by city + profession (optional)."""
-    query = supabase.table("barbers").select("*, locations(*)")
-
-    if city:
-        query = query.ilike("address", f"%{city}%")
-    if profession:
-        query = query.ilike("profession", f"%{profession}%")
-    
-    res = query.execute()
-    return res.data
+def search_barbers(city="", profession="", limit=20, offset=0, sort="relevance", now=None,
+                   available_today=False):
+    """
+    Search barbers by city + profession (optional) via the search_barbers RPC
+    (search_migration.sql, next_slots_migration.sql): trigram-indexed match,
+    ranked in Postgres (premium first, or earliest next open slot with
+    sort="earliest"), paged with limit/offset. available_today keeps only
+    barbers with a precomputed open slot left on now's date.
+    Rows: id, name, profession, address, photo_url, plan, next_open.
+    """
+    params = {
+        "p_city": city or "",
+        "p_service": profession or None,
+        "p_limit": limit,
+        "p_offset": offset,
+        "p_sort": sort,
+        "p_now": now,
+        "p_available_today": available_today,
+    }
+    res = supabase.rpc("search_barbers", params).execute()
+    return res.data or []
 
 
 def update_barber_photo(barber_id, photo_url):
@@ -199,10 +214,188 @@ def get_locations_for_barber(barber_id):
     return res.data
 
 
+# ============================================================
+# GEO (geo_migration.sql)
+# ============================================================
+
+GEO_PAGE = 1000  # PostgREST max rows per response
+GEO_CARD_COLUMNS = "id, name, profession, photo_url"
+
+
+def _select_all(table, columns, **filters):
+    """All rows with coordinates, in PostgREST-sized pages."""
+    rows, start = [], 0
+    while True:
+        q = supabase.table(table).select(columns).not_.is_("lat", "null")
+        for col, val in filters.items():
+            q = q.eq(col, val)
+        page = q.order("id").range(start, start + GEO_PAGE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < GEO_PAGE:
+            return rows
+        start += GEO_PAGE
+
+
+def load_geo_points():
+    """
+    Every geocoded barber address and barber location as GeoIndex points:
+    point_id ("b:<barber>" / "l:<location>"), barber_id, lat, lon, address
+    and location_name. Display fields come from get_barber_cards.
+    """
+    points = [geo_point(b) for b in _select_all("barbers", "id, address, lat, lon")]
+    for loc in _select_all("barber_locations", "id, barber_id, name, address, lat, lon"):
+        points.append(geo_point({"id": loc["barber_id"]}, loc))
+    return points
+
+
+def geo_point(barber, location=None):
+    src = location or barber
+    return {
+        "point_id": f"l:{location['id']}" if location else f"b:{barber['id']}",
+        "barber_id": barber["id"],
+        "lat": float(src["lat"]),
+        "lon": float(src["lon"]),
+        "address": src.get("address"),
+        "location_name": location.get("name") if location else None,
+    }
+
+
+def get_barber_cards(barber_ids):
+    """{barber_id: name/profession/photo_url row} for near-me results, in one request."""
+    if not barber_ids:
+        return {}
+    res = supabase.table("barbers").select(GEO_CARD_COLUMNS).in_("id", list(barber_ids)).execute()
+    return {b["id"]: b for b in res.data or []}
+
+
+def set_coordinates(table, row_id, lat, lon):
+    """Store geocoded coordinates on a barbers or barber_locations row."""
+    res = supabase.table(table).update({"lat": lat, "lon": lon}).eq("id", row_id).execute()
+    return res.data[0] if res.data else None
+
+
+def list_missing_coordinates(table, limit=100):
+    """Rows with an address but no coordinates yet (for backfill)."""
+    columns = "id, address" + (", barber_id" if table == "barber_locations" else "")
+    return supabase.table(table).select(columns)\
+        .is_("lat", "null").neq("address", "").not_.is_("address", "null")\
+        .limit(limit).execute().data or []
+
+
+# ============================================================
+# NEXT OPEN SLOTS (next_slots_migration.sql)
+# ============================================================
+
+def set_next_slots(barber_id, slots):
+    """Store a barber's precomputed next open slots ('YYYY-MM-DD HH:MM')."""
+    supabase.table("barbers").update({
+        "next_open_slots": slots,
+        "next_open_at": slots[0] if slots else None,
+        "next_slots_checked_at": datetime.now(timezone.utc).isoformat(),
+    }).eq("id", barber_id).execute()
+
+
+def list_stale_next_slots(now, limit=200):
+    """Barbers whose first stored slot has passed, or that have none, least recently checked first."""
+    res = supabase.table("barbers").select("id")\
+        .or_(f'next_open_at.is.null,next_open_at.lt."{now}"')\
+        .order("next_slots_checked_at", desc=False, nullsfirst=True)\
+        .limit(limit).execute()
+    return [r["id"] for r in res.data or []]
+
+
+# ============================================================
+# PREMIUM EXPIRY (premium_expiry_migration.sql)
+# ============================================================
+def expire_premium(now=None):
+    """Downgrade every expired premium barber in one set-based UPDATE; returns their ids."""
+    params = {"p_now": now.isoformat()} if now else {}
+    res = supabase.rpc("expire_premium", params).execute()
+    return [r["barber_id"] for r in res.data or []]
+
+
+# ============================================================
+# STRIPE EVENTS (processed_events_migration.sql)
+# ============================================================
+def claim_event(event_id, event_type):
+    """
+    Insert-if-absent into the processed_events ledger: True if this call
+    recorded the event (process it), False if it was already there (replay).
+    """
+    res = supabase.table("processed_events")\
+        .upsert({"event_id": event_id, "event_type": event_type},
+                on_conflict="event_id", ignore_duplicates=True).execute()
+    return bool(res.data)
+
+
+def release_event(event_id):
+    """Forget a claimed event that could not be queued, so Stripe's retry runs it."""
+    supabase.table("processed_events").delete().eq("event_id", event_id).execute()
+
+
+def barber_id_for_stripe_customer(customer_id, email=None):
+    """Barber paying through this Stripe customer; falls back to (and links) email."""
+    if customer_id:
+        res = supabase.table("barbers").select("id").eq("stripe_customer_id", customer_id).limit(1).execute()
+        if res.data:
+            return res.data[0]["id"]
+    if not email:
+        return None
+    res = supabase.table("barbers").select("id").eq("email", email).limit(1).execute()
+    if not res.data:
+        return None
+    barber_id = res.data[0]["id"]
+    if customer_id:
+        supabase.table("barbers").update({"stripe_customer_id": customer_id}).eq("id", barber_id).execute()
+    return barber_id
+
+
 # ============================================================
 # SCHEDULES
 # ============================================================
 
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def upsert_weekly_hours(barber_id, rows):
+    """
+    All weekday rows in one upsert request (schedule_batch_migration.sql
+    adds the (barber_id, weekday) key it conflicts on).
+    """
+    payload = [{
+        "barber_id": barber_id,
+        "weekday": row["weekday"].lower()[:3],
+        "start_time": row["start_time"],
+        "end_time": row["end_time"],
+        "is_closed": row["is_closed"],
+        "location_id": row.get("location_id"),
+    } for row in rows]
+    if not payload:
+        return []
+    res = supabase.table("barber_weekly_hours")\
+        .upsert(payload, on_conflict="barber_id,weekday").execute()
+    return res.data or []
+
+
+def upsert_overrides(barber_id, rows):
+    """Many schedule_overrides rows in one upsert request, keyed by (barber_id, date)."""
+    payload = [dict(row, barber_id=barber_id) for row in rows]
+    if not payload:
+        return []
+    res = supabase.table("schedule_overrides")\
+        .upsert(payload, on_conflict="barber_id,date").execute()
+    return res.data or []
+
+
+def delete_overrides(barber_id, dates):
+    """Remove the overrides on the given dates in one request."""
+    if not dates:
+        return []
+    res = supabase.table("schedule_overrides").delete()\
+        .eq("barber_id", barber_id).in_("date", list(dates)).execute()
+    return res.data or []
+
+
 def create_schedule_slot(barber_id, date, start_time, end_time, location_id=None):
     # Legacy: no-op as we moved to RPC
     pass
@@ -262,14 +455,6 @@ def create_appointment_v2(barber_id, date, start_time, end_time,
                           service_name, price=0, notes="", 
                           user_id=None, guest_name=None, guest_phone=None):
     
-    # Check availability
-    conflict = supabase.table("appointments").select("id").eq("barber_id", barber_id)\
-        .eq("date", date).eq("start_time", start_time)\
-        .neq("status", "cancelled").execute()
-        
-    if conflict.data:
-        raise Exception("Slot already booked")
-
     data = {
         "barber_id": barber_id,
         "date": date,
@@ -284,8 +469,22 @@ def create_appointment_v2(barber_id, date, start_time, end_time,
         "guest_phone": guest_phone,
     }
 
-    res = supabase.table("appointments").insert(data).execute()
-    return res.data[0]
+    # Overlap check and insert happen atomically in Postgres
+    result = book_appointment(data)
+    if result.get("status") == "conflict":
+        raise Exception("Slot already booked")
+    return result["appointment"]
+
+
+def book_appointment(row):
+    """
+    Atomically check for overlapping bookings and insert `row`
+    (book_appointment RPC, see booking_rpc.sql).
+    Returns {"status": "booked", "appointment": {...}} or
+    {"status": "conflict", "conflict": {"start": "HH:MM", "end": "HH:MM"}}.
+    """
+    res = supabase.rpc("book_appointment", {"p_row": row}).execute()
+    return res.data or {}
 
 
 def list_barber_appointments(barber_id):
@@ -299,6 +498,56 @@ def list_barber_appointments(barber_id):
     return res.data
 
 
+# Columns the dashboard list and calendar render
+APPOINTMENT_LIST_COLUMNS = "id, date, start_time, end_time, status, client_name, client_phone"
+
+
+def encode_appointment_cursor(row):
+    return f"{row['date']}|{row['start_time']}|{row['id']}"
+
+
+def decode_appointment_cursor(cursor):
+    """'date|start_time|id' -> tuple. Raises ValueError on anything malformed."""
+    parts = (cursor or "").split("|")
+    if len(parts) != 3:
+        raise ValueError("invalid cursor")
+    date, start_time, appt_id = parts
+    datetime.strptime(date[:10], "%Y-%m-%d")
+    if not re.fullmatch(r"\d{1,2}:\d{2}(:\d{2})?", start_time) or not re.fullmatch(r"[A-Za-z0-9-]+", appt_id):
+        raise ValueError("invalid cursor")
+    return date, start_time, appt_id
+
+
+def list_barber_appointments_page(barber_id, start_date=None, end_date=None, cursor=None,
+                                  limit=50, include_cancelled=False):
+    """
+    One page of a barber's appointments in (date, start_time, id) order.
+    Keyset pagination: pass the previous page's next_cursor as `cursor`.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    query = supabase.table("appointments").select(APPOINTMENT_LIST_COLUMNS).eq("barber_id", barber_id)
+    if not include_cancelled:
+        query = query.neq("status", "cancelled")
+    if start_date:
+        query = query.gte("date", start_date)
+    if end_date:
+        query = query.lte("date", end_date)
+    if cursor:
+        d, t, i = decode_appointment_cursor(cursor)
+        query = query.or_(
+            f'date.gt."{d}",'
+            f'and(date.eq."{d}",start_time.gt."{t}"),'
+            f'and(date.eq."{d}",start_time.eq."{t}",id.gt."{i}")'
+        )
+
+    # One extra row tells us whether another page exists
+    rows = query.order("date").order("start_time").order("id").limit(limit + 1).execute().data or []
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_appointment_cursor(rows[-1])
+    return rows, None
+
+
 def list_client_appointments(user_id):
     res = (
         supabase.table("appointments")
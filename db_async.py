@@ -0,0 +1,103 @@
+"""
+Async availability fetchers.
+
+Same queries as the raw fetchers in db.py, built on the async Supabase
+client so the three reads behind one availability computation run
+concurrently (latency ~= the slowest read instead of the sum of three).
+
+- Async-native (future ASGI deployment): await fetch_day_inputs(...)
+- Sync bridge (Flask views today): fetch_day_inputs_sync(...) runs the
+  coroutine on one long-lived background event loop, so the async
+  connection pool is reused across requests.
+"""
+import asyncio
+import threading
+import weakref
+
+from supabase_client import get_async_client, SUPABASE_KEY
+
+# One client per event loop (an httpx.AsyncClient can't cross loops)
+_clients = weakref.WeakKeyDictionary()
+_client_locks = weakref.WeakKeyDictionary()
+
+
+async def get_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is not None:
+        return client
+    # The first gather() on a loop fires several get_client() calls at once;
+    # only one of them may build the client.
+    lock = _client_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        client = _clients.get(loop)
+        if client is None:
+            client = await get_async_client(SUPABASE_KEY)
+            _clients[loop] = client
+    return client
+
+
+# ============================================================
+# AVAILABILITY RAW FETCHERS (async)
+# ============================================================
+
+async def get_weekly_hours_raw(barber_id):
+    """Fetch all weekly recurring hours for a barber (no logic)."""
+    client = await get_client()
+    res = await client.table("barber_weekly_hours")\
+        .select("*").eq("barber_id", barber_id).execute()
+    return res.data
+
+
+async def get_date_override_raw(barber_id, date_str):
+    """Fetch schedule overrides for a specific date."""
+    client = await get_client()
+    res = await client.table("schedule_overrides")\
+        .select("*").eq("barber_id", barber_id).eq("date", date_str).execute()
+    return res.data
+
+
+async def get_appointments_raw(barber_id, date_str):
+    """Fetch all appointments (booked/cancelled) for a specific date."""
+    client = await get_client()
+    res = await client.table("appointments")\
+        .select("start_time, end_time, status")\
+        .eq("barber_id", barber_id).eq("date", date_str).execute()
+    return res.data
+
+
+async def fetch_day_inputs(barber_id, date_str):
+    """(hours_raw, overrides_raw, appointments_raw) fetched concurrently."""
+    return tuple(await asyncio.gather(
+        get_weekly_hours_raw(barber_id),
+        get_date_override_raw(barber_id, date_str),
+        get_appointments_raw(barber_id, date_str),
+    ))
+
+
+# ============================================================
+# SYNC BRIDGE
+# ============================================================
+
+_loop = None
+_loop_lock = threading.Lock()
+
+BRIDGE_TIMEOUT = 30
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="db-async-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro, timeout=BRIDGE_TIMEOUT):
+    """Run a coroutine on the background loop and block for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result(timeout)
+
+
+def fetch_day_inputs_sync(barber_id, date_str):
+    return run_sync(fetch_day_inputs(barber_id, date_str))
@@ -0,0 +1,44 @@
+"""
+Generation counters for cache invalidation.
+
+A generation is a counter kept in the shared Flask cache and embedded in
+every key it guards. Bumping it orphans all of those entries at once (they
+age out by TTL) instead of deleting them one by one. Used by the
+availability, search and geo caches.
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def current(cache, gen_key):
+    """The generation stored under gen_key, seeding it on first use."""
+    generation = cache.get(gen_key)
+    if generation is None:
+        # Seed with a timestamp (not 0) so an evicted counter can never
+        # line up with keys written under an older generation.
+        cache.add(gen_key, time.time_ns(), timeout=0)
+        generation = cache.get(gen_key)
+    return generation
+
+
+def bump(cache, gen_key):
+    """Move gen_key to a new generation and return it."""
+    # A missing counter must be re-seeded, never incremented from 0
+    if cache.get(gen_key) is not None:
+        try:
+            # Atomic INCR on Redis; get+set on SimpleCache
+            generation = cache.cache.inc(gen_key)
+            if generation is not None:
+                return generation
+        except Exception as e:
+            logger.warning(f"Generation bump failed for {gen_key}: {e}")
+    generation = time.time_ns()
+    cache.set(gen_key, generation, timeout=0)
+    return generation
+
+
+def join(*generations):
+    """One key component for entries that depend on several generations."""
+    return ".".join(str(g) for g in generations)
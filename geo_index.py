@@ -0,0 +1,276 @@
+"""
+In-process spatial index for "near me" search.
+
+Every geocoded barber address and barber_locations row is a point, bucketed
+into a fixed lat/lon grid (GEO_CELL_DEG degrees per cell, ~5.5 km at the
+default). A radius query only visits the handful of cells overlapping the
+search circle, computes great-circle distances for the points in them and
+returns one row per barber (their closest point), nearest first. Points
+only hold coordinates and address; callers attach the barber's display
+fields, so profile, plan and photo edits never touch the index.
+
+Each worker holds its own copy:
+  - the worker that changes coordinates patches its index in place
+    (upsert/remove/remove_barber) and publishes the change: it bumps the geo
+    generation ("geo_gen", which nothing else moves) and stores the change
+    under that generation for GEO_CHANGE_TTL;
+  - other workers notice the generation move and replay the missed changes
+    in order. Only when a change has expired, or more than GEO_MAX_REPLAY
+    are missing, do they reload everything in a background thread. Queries
+    keep using the old snapshot until the new one is swapped in, so they
+    never wait on the database.
+"""
+import logging
+import math
+import os
+import threading
+import time
+
+import generation as gens
+
+logger = logging.getLogger(__name__)
+
+GEO_CELL_DEG = float(os.getenv("GEO_CELL_DEG", 0.05))
+GEO_DEFAULT_RADIUS_KM = float(os.getenv("GEO_DEFAULT_RADIUS_KM", 5))
+GEO_MAX_RADIUS_KM = float(os.getenv("GEO_MAX_RADIUS_KM", 100))
+# How often a worker checks the shared generation (seconds)
+GEO_CHECK_INTERVAL = float(os.getenv("GEO_CHECK_INTERVAL", 5))
+# Published point changes other workers can replay instead of reloading
+GEO_CHANGE_TTL = 60 * 60
+GEO_MAX_REPLAY = 500
+
+GEO_GEN_KEY = "geo_gen"
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = 111.32
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _Grid:
+    def __init__(self, cell_deg):
+        self.cell_deg = cell_deg
+        self.cells = {}   # (i, j) -> {point_id: point}
+        self.where = {}   # point_id -> (i, j)
+
+    def cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def upsert(self, point):
+        self.remove(point["point_id"])
+        key = self.cell(point["lat"], point["lon"])
+        self.cells.setdefault(key, {})[point["point_id"]] = point
+        self.where[point["point_id"]] = key
+
+    def remove(self, point_id):
+        key = self.where.pop(point_id, None)
+        if key is None:
+            return
+        bucket = self.cells.get(key, {})
+        bucket.pop(point_id, None)
+        if not bucket:
+            self.cells.pop(key, None)
+
+    def remove_barber(self, barber_id):
+        for point_id, key in list(self.where.items()):
+            if self.cells[key][point_id]["barber_id"] == barber_id:
+                self.remove(point_id)
+
+    def candidates(self, lat, lon, radius_km):
+        dlat = radius_km / KM_PER_DEG_LAT
+        # Longitude degrees shrink toward the poles; clamp to avoid a blow-up
+        dlon = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 0.01))
+        i0, j0 = self.cell(lat - dlat, lon - dlon)
+        i1, j1 = self.cell(lat + dlat, lon + dlon)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            # Huge box over a sparse grid: walking occupied cells is cheaper
+            for (i, j), bucket in self.cells.items():
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    yield from bucket.values()
+            return
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                bucket = self.cells.get((i, j))
+                if bucket:
+                    yield from bucket.values()
+
+
+class GeoIndex:
+    def __init__(self, loader, cache=None, cell_deg=GEO_CELL_DEG,
+                 check_interval=GEO_CHECK_INTERVAL):
+        """
+        loader() -> iterable of points: dicts with point_id, barber_id, lat,
+        lon plus whatever per-point fields results should carry.
+        cache: the shared Flask cache that carries point changes between
+        workers (None: this worker only).
+        """
+        self.loader = loader
+        self.cache = cache
+        self.cell_deg = cell_deg
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._grid = None
+        self._loaded_gen = None
+        self._checked_at = 0.0
+        self._rebuilding = False
+        self._stats = {"queries": 0, "rebuilds": 0, "rebuild_errors": 0, "replayed": 0, "points": 0}
+
+    # ---------------------------------------------------------
+    # Public
+    # ---------------------------------------------------------
+    def nearby(self, lat, lon, radius_km=GEO_DEFAULT_RADIUS_KM, limit=20):
+        """Barbers within radius_km, nearest first: [{**point, "distance_km"}]."""
+        grid = self._current()
+        radius_km = min(max(float(radius_km), 0.0), GEO_MAX_RADIUS_KM)
+        self._incr("queries")
+
+        # upsert()/remove() mutate the grid from geocoding threads; copy the
+        # candidates under the lock, do the distance math outside it
+        with self._lock:
+            candidates = list(grid.candidates(lat, lon, radius_km))
+
+        best = {}
+        for p in candidates:
+            d = haversine_km(lat, lon, p["lat"], p["lon"])
+            if d <= radius_km and (p["barber_id"] not in best or d < best[p["barber_id"]][0]):
+                best[p["barber_id"]] = (d, p)
+
+        ranked = sorted(best.values(), key=lambda x: (x[0], x[1]["barber_id"]))
+        return [dict(p, distance_km=round(d, 3)) for d, p in ranked[:limit]]
+
+    def nearest(self, lat, lon, k=20, max_radius_km=GEO_MAX_RADIUS_KM):
+        """The k nearest barbers within max_radius_km, widening the search as needed."""
+        radius = min(GEO_DEFAULT_RADIUS_KM, max_radius_km)
+        while True:
+            found = self.nearby(lat, lon, radius, limit=k)
+            if len(found) >= k or radius >= max_radius_km:
+                return found
+            radius = min(radius * 2, max_radius_km)
+
+    def upsert(self, point):
+        """Add or move one point, here and (via the cache) in every worker."""
+        self._change(("upsert", point))
+
+    def remove(self, point_id):
+        self._change(("remove", point_id))
+
+    def remove_barber(self, barber_id):
+        """Drop every point of a deleted barber."""
+        self._change(("remove_barber", barber_id))
+
+    def rebuild(self):
+        """Load every point and swap in a fresh grid."""
+        # Read before loading: changes published meanwhile are replayed on
+        # top, which is harmless because every change is idempotent
+        gen = self._generation()
+        grid = _Grid(self.cell_deg)
+        for point in self.loader() or []:
+            grid.upsert(point)
+        with self._lock:
+            self._grid = grid
+            self._loaded_gen = gen
+            self._stats["rebuilds"] += 1
+            self._stats["points"] = len(grid.where)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    # ---------------------------------------------------------
+    # Internals
+    # ---------------------------------------------------------
+    def _incr(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _generation(self):
+        return gens.current(self.cache, GEO_GEN_KEY) if self.cache is not None else None
+
+    def _apply(self, change):
+        # Caller holds self._lock
+        op, arg = change
+        getattr(self._grid, op)(arg)
+        self._stats["points"] = len(self._grid.where)
+
+    def _change(self, change):
+        with self._lock:
+            if self._grid is not None:
+                self._apply(change)
+        if self.cache is None:
+            return
+        try:
+            gen = gens.bump(self.cache, GEO_GEN_KEY)
+            self.cache.set(f"geo_change:{gen}", change, timeout=GEO_CHANGE_TTL)
+        except Exception as e:
+            # Other workers pick it up on their next full reload
+            logger.warning(f"Geo index change not published: {e}")
+
+    def _replay(self, gen):
+        """Apply the changes published since our snapshot; False if some are gone."""
+        loaded = self._loaded_gen
+        if not isinstance(gen, int) or not isinstance(loaded, int) or not 0 < gen - loaded <= GEO_MAX_REPLAY:
+            return False
+        changes = self.cache.get_many(*(f"geo_change:{g}" for g in range(loaded + 1, gen + 1)))
+        if any(c is None for c in changes):
+            return False
+        with self._lock:
+            if self._loaded_gen != loaded:
+                return True  # a rebuild or another replay got there first
+            for change in changes:
+                self._apply(change)
+            self._loaded_gen = gen
+            self._stats["replayed"] += len(changes)
+        return True
+
+    def _current(self):
+        if self._grid is None:
+            # First query in this worker has to wait for the initial load
+            with self._lock:
+                first = self._grid is None and not self._rebuilding
+                if first:
+                    self._rebuilding = True
+            if first:
+                try:
+                    self.rebuild()
+                except Exception as e:
+                    # Answer empty now; the next query retries the load
+                    self._incr("rebuild_errors")
+                    logger.warning(f"Geo index load failed: {e}")
+                finally:
+                    self._rebuilding = False
+            return self._grid or _Grid(self.cell_deg)
+
+        now = time.time()
+        if self.cache is not None and now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            try:
+                gen = self._generation()
+                if gen != self._loaded_gen and not self._replay(gen):
+                    self._rebuild_in_background()
+            except Exception as e:
+                logger.warning(f"Geo index generation check failed: {e}")
+        return self._grid
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            try:
+                self.rebuild()
+            except Exception as e:
+                self._incr("rebuild_errors")
+                logger.warning(f"Geo index rebuild failed: {e}")
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=run, name="geo-index-rebuild", daemon=True).start()
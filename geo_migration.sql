@@ -0,0 +1,22 @@
+-- Migration: coordinates for "near me" search
+-- Run this in your Supabase SQL Editor
+--
+-- Addresses are geocoded once when they are saved (see geocoder.py) and the
+-- result is stored here. The spatial index itself lives in each app worker
+-- (geo_index.py), loaded from the rows that have coordinates, so no PostGIS
+-- extension is needed.
+
+alter table barbers
+  add column if not exists lat double precision,
+  add column if not exists lon double precision;
+
+alter table barber_locations
+  add column if not exists lat double precision,
+  add column if not exists lon double precision;
+
+-- The index loader only reads geocoded rows
+create index if not exists barbers_geocoded_idx
+  on barbers (id) where lat is not null;
+
+create index if not exists barber_locations_geocoded_idx
+  on barber_locations (id) where lat is not null;
@@ -0,0 +1,121 @@
+"""
+Address -> (lat, lon) geocoding, run once when an address is saved.
+
+The backend is picked with GEOCODER:
+  none       (default) never geocode; only explicit lat/lon is stored
+  gazetteer  offline lookup in a local CSV (GEOCODER_GAZETTEER, columns
+             name,lat,lon, e.g. a GeoNames cities export)
+  nominatim  HTTP lookup against GEOCODER_URL (OpenStreetMap Nominatim API)
+
+Anything with a geocode(address) method returning (lat, lon) or None can be
+passed to the app instead.
+"""
+import csv
+import logging
+import os
+import re
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+GEOCODER = (os.getenv("GEOCODER") or "none").lower().strip()
+GEOCODER_GAZETTEER = os.getenv("GEOCODER_GAZETTEER", "")
+GEOCODER_URL = os.getenv("GEOCODER_URL", "https://nominatim.openstreetmap.org/search")
+GEOCODER_TIMEOUT = float(os.getenv("GEOCODER_TIMEOUT", 5))
+
+_LATLON = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def normalize(address):
+    return re.sub(r"\s+", " ", (address or "").strip().lower())
+
+
+def parse_latlon(lat, lon):
+    """(lat, lon) floats if both are valid coordinates, else None."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def _literal(address):
+    # "30.26,-97.74" needs no lookup
+    m = _LATLON.match(address or "")
+    return parse_latlon(m.group(1), m.group(2)) if m else None
+
+
+class NullGeocoder:
+    def geocode(self, address):
+        return _literal(address)
+
+
+class GazetteerGeocoder:
+    """
+    Offline: match the address, then its trailing comma-separated parts
+    ("12 Main St, Austin, TX" -> "austin, tx" -> "tx" ... and "austin"),
+    against place names from a CSV.
+    """
+
+    def __init__(self, path=None, places=None):
+        self.places = dict(places or {})
+        if path:
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    coords = parse_latlon(row.get("lat"), row.get("lon"))
+                    if coords and row.get("name"):
+                        self.places.setdefault(normalize(row["name"]), coords)
+
+    def geocode(self, address):
+        coords = _literal(address)
+        if coords:
+            return coords
+        parts = [p for p in (normalize(x) for x in (address or "").split(",")) if p]
+        # Most specific first: the full address, then shorter suffixes
+        for i in range(len(parts)):
+            hit = self.places.get(", ".join(parts[i:]))
+            if hit:
+                return hit
+        for part in parts:
+            hit = self.places.get(part)
+            if hit:
+                return hit
+        return None
+
+
+class NominatimGeocoder:
+    def __init__(self, url=GEOCODER_URL, timeout=GEOCODER_TIMEOUT, session=None):
+        self.url = url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.headers.setdefault("User-Agent", "BookerAI/1.0 (geocoding saved addresses)")
+
+    def geocode(self, address):
+        coords = _literal(address)
+        if coords or not normalize(address):
+            return coords
+        try:
+            res = self.session.get(
+                self.url, params={"q": address, "format": "json", "limit": 1}, timeout=self.timeout
+            )
+            res.raise_for_status()
+            hits = res.json()
+        except Exception as e:
+            logger.warning(f"Geocoding failed for {address!r}: {e}")
+            return None
+        return parse_latlon(hits[0].get("lat"), hits[0].get("lon")) if hits else None
+
+
+def get_geocoder(name=GEOCODER):
+    if name == "gazetteer":
+        if GEOCODER_GAZETTEER and os.path.exists(GEOCODER_GAZETTEER):
+            return GazetteerGeocoder(GEOCODER_GAZETTEER)
+        logger.warning("GEOCODER=gazetteer but GEOCODER_GAZETTEER is missing; geocoding disabled")
+    elif name == "nominatim":
+        return NominatimGeocoder()
+    elif name != "none":
+        logger.warning(f"Unknown GEOCODER={name!r}; geocoding disabled")
+    return NullGeocoder()
@@ -0,0 +1,98 @@
+"""
+Interval helpers for availability.
+
+Busy intervals are (start_min, end_min) tuples measured in minutes from
+midnight. AvailabilityService goes through these functions; the SQL side
+(availability_rpc.sql, booking_rpc.sql) implements the same rules so slot
+listings and bookings never disagree about what overlaps
+(test_booking_rpc.py checks book_appointment against free_starts).
+"""
+import datetime
+
+
+def to_minutes(t_val):
+    """Robustly convert HH:MM or HH:MM:SS string or object to minutes."""
+    if isinstance(t_val, (datetime.time, datetime.datetime)):
+        return t_val.hour * 60 + t_val.minute
+
+    if not t_val:
+        return 0
+
+    t_str = str(t_val).strip()
+    # Handle "2023-01-01T09:00:00"
+    if "T" in t_str:
+        t_str = t_str.split("T")[1]
+
+    # Allow "9:00" or "09:00:00"
+    parts = t_str.split(":")
+    if len(parts) >= 2:
+        try:
+            h = int(parts[0])
+            m = int(parts[1])
+            return h * 60 + m
+        except ValueError:
+            pass
+    return 0
+
+
+def format_minutes(mins):
+    """Minutes from midnight -> 'HH:MM'."""
+    return f"{mins // 60:02d}:{mins % 60:02d}"
+
+
+def busy_intervals(appointments_raw, default_duration):
+    """
+    Turn appointment rows into (start, end) minute intervals.
+    Cancelled rows are skipped; rows without end_time (legacy) last default_duration.
+    """
+    busy = []
+    for appt in appointments_raw or []:
+        if appt.get("status") == "cancelled":
+            continue
+
+        a_s_mins = to_minutes(appt.get("start_time"))
+        a_end_val = appt.get("end_time")
+        if a_end_val:
+            a_e_mins = to_minutes(a_end_val)
+        else:
+            a_e_mins = a_s_mins + int(default_duration)
+
+        busy.append((a_s_mins, a_e_mins))
+    return busy
+
+
+def merge_intervals(intervals):
+    """Sort and merge overlapping/touching intervals. O(m log m)."""
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_starts(candidates, duration, merged_busy):
+    """
+    Return the candidate starts whose [start, start + duration) window does not
+    overlap any merged busy interval.
+
+    candidates must be ascending and merged_busy must come from merge_intervals.
+    Single forward sweep: O(n + m).
+    """
+    free = []
+    j = 0
+    m = len(merged_busy)
+    for start in candidates:
+        end = start + duration
+        # Skip busy blocks that finish before this slot begins
+        while j < m and merged_busy[j][1] <= start:
+            j += 1
+        # Overlap: (StartA < EndB) and (EndA > StartB)
+        if j < m and merged_busy[j][0] < end:
+            continue
+        free.append(start)
+    return free
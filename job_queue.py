@@ -0,0 +1,405 @@
+"""
+Lightweight durable job queue for side effects that don't belong on the
+request path (Stripe webhook fulfilment, account deletion, ...).
+
+    job_queue.register("name", handler)          # handler(payload: dict)
+    job_queue.enqueue("name", {...}, key="...")  # returns job id, or None if
+                                                 # the key was already queued
+
+Backends:
+  - Redis (REDIS_URL set): jobs survive restarts and any worker process can
+    run them. Due jobs live in a sorted set scored by run time; a worker
+    claims one atomically (Lua) into an in-flight set with a lease, so a
+    worker that dies mid-job hands it back when the lease runs out.
+  - SQLite (fallback): the same model in a local file (JOB_QUEUE_SQLITE),
+    run by worker threads inside the web process.
+
+Delivery is at-least-once: a failing handler is retried with exponential
+backoff up to max_attempts, then parked as "dead" (logged, handed to the
+task's on_dead hook and kept for inspection); a dead job frees its
+idempotency key, so the same work can be queued again. Handlers must tolerate
+running twice. Idempotency keys make
+enqueue a no-op for a key already seen within JOB_KEY_TTL, so a retried
+webhook delivery never queues the same work twice.
+Finished SQLite jobs are purged by the worker loop once that window passes.
+
+Worker entry point: `python worker.py` (see Procfile), or the in-process
+threads started by start_workers() (JOB_WORKER_INPROCESS, JOB_WORKER_THREADS).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", 5))      # seconds, doubled per attempt
+JOB_RETRY_MAX = float(os.getenv("JOB_RETRY_MAX", 15 * 60))
+JOB_LEASE = float(os.getenv("JOB_LEASE", 5 * 60))           # seconds a claimed job may run
+JOB_KEY_TTL = int(os.getenv("JOB_KEY_TTL", 7 * 24 * 3600))  # idempotency window
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1))
+JOB_PURGE_INTERVAL = float(os.getenv("JOB_PURGE_INTERVAL", 60 * 60))
+JOB_QUEUE_SQLITE = os.getenv("JOB_QUEUE_SQLITE", "/tmp/bookerai-jobs.sqlite3")
+
+
+def retry_delay(attempts):
+    return min(JOB_RETRY_BASE * (2 ** max(attempts - 1, 0)), JOB_RETRY_MAX)
+
+
+class DuplicateJob(Exception):
+    pass
+
+
+# -------------------------------------------------------------
+# Backends: add / claim / complete / retry / kill / stats
+# -------------------------------------------------------------
+class RedisBackend:
+    # Store and queue the job, then claim its idempotency key (if any). The
+    # key is written last, so a script that errors part-way never leaves it.
+    _ADD = """
+    if KEYS[3] and redis.call('EXISTS', KEYS[3]) == 1 then return 0 end
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+    redis.call('SET', KEYS[1], ARGV[2])
+    if KEYS[3] then redis.call('SET', KEYS[3], ARGV[1], 'EX', ARGV[4]) end
+    return 1
+    """
+    # Move one due job from the queue into the in-flight set (lease = score)
+    _CLAIM = """
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+    if #ids == 0 then return false end
+    redis.call('ZREM', KEYS[1], ids[1])
+    redis.call('ZADD', KEYS[2], ARGV[2], ids[1])
+    return ids[1]
+    """
+    # Hand jobs whose lease expired back to the queue
+    _REAP = """
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+    for _, id in ipairs(ids) do
+      redis.call('ZREM', KEYS[2], id)
+      redis.call('ZADD', KEYS[1], ARGV[1], id)
+    end
+    return #ids
+    """
+
+    def __init__(self, client, prefix="jobs"):
+        self.r = client
+        self.queue = f"{prefix}:queue"
+        self.inflight = f"{prefix}:inflight"
+        self.dead = f"{prefix}:dead"
+        self.prefix = prefix
+        self._add = self.r.register_script(self._ADD)
+        self._claim = self.r.register_script(self._CLAIM)
+        self._reap = self.r.register_script(self._REAP)
+
+    def _job_key(self, job_id):
+        return f"{self.prefix}:job:{job_id}"
+
+    def add(self, job, key=None):
+        # Key, job and queue entry in one script: a key never outlives a failed add
+        keys = [self._job_key(job["id"]), self.queue]
+        if key:
+            keys.append(f"{self.prefix}:key:{key}")
+        if not self._add(keys=keys, args=[job["id"], json.dumps(job), job["run_at"], JOB_KEY_TTL]):
+            raise DuplicateJob(key)
+
+    def claim(self, now):
+        self._reap(keys=[self.queue, self.inflight], args=[now])
+        job_id = self._claim(keys=[self.queue, self.inflight], args=[now, now + JOB_LEASE])
+        if not job_id:
+            return None
+        raw = self.r.get(self._job_key(job_id.decode() if isinstance(job_id, bytes) else job_id))
+        if raw is None:
+            self.r.zrem(self.inflight, job_id)
+            return None
+        job = json.loads(raw)
+        job["attempts"] += 1
+        self.r.set(self._job_key(job["id"]), json.dumps(job))
+        return job
+
+    def complete(self, job):
+        pipe = self.r.pipeline()
+        pipe.zrem(self.inflight, job["id"])
+        pipe.delete(self._job_key(job["id"]))
+        pipe.execute()
+
+    def retry(self, job, run_at):
+        job["run_at"] = run_at
+        pipe = self.r.pipeline()
+        pipe.set(self._job_key(job["id"]), json.dumps(job))
+        pipe.zrem(self.inflight, job["id"])
+        pipe.zadd(self.queue, {job["id"]: run_at})
+        pipe.execute()
+
+    def kill(self, job):
+        pipe = self.r.pipeline()
+        pipe.set(self._job_key(job["id"]), json.dumps(job))
+        pipe.zrem(self.inflight, job["id"])
+        pipe.zadd(self.dead, {job["id"]: time.time()})
+        if job.get("key"):
+            pipe.delete(f"{self.prefix}:key:{job['key']}")
+        pipe.execute()
+
+    def purge(self, older_than):
+        """Nothing to do: finished jobs are deleted and keys expire on their own."""
+
+    def stats(self):
+        return {
+            "backend": "redis",
+            "queued": self.r.zcard(self.queue),
+            "running": self.r.zcard(self.inflight),
+            "dead": self.r.zcard(self.dead),
+        }
+
+
+class SQLiteBackend:
+    SCHEMA = """
+    create table if not exists jobs (
+      id text primary key,
+      name text not null,
+      payload text not null,
+      idempotency_key text unique,
+      status text not null default 'queued',   -- queued | running | done | dead
+      attempts integer not null default 0,
+      max_attempts integer not null,
+      run_at real not null,
+      locked_until real,
+      last_error text,
+      created_at real not null
+    );
+    create index if not exists jobs_due_idx on jobs (status, run_at);
+    """
+
+    def __init__(self, path=JOB_QUEUE_SQLITE):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode=wal")
+            self._local.conn = conn
+        return conn
+
+    def add(self, job, key=None):
+        conn = self._conn()
+        if key:
+            # Keys are only remembered for JOB_KEY_TTL
+            conn.execute("update jobs set idempotency_key = null where idempotency_key = ? and created_at < ?",
+                         (key, time.time() - JOB_KEY_TTL))
+        try:
+            conn.execute(
+                "insert into jobs (id, name, payload, idempotency_key, max_attempts, run_at, created_at)"
+                " values (?, ?, ?, ?, ?, ?, ?)",
+                (job["id"], job["name"], json.dumps(job["payload"]), key, job["max_attempts"],
+                 job["run_at"], job["created_at"]),
+            )
+        except sqlite3.IntegrityError:
+            raise DuplicateJob(key)
+
+    def claim(self, now):
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock, so two workers never claim one job
+        conn.execute("begin immediate")
+        try:
+            row = conn.execute(
+                "select * from jobs where (status = 'queued' and run_at <= ?)"
+                " or (status = 'running' and locked_until <= ?) order by run_at limit 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("commit")
+                return None
+            conn.execute(
+                "update jobs set status = 'running', attempts = attempts + 1, locked_until = ? where id = ?",
+                (now + JOB_LEASE, row["id"]),
+            )
+            conn.execute("commit")
+        except BaseException:
+            conn.execute("rollback")
+            raise
+        return {
+            "id": row["id"], "name": row["name"], "payload": json.loads(row["payload"]),
+            "attempts": row["attempts"] + 1, "max_attempts": row["max_attempts"],
+            "run_at": row["run_at"], "created_at": row["created_at"], "last_error": row["last_error"],
+            "key": row["idempotency_key"],
+        }
+
+    def complete(self, job):
+        # Kept (status done) so its idempotency key keeps deduping
+        self._conn().execute("update jobs set status = 'done', locked_until = null where id = ?", (job["id"],))
+
+    def retry(self, job, run_at):
+        self._conn().execute(
+            "update jobs set status = 'queued', run_at = ?, locked_until = null, last_error = ? where id = ?",
+            (run_at, job.get("last_error"), job["id"]),
+        )
+
+    def kill(self, job):
+        self._conn().execute(
+            "update jobs set status = 'dead', locked_until = null, idempotency_key = null, last_error = ?"
+            " where id = ?",
+            (job.get("last_error"), job["id"]),
+        )
+
+    def purge(self, older_than):
+        """Drop finished jobs (and their keys) created before `older_than`."""
+        self._conn().execute("delete from jobs where status = 'done' and created_at < ?", (older_than,))
+
+    def stats(self):
+        rows = self._conn().execute("select status, count(*) from jobs group by status").fetchall()
+        counts = {r[0]: r[1] for r in rows}
+        return {
+            "backend": "sqlite",
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "dead": counts.get("dead", 0),
+        }
+
+
+# -------------------------------------------------------------
+# Queue
+# -------------------------------------------------------------
+class JobQueue:
+    def __init__(self, backend):
+        self.backend = backend
+        self.handlers = {}
+        self.dead_handlers = {}
+        self._threads = []
+        self._next_purge = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"enqueued": 0, "duplicates": 0, "done": 0, "retried": 0, "dead": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Redis when REDIS_URL is set and reachable, else the SQLite file."""
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            try:
+                import redis
+                client = redis.from_url(redis_url)
+                client.ping()
+                return cls(RedisBackend(client))
+            except Exception as e:
+                logger.warning(f"Redis job queue unavailable ({e}); falling back to SQLite")
+        return cls(SQLiteBackend(JOB_QUEUE_SQLITE))
+
+    def register(self, name, handler, on_dead=None):
+        """
+        handler(payload) runs the job; on_dead(payload, error) runs once if
+        it is given up on after max_attempts (alerting, compensation).
+        """
+        self.handlers[name] = handler
+        if on_dead:
+            self.dead_handlers[name] = on_dead
+        return handler
+
+    def task(self, name, on_dead=None):
+        """Decorator form of register()."""
+        return lambda fn: self.register(name, fn, on_dead=on_dead)
+
+    def enqueue(self, name, payload, key=None, max_attempts=JOB_MAX_ATTEMPTS, delay=0):
+        """Queue a job. Returns its id, or None if `key` was already queued."""
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex, "name": name, "payload": payload, "attempts": 0,
+            "max_attempts": max_attempts, "run_at": now + delay, "created_at": now, "last_error": None,
+            "key": key,
+        }
+        try:
+            self.backend.add(job, key=key)
+        except DuplicateJob:
+            self._incr("duplicates")
+            logger.info(f"Job {name} with key {key} already queued; skipping")
+            return None
+        self._incr("enqueued")
+        return job["id"]
+
+    def run_once(self, now=None):
+        """Claim and run one due job. Returns True if a job was run."""
+        job = self.backend.claim(now or time.time())
+        if job is None:
+            return False
+
+        handler = self.handlers.get(job["name"])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for {job['name']!r}")
+            handler(job["payload"])
+        except Exception as e:
+            job["last_error"] = f"{type(e).__name__}: {e}"
+            if job["attempts"] >= job["max_attempts"]:
+                logger.error(f"Job {job['name']} {job['id']} dead after {job['attempts']} attempts: {e}")
+                self.backend.kill(job)
+                self._incr("dead")
+                self._dead(job)
+            else:
+                logger.warning(f"Job {job['name']} {job['id']} failed (attempt {job['attempts']}): {e}")
+                self.backend.retry(job, time.time() + retry_delay(job["attempts"]))
+                self._incr("retried")
+            return True
+
+        self.backend.complete(job)
+        self._incr("done")
+        return True
+
+    def _dead(self, job):
+        on_dead = self.dead_handlers.get(job["name"])
+        if on_dead is None:
+            return
+        try:
+            on_dead(job["payload"], job["last_error"])
+        except Exception as e:
+            logger.error(f"Dead-job handler for {job['name']} {job['id']} failed: {e}")
+
+    def purge(self, now=None):
+        """Drop finished jobs whose idempotency window (JOB_KEY_TTL) has passed."""
+        now = now or time.time()
+        with self._lock:
+            if now < self._next_purge:
+                return False
+            self._next_purge = now + JOB_PURGE_INTERVAL
+        self.backend.purge(now - JOB_KEY_TTL)
+        return True
+
+    def run_worker(self, poll_interval=JOB_POLL_INTERVAL, stop=None):
+        """Worker loop: run due jobs, sleep when idle. Blocks until `stop` is set."""
+        stop = stop or self._stop
+        while not stop.is_set():
+            try:
+                self.purge()
+                if self.run_once():
+                    continue
+            except Exception as e:
+                # Backend unavailable: back off instead of spinning
+                logger.warning(f"Job worker iteration failed: {e}")
+            stop.wait(poll_interval)
+
+    def start_workers(self, threads=1):
+        """Run `threads` worker loops as daemon threads in this process."""
+        for i in range(threads - len(self._threads)):
+            t = threading.Thread(target=self.run_worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            stats.update(self.backend.stats())
+        except Exception as e:
+            stats["backend_error"] = str(e)
+        return stats
+
+    def _incr(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
@@ -0,0 +1,13 @@
+-- Migration: resized media variants
+-- Run this in your Supabase SQL Editor
+--
+-- Uploads are resized into thumb/card/full WebP variants in the background
+-- (media_pipeline.py). barbers.photo_url keeps pointing at one image (the
+-- "card" variant); the full set of URLs is stored alongside it:
+--   {"thumb": "...", "card": "...", "full": "...", "avif": {...optional}}
+
+alter table barbers
+  add column if not exists photo_variants jsonb;
+
+alter table gallery
+  add column if not exists variants jsonb;
@@ -0,0 +1,176 @@
+"""
+Media pipeline for profile photos and portfolio images.
+
+The upload request only streams the file to a temp file (never holding it
+in memory) and queues a job. A background pool then:
+  1. decodes the image once and renders resized variants (thumb, card,
+     full) as WebP, plus AVIF when MEDIA_AVIF=1 and Pillow can encode it;
+  2. uploads every variant concurrently on a separate upload pool;
+  3. hands the variant URLs to the app's on_done callback, which records
+     them (barbers.photo_url / photo_variants, gallery.variants).
+Job status lives in app.cache. Only with REDIS_URL set is that shared, so
+any worker can answer a poll; under the default per-process SimpleCache a
+poll that lands on another gunicorn worker or instance reports an unknown
+job, so multi-worker deployments need Redis.
+
+Images are checked against MEDIA_MAX_PIXELS from their header, before any
+pixels are decoded, so a small file cannot expand into a huge bitmap.
+
+Variants are stored as <base>/<name>.<fmt>, so a page holding one variant
+URL can switch to another size with variant_url() and no extra lookup.
+"""
+import io
+import logging
+import os
+import re
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps, features
+    HAS_PILLOW = True
+except ImportError:
+    HAS_PILLOW = False
+
+logger = logging.getLogger(__name__)
+
+# name -> longest edge in pixels (images are never upscaled)
+VARIANTS = {"thumb": 160, "card": 480, "full": 1600}
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", 2))
+MEDIA_UPLOAD_CONCURRENCY = int(os.getenv("MEDIA_UPLOAD_CONCURRENCY", 4))
+MEDIA_WEBP_QUALITY = int(os.getenv("MEDIA_WEBP_QUALITY", 80))
+MEDIA_AVIF = os.getenv("MEDIA_AVIF", "0") == "1"
+MEDIA_MAX_PIXELS = int(os.getenv("MEDIA_MAX_PIXELS", 40_000_000))  # ~8000x5000
+MEDIA_JOB_TTL = 60 * 60
+
+CHUNK_SIZE = 64 * 1024
+
+_VARIANT_URL = re.compile(r"/(%s)\.(webp|avif)(\?.*)?$" % "|".join(VARIANTS))
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def stream_to_temp(stream, max_bytes, suffix=""):
+    """Copy an upload stream to a temp file in chunks; returns its path."""
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=suffix)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File too large (max {max_bytes // (1024 * 1024)}MB)")
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def variant_url(url, name):
+    """Swap a pipeline variant URL for another size; other URLs pass through."""
+    if not url or name not in VARIANTS:
+        return url
+    return _VARIANT_URL.sub(lambda m: f"/{name}.{m.group(2)}{m.group(3) or ''}", url)
+
+
+def output_formats(avif=MEDIA_AVIF):
+    formats = ["webp"]
+    if avif and HAS_PILLOW and features.check("avif"):
+        formats.append("avif")
+    return formats
+
+
+def render_variants(path, formats=("webp",), quality=MEDIA_WEBP_QUALITY, max_pixels=MEDIA_MAX_PIXELS):
+    """Decode once, resize to every variant: {(name, fmt): bytes}."""
+    if not HAS_PILLOW:
+        raise RuntimeError("Pillow is required for the media pipeline")
+    with Image.open(path) as im:
+        # open() only reads the header: refuse decompression bombs before decoding
+        if im.width * im.height > max_pixels:
+            raise ImageTooLarge(f"Image too large ({im.width}x{im.height} pixels)")
+        im = ImageOps.exif_transpose(im)  # phone photos carry rotation in EXIF
+        im = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+
+        out = {}
+        # Largest first so each smaller variant resizes from the previous one
+        for name, edge in sorted(VARIANTS.items(), key=lambda kv: -kv[1]):
+            im.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+            for fmt in formats:
+                buf = io.BytesIO()
+                im.save(buf, format=fmt.upper(), quality=quality)
+                out[(name, fmt)] = buf.getvalue()
+        return out
+
+
+class MediaPipeline:
+    def __init__(self, cache, upload, on_done, workers=MEDIA_WORKERS,
+                 upload_concurrency=MEDIA_UPLOAD_CONCURRENCY, formats=None):
+        """
+        upload(path, data, content_type) -> public URL
+        on_done(job) records a finished job; job has kind, barber_id and
+        variants ({"thumb": url, "card": url, "full": url[, "avif": {...}]})
+        """
+        self.cache = cache
+        self.upload = upload
+        self.on_done = on_done
+        self.formats = formats or output_formats()
+        self._workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media")
+        # Separate pool: a render job waits on its uploads, so they must not share workers
+        self._uploads = ThreadPoolExecutor(max_workers=upload_concurrency, thread_name_prefix="media-upload")
+
+    def submit(self, kind, barber_id, temp_path, base_path):
+        """Queue a streamed upload; the pipeline owns (and deletes) temp_path."""
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "kind": kind, "barber_id": barber_id, "status": "processing",
+               "base_path": f"{base_path}/{job_id}"}
+        self._save(job)
+        self._workers.submit(self._run, job, temp_path)
+        return job_id
+
+    def status(self, job_id):
+        return self.cache.get(self._key(job_id))
+
+    def _run(self, job, temp_path):
+        try:
+            rendered = render_variants(temp_path, self.formats)
+            futures = {
+                (name, fmt): self._uploads.submit(
+                    self.upload, f"{job['base_path']}/{name}.{fmt}", data, f"image/{fmt}"
+                )
+                for (name, fmt), data in rendered.items()
+            }
+            urls = {key: f.result() for key, f in futures.items()}
+
+            variants = {name: urls[(name, "webp")] for name in VARIANTS}
+            if "avif" in self.formats:
+                variants["avif"] = {name: urls[(name, "avif")] for name in VARIANTS}
+            job.update(variants=variants, url=variants["card"])
+            self.on_done(job)
+            job["status"] = "done"
+        except Exception as e:
+            logger.warning(f"Media job {job['id']} failed: {e}")
+            job.update(status="failed", error=str(e))
+        finally:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            self._save(job)
+
+    def _save(self, job):
+        self.cache.set(self._key(job["id"]), job, timeout=MEDIA_JOB_TTL)
+
+    def _key(self, job_id):
+        return f"media_job:{job_id}"
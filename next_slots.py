@@ -0,0 +1,152 @@
+"""
+Background precompute of each barber's next open slots, for search.
+
+Search results need "when is this barber next free?" for every row, and
+working that out per row would multiply AvailabilityService calls by the
+result count. Instead each barber's next NEXT_SLOTS_N open slots are stored
+on the barbers row (next_slots_migration.sql) and search just reads them.
+
+The stored slots are refreshed by one background thread per worker:
+  - mark_dirty(barber_id) queues a barber. The app registers it as an
+    AvailabilityService listener, so every booking, cancellation, override
+    and weekly-hours change queues the barber it touched;
+  - every NEXT_SLOTS_SWEEP_INTERVAL seconds one worker (cache lease) also
+    refreshes barbers whose first stored slot has passed or was never
+    computed, since slots expire with the clock as well.
+After each batch the search cache's availability generation is bumped, so
+pages sorted or filtered by availability are recomputed.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+NEXT_SLOTS_N = int(os.getenv("NEXT_SLOTS_N", 5))
+NEXT_SLOTS_HORIZON_DAYS = int(os.getenv("NEXT_SLOTS_HORIZON_DAYS", 14))
+NEXT_SLOTS_SWEEP_INTERVAL = int(os.getenv("NEXT_SLOTS_SWEEP_INTERVAL", 5 * 60))
+NEXT_SLOTS_SWEEP_BATCH = int(os.getenv("NEXT_SLOTS_SWEEP_BATCH", 200))
+
+SWEEP_LEASE_KEY = "next_slots:sweep"
+
+
+def now_utc():
+    """'YYYY-MM-DD HH:MM' in UTC, the clock AvailabilityService drops past slots by."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+def first_slots(days, n=NEXT_SLOTS_N):
+    """{date: [HH:MM, ...]} -> the first n 'YYYY-MM-DD HH:MM' slots."""
+    out = []
+    for day in sorted(days):
+        for t in days[day]:
+            out.append(f"{day} {t}")
+            if len(out) >= n:
+                return out
+    return out
+
+
+class NextSlotsRefresher:
+    def __init__(self, cache, compute, store, list_stale, on_batch=None,
+                 n=NEXT_SLOTS_N, horizon_days=NEXT_SLOTS_HORIZON_DAYS):
+        """
+        compute(barber_id, start_date, end_date) -> {date: [HH:MM, ...]} of open slots
+        store(barber_id, slots) persists the list ([] = nothing open in the horizon)
+        list_stale(now, limit) -> barber ids whose stored slots need a refresh
+        on_batch() runs after each batch that stored something
+        """
+        self.cache = cache
+        self.compute = compute
+        self.store = store
+        self.list_stale = list_stale
+        self.on_batch = on_batch
+        self.n = n
+        self.horizon_days = horizon_days
+
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {"refreshed": 0, "errors": 0, "sweeps": 0}
+
+    # ---------------------------------------------------------
+    # Public
+    # ---------------------------------------------------------
+    def mark_dirty(self, barber_id):
+        """Queue a barber for a refresh (cheap; safe on the request path)."""
+        if not barber_id:
+            return
+        with self._lock:
+            self._dirty.add(barber_id)
+        self._wake.set()
+
+    def refresh(self, barber_id):
+        """Recompute and store one barber's next slots. Returns the slots."""
+        start = datetime.now(timezone.utc).date()
+        end = start + timedelta(days=self.horizon_days - 1)
+        days = self.compute(barber_id, start.isoformat(), end.isoformat())
+        slots = first_slots(days or {}, self.n)
+        self.store(barber_id, slots)
+        return slots
+
+    def refresh_many(self, barber_ids):
+        done = 0
+        for barber_id in barber_ids:
+            try:
+                self.refresh(barber_id)
+                done += 1
+            except Exception as e:
+                logger.warning(f"Next slots refresh failed for {barber_id}: {e}")
+                self._incr("errors")
+        self._incr("refreshed", done)
+        if done and self.on_batch:
+            self.on_batch()
+        return done
+
+    def sweep(self, limit=NEXT_SLOTS_SWEEP_BATCH):
+        """Refresh barbers whose stored slots expired (or were never computed)."""
+        self._incr("sweeps")
+        return self.refresh_many(self.list_stale(now_utc(), limit))
+
+    def start(self, sweep_interval=NEXT_SLOTS_SWEEP_INTERVAL):
+        """Run the refresher in a daemon thread (sweep_interval 0 = dirty queue only)."""
+        if self._thread is not None:
+            return
+
+        def loop():
+            # First sweep one interval after start-up, not on every boot
+            next_sweep = time.time() + sweep_interval
+            while True:
+                timeout = max(0.0, next_sweep - time.time()) if sweep_interval > 0 else None
+                self._wake.wait(timeout)
+                self._wake.clear()
+                try:
+                    self.refresh_many(self._drain())
+                    if sweep_interval > 0 and time.time() >= next_sweep:
+                        next_sweep = time.time() + sweep_interval
+                        # One worker sweeps per interval
+                        if self.cache.add(SWEEP_LEASE_KEY, 1, timeout=sweep_interval):
+                            self.sweep()
+                except Exception as e:
+                    logger.warning(f"Next slots refresher iteration failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name="next-slots", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, queued=len(self._dirty))
+
+    # ---------------------------------------------------------
+    # Internals
+    # ---------------------------------------------------------
+    def _incr(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _drain(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
@@ -0,0 +1,83 @@
+-- Migration: "next available" slots for search results
+-- Run this in your Supabase SQL Editor, AFTER search_migration.sql
+-- (replaces search_barbers with a version that can sort/filter on them).
+--
+-- next_slots.py keeps each barber's next few open slots here, refreshed in
+-- the background whenever bookings, cancellations or hours change. Search
+-- only reads these columns, so "available today" / "earliest opening" costs
+-- no availability work per result.
+--
+-- Slots are "YYYY-MM-DD HH:MM" strings, which sort chronologically; the
+-- app compares them against the current UTC time.
+
+alter table barbers
+  add column if not exists next_open_slots text[],
+  add column if not exists next_open_at text,          -- next_open_slots[1]
+  add column if not exists next_slots_checked_at timestamptz;
+
+-- The background sweep looks for barbers whose first slot has passed
+create index if not exists barbers_next_open_at_idx
+  on barbers (next_open_at);
+
+
+-- First slot at or after p_now, or null
+create or replace function next_open_after(p_slots text[], p_now text)
+returns text
+language sql
+immutable
+as $$
+  select min(s) from unnest(p_slots) s where s >= p_now;
+$$;
+
+
+drop function if exists search_barbers(text, text, int, int);
+
+create or replace function search_barbers(
+  p_city text,
+  p_service text default null,
+  p_limit int default 20,
+  p_offset int default 0,
+  p_sort text default 'relevance',   -- 'relevance' | 'earliest'
+  p_now text default null,           -- current UTC time, 'YYYY-MM-DD HH:MM'
+  p_available_today boolean default false
+)
+returns table (
+  id text,
+  name text,
+  profession text,
+  address text,
+  photo_url text,
+  plan text,
+  next_open text
+)
+language sql
+stable
+as $$
+  select s.id, s.name, s.profession, s.address, s.photo_url, s.plan, s.next_open
+    from (
+      select b.id::text as id,
+             b.name::text as name,
+             b.profession::text as profession,
+             b.address::text as address,
+             b.photo_url::text as photo_url,
+             b.plan::text as plan,
+             next_open_after(
+               b.next_open_slots,
+               coalesce(p_now, to_char(now(), 'YYYY-MM-DD HH24:MI'))
+             ) as next_open,
+             similarity(b.address, p_city) as score
+        from barbers b
+       where b.address ilike search_like_pattern(p_city)
+         and (coalesce(btrim(p_service), '') = ''
+              or b.profession ilike search_like_pattern(p_service))
+    ) s
+   where not coalesce(p_available_today, false)
+      or left(s.next_open, 10) = left(coalesce(p_now, to_char(now(), 'YYYY-MM-DD HH24:MI')), 10)
+   order by case when p_sort = 'earliest' then s.next_open end asc nulls last,
+            (s.plan = 'premium') desc nulls last,
+            s.score desc,
+            s.name asc nulls last,
+            s.id
+   limit least(greatest(coalesce(p_limit, 20), 1), 100)
+  offset greatest(coalesce(p_offset, 0), 0);
+$$;
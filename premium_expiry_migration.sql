@@ -0,0 +1,30 @@
+-- Migration: batch premium expiry
+-- Run this in your Supabase SQL Editor
+--
+-- Premium entitlements are no longer fixed up lazily on page views.
+-- POST /api/internal/premium/expire (run by cron / Cloud Scheduler) calls
+-- expire_premium(), which downgrades every barber whose premium_expires_at
+-- has passed in one set-based UPDATE, so barbers.plan is always correct for
+-- search ranking. Paid months, renewals and referral credit all extend
+-- premium_expires_at directly (add_premium_month), so there is nothing
+-- else to apply here.
+
+-- Each run looks only at premium barbers by expiry
+create index if not exists barbers_premium_expires_at_idx
+  on barbers (premium_expires_at)
+  where plan = 'premium';
+
+
+-- Earlier drafts returned (barber_id, change)
+drop function if exists expire_premium(timestamptz);
+
+create or replace function expire_premium(p_now timestamptz default now())
+returns table (barber_id text)
+language sql
+as $$
+  update barbers b
+     set plan = 'free'
+   where b.plan = 'premium'
+     and b.premium_expires_at::timestamptz <= p_now
+  returning b.id::text;
+$$;
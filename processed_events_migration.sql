@@ -0,0 +1,23 @@
+-- Migration: Stripe webhook event ledger
+-- Run this in your Supabase SQL Editor
+--
+-- Every Stripe event the webhook accepts is recorded here by its event id
+-- with an insert-if-absent (ON CONFLICT DO NOTHING) before it is queued.
+-- A redelivered or out-of-order replayed event finds its id already taken
+-- and is acknowledged without touching the barbers table.
+--
+-- Renewal (invoice.paid) and cancellation (customer.subscription.deleted)
+-- events only carry the Stripe customer id, so checkout stores it on the
+-- barber row.
+
+create table if not exists processed_events (
+  event_id text primary key,
+  event_type text not null,
+  processed_at timestamptz not null default now()
+);
+
+alter table barbers
+  add column if not exists stripe_customer_id text;
+
+create index if not exists barbers_stripe_customer_id_idx
+  on barbers (stripe_customer_id);
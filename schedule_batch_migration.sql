@@ -0,0 +1,26 @@
+-- Migration: keys for batched schedule writes
+-- Run this in your Supabase SQL Editor
+--
+-- Weekly hours and date overrides are now written as one upsert request per
+-- save (all weekdays, or every date of a vacation at once). A multi-row
+-- upsert needs a unique key to conflict on: one weekly row per barber and
+-- weekday, and one override per barber and date.
+
+-- Keep one row per key where duplicates slipped in
+delete from barber_weekly_hours a
+ using barber_weekly_hours b
+ where a.barber_id = b.barber_id
+   and a.weekday = b.weekday
+   and a.ctid < b.ctid;
+
+create unique index if not exists barber_weekly_hours_barber_weekday_key
+  on barber_weekly_hours (barber_id, weekday);
+
+delete from schedule_overrides a
+ using schedule_overrides b
+ where a.barber_id = b.barber_id
+   and a.date = b.date
+   and a.ctid < b.ctid;
+
+create unique index if not exists schedule_overrides_barber_date_key
+  on schedule_overrides (barber_id, date);
@@ -0,0 +1,218 @@
+"""
+Search results cache for /find-pro.
+
+Pages are cached in the shared Flask cache under the normalized
+(city, service, page), already in the compact shape results.html and the
+JSON API use. Any barber change that can move a barber in or out of a
+result page (profile, address, profession, photo, plan, signup, delete)
+calls invalidate(), which bumps one generation counter and orphans every
+cached page at once.
+
+Rows also carry each barber's precomputed next open slot (next_slots.py),
+which changes with every booking. NextSlotsRefresher calls
+invalidate_availability() after storing new slots; that bumps a second,
+separate counter that only keys of pages sorted or filtered by
+availability include, so relevance pages survive bookings. The displayed next opening on a
+relevance page may lag by up to SEARCH_CACHE_TTL.
+
+A background warmer keeps page 1 of the most requested searches (plus any
+listed in SEARCH_WARM_QUERIES) hot, so popular searches stay fast after
+each invalidation.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import generation as gens
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 10 * 60))
+SEARCH_WARM_INTERVAL = int(os.getenv("SEARCH_WARM_INTERVAL", 5 * 60))
+SEARCH_WARM_TOP = int(os.getenv("SEARCH_WARM_TOP", 20))
+# Distinct searches counted per worker before the tail is pruned
+SEARCH_POPULAR_MAX = int(os.getenv("SEARCH_POPULAR_MAX", 1000))
+
+
+def normalize(term):
+    """Case- and whitespace-insensitive form of a search term."""
+    return re.sub(r"\s+", " ", (term or "").strip().lower())
+
+
+def parse_warm_queries(value):
+    """'austin|barber, dallas' -> [("austin", "barber"), ("dallas", "")]"""
+    queries = []
+    for item in (value or "").split(","):
+        city, _, service = item.partition("|")
+        if normalize(city):
+            queries.append((normalize(city), normalize(service)))
+    return queries
+
+
+def compact(row):
+    """Search row -> the shape results.html and the JSON API use."""
+    return {
+        "barberId": row["id"],
+        "name": row.get("name"),
+        "profession": row.get("profession"),
+        # results.html uses b.location → map from address
+        "location": row.get("address") or "",
+        "media_url": row.get("photo_url"),
+        "plan": row.get("plan"),
+        "next_open": row.get("next_open"),
+    }
+
+
+class SearchCache:
+    def __init__(self, cache, searcher, ttl=SEARCH_CACHE_TTL, page_size=SEARCH_PAGE_SIZE):
+        """
+        searcher(city, service, limit=, offset=[, sort=, now=, available_today=])
+        -> ranked rows (db.search_barbers). The availability keywords are only
+        passed when a search sorts or filters on availability.
+        """
+        self.cache = cache
+        self.searcher = searcher
+        self.ttl = ttl
+        self.page_size = page_size
+        self.seed_queries = parse_warm_queries(os.getenv("SEARCH_WARM_QUERIES"))
+
+        self._lock = threading.Lock()
+        self._popular = Counter()
+        self._warmer = None
+        self._stats = {"hits": 0, "misses": 0, "warmed": 0}
+
+    # ---------------------------------------------------------
+    # Public
+    # ---------------------------------------------------------
+    def get_page(self, city, service, page=1, sort="relevance", available_today=False):
+        """
+        (barbers, has_more) for one results page, cached.
+        sort="earliest" orders by next open slot; available_today keeps only
+        barbers with an open slot left today.
+        """
+        city, service = normalize(city), normalize(service)
+        sort = "earliest" if sort == "earliest" else "relevance"
+        available_today = bool(available_today)
+        if sort == "relevance" and not available_today:
+            key = self._key(city, service, page)
+        else:
+            # "today" is part of the question, so part of the key
+            today = datetime.now(timezone.utc).date().isoformat()
+            key = self._key(city, service, page, f"{sort}|{today if available_today else ''}", availability=True)
+
+        self._count(city, service)
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            self._incr("hits")
+            return entry["barbers"], entry["has_more"]
+
+        self._incr("misses")
+        entry = self._compute(city, service, page, sort, available_today)
+        self.cache.set(key, entry, timeout=self.ttl)
+        return entry["barbers"], entry["has_more"]
+
+    def invalidate(self):
+        """Orphan every cached page (call after any barber search-field change)."""
+        gens.bump(self.cache, self._gen_key())
+
+    def invalidate_availability(self):
+        """Orphan availability-sorted/filtered pages after next open slots changed."""
+        gens.bump(self.cache, self._avail_gen_key())
+
+    def popular(self, n=SEARCH_WARM_TOP):
+        """Configured warm queries first, then this worker's most requested."""
+        with self._lock:
+            ranked = [q for q, _ in self._popular.most_common(n)]
+        queries = list(self.seed_queries)
+        queries += [q for q in ranked if q not in queries]
+        return queries[:max(n, len(self.seed_queries))]
+
+    def warm(self, queries=None):
+        """Precompute page 1 for each (city, service) that is not cached yet."""
+        warmed = 0
+        for city, service in queries if queries is not None else self.popular():
+            key = self._key(city, service, 1)
+            if self.cache.get(key) is not None:
+                continue
+            try:
+                self.cache.set(key, self._compute(city, service, 1), timeout=self.ttl)
+                warmed += 1
+            except Exception as e:
+                logger.warning(f"Search warm failed for {city!r}/{service!r}: {e}")
+        self._incr("warmed", warmed)
+        return warmed
+
+    def start_warmer(self, interval=SEARCH_WARM_INTERVAL):
+        """Warm now and then every `interval` seconds in a daemon thread (0 disables)."""
+        if interval <= 0 or self._warmer is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.warm()
+                except Exception as e:
+                    logger.warning(f"Search warmer iteration failed: {e}")
+                time.sleep(interval)
+
+        self._warmer = threading.Thread(target=loop, name="search-warmer", daemon=True)
+        self._warmer.start()
+
+    def generation(self):
+        """Current search generation (changes on every invalidate())."""
+        return gens.current(self.cache, self._gen_key())
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    # ---------------------------------------------------------
+    # Internals
+    # ---------------------------------------------------------
+    def _count(self, city, service):
+        """Count a search for popular(); memory stays bounded by SEARCH_POPULAR_MAX."""
+        with self._lock:
+            self._popular[(city, service)] += 1
+            if len(self._popular) > SEARCH_POPULAR_MAX:
+                # Keep the top half, halved, so old favourites decay and new
+                # searches can climb past them
+                keep = self._popular.most_common(SEARCH_POPULAR_MAX // 2)
+                self._popular = Counter({q: max(1, n // 2) for q, n in keep})
+
+    def _incr(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _compute(self, city, service, page, sort="relevance", available_today=False):
+        extra = {}
+        if sort != "relevance" or available_today:
+            extra = {"sort": sort, "now": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M"),
+                     "available_today": available_today}
+        # One extra row tells us whether there is a next page
+        rows = self.searcher(
+            city, service, limit=self.page_size + 1, offset=(page - 1) * self.page_size, **extra
+        ) or []
+        return {
+            "barbers": [compact(r) for r in rows[:self.page_size]],
+            "has_more": len(rows) > self.page_size,
+        }
+
+    def _gen_key(self):
+        return "search_gen"
+
+    def _avail_gen_key(self):
+        return "search_avail_gen"
+
+    def _key(self, city, service, page, flags="", availability=False):
+        # Only pages sorted/filtered by next open slot follow the availability
+        # generation; relevance pages survive bookings
+        gen = self.generation()
+        if availability:
+            gen = gens.join(gen, gens.current(self.cache, self._avail_gen_key()))
+        return f"search:v{gen}:{city}|{service}|{page}" + (f"|{flags}" if flags else "")
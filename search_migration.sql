@@ -0,0 +1,65 @@
+-- Migration: indexed, server-ranked barber search (find_pro)
+-- Run this in your Supabase SQL Editor
+--
+-- find_pro used to run ilike('%city%') / ilike('%service%') over `barbers`.
+-- A leading-wildcard pattern can't use a B-tree, so each search scanned the
+-- whole table and then sorted by plan in Python.
+--
+-- Trigram GIN indexes let Postgres answer the same substring matches from an
+-- index. search_barbers() ranks on the server (premium first, then closest
+-- address match, then name), pages with LIMIT/OFFSET and returns only the
+-- columns the results page needs.
+
+create extension if not exists pg_trgm;
+
+create index if not exists barbers_address_trgm_idx
+  on barbers using gin (address gin_trgm_ops);
+
+create index if not exists barbers_profession_trgm_idx
+  on barbers using gin (profession gin_trgm_ops);
+
+
+-- Escape LIKE wildcards so user input is matched literally
+create or replace function search_like_pattern(p_term text)
+returns text
+language sql
+immutable
+as $$
+  select '%' || replace(replace(replace(btrim(p_term), '\', '\\'), '%', '\%'), '_', '\_') || '%';
+$$;
+
+
+create or replace function search_barbers(
+  p_city text,
+  p_service text default null,
+  p_limit int default 20,
+  p_offset int default 0
+)
+returns table (
+  id text,
+  name text,
+  profession text,
+  address text,
+  photo_url text,
+  plan text
+)
+language sql
+stable
+as $$
+  select b.id::text,
+         b.name::text,
+         b.profession::text,
+         b.address::text,
+         b.photo_url::text,
+         b.plan::text
+    from barbers b
+   where b.address ilike search_like_pattern(p_city)
+     and (coalesce(btrim(p_service), '') = ''
+          or b.profession ilike search_like_pattern(p_service))
+   order by (b.plan = 'premium') desc nulls last,
+            similarity(b.address, p_city) desc,
+            b.name asc nulls last,
+            b.id
+   limit least(greatest(coalesce(p_limit, 20), 1), 100)
+  offset greatest(coalesce(p_offset, 0), 0);
+$$;
@@ -0,0 +1,151 @@
+"""
+Single-flight coalescing for cache misses.
+
+When many requests miss the same cache key at once, only one of them (the
+leader) runs the expensive computation; the rest wait for its result.
+
+- In-process: a lock map of key -> pending call (works with SimpleCache and
+  also coalesces threads inside one worker when Redis is used).
+- Across processes (RedisCache): the leader takes a short `SET NX` lease;
+  other workers poll the cache until the leader has written the value.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from cachelib.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.ok = False
+
+
+class SingleFlight:
+    def __init__(self, cache, lease_ttl=10, wait_timeout=5.0, poll_interval=0.05):
+        self.cache = cache
+        self.lease_ttl = lease_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {
+            "leader": 0,             # computations actually run
+            "coalesced_local": 0,    # waited on a leader in this process
+            "coalesced_remote": 0,   # waited on a leader in another process
+            "wait_timeouts": 0,      # gave up waiting and computed anyway
+            "leader_errors": 0,      # leader failed; the waiter computed itself
+        }
+
+    # ---------------------------------------------------------
+    # Public
+    # ---------------------------------------------------------
+    def do(self, key, fn, recheck):
+        """
+        Run fn() once per key across concurrent callers.
+        recheck() should return the cached value (or None); it is used by
+        callers that lost the Redis lease.
+        Returns (result, was_leader).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if not call.event.wait(self.wait_timeout):
+                self._incr("wait_timeouts")
+            elif call.ok:
+                self._incr("coalesced_local")
+                return call.result, False
+            else:
+                self._incr("leader_errors")
+            return self._compute(fn), True
+
+        try:
+            call.result, was_leader = self._lead(key, fn, recheck)
+            call.ok = True
+            return call.result, was_leader
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    # ---------------------------------------------------------
+    # Internals
+    # ---------------------------------------------------------
+    def _incr(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _compute(self, fn):
+        self._incr("leader")
+        return fn()
+
+    def _redis(self):
+        backend = getattr(self.cache, "cache", None)
+        if isinstance(backend, RedisCache):
+            return backend
+        return None
+
+    def _lead(self, key, fn, recheck):
+        backend = self._redis()
+        if backend is None:
+            return self._compute(fn), True
+
+        lease_key = f"{backend.key_prefix}lease:{key}"
+        token = uuid.uuid4().hex
+        client = backend._write_client
+
+        try:
+            acquired = client.set(lease_key, token, nx=True, ex=self.lease_ttl)
+        except Exception as e:
+            logger.warning(f"Single-flight lease unavailable ({e}); computing directly")
+            return self._compute(fn), True
+
+        if acquired:
+            try:
+                return self._compute(fn), True
+            finally:
+                try:
+                    if client.get(lease_key) == token.encode():
+                        client.delete(lease_key)
+                except Exception:
+                    pass  # lease expires on its own
+
+        # Another worker holds the lease: wait for its result to land in the cache
+        deadline = time.monotonic() + self.wait_timeout
+        leader_gone = False
+        while time.monotonic() < deadline:
+            value = recheck()
+            if value is not None:
+                self._incr("coalesced_remote")
+                return value, False
+            try:
+                if not client.exists(lease_key):
+                    leader_gone = True
+                    break
+            except Exception:
+                break
+            time.sleep(self.poll_interval)
+
+        value = recheck()
+        if value is not None:
+            self._incr("coalesced_remote")
+            return value, False
+
+        # Lease released without a cached value: the leader failed
+        self._incr("leader_errors" if leader_gone else "wait_timeouts")
+        return self._compute(fn), True
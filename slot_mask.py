@@ -0,0 +1,44 @@
+"""
+Optional NumPy backend for slot filtering.
+
+A day is a minute-resolution boolean array. Busy intervals are painted with
+slicing and a slot start is free when the cumulative-sum window over
+[start, start + duration) contains no busy minutes.
+
+Same contract as intervals.free_starts, so AvailabilityService can swap
+backends without changing _calculate_slots output. If NumPy is not
+installed, HAS_NUMPY is False and callers should use the pure-Python sweep.
+"""
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover - depends on environment
+    np = None
+    HAS_NUMPY = False
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def free_starts_vectorized(candidates, duration, merged_busy):
+    """
+    Return the candidate starts whose [start, start + duration) window has no
+    busy minute. Accepts the same arguments as intervals.free_starts.
+    """
+    if not candidates:
+        return []
+
+    duration = int(duration)
+    horizon = max(MINUTES_PER_DAY, candidates[-1] + duration)
+
+    # 1. Paint busy minutes
+    busy = np.zeros(horizon, dtype=np.bool_)
+    for b_start, b_end in merged_busy:
+        busy[max(b_start, 0):min(b_end, horizon)] = True
+
+    # 2. Window test via cumulative sum (csum[i] = busy minutes before i)
+    csum = np.concatenate(([0], np.cumsum(busy, dtype=np.int32)))
+    starts = np.asarray(candidates, dtype=np.int32)
+    booked = csum[starts + duration] - csum[starts]
+
+    return starts[booked == 0].tolist()
+
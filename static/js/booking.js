@@ -158,6 +158,7 @@
           .cal-cell.disabled { opacity: 0.3; cursor: not-allowed; }
           .cal-cell.selected { background: #0ea5e9; color: #fff; }
           .cal-cell.today { font-weight: bold; border: 1px solid #0ea5e9; }
+          .cal-cell.full { text-decoration: line-through; color: #94a3b8; }
           .cal-weekday { font-size: 0.8rem; color: #64748b; font-weight: 600; padding-bottom: 5px; }
           .cal-btn { background: none; border: none; cursor: pointer; font-size: 1.2rem; color: #0ea5e9; padding: 0 10px; }
         </style>
@@ -259,8 +260,35 @@
         };
       }
 
+      cell.dataset.iso = iso;
       grid.appendChild(cell);
     }
+
+    markFullDays(y, m, todayMs, maxDate);
+  }
+
+  // One request for the whole visible month instead of one per day
+  async function markFullDays(y, m, todayMs, maxDate) {
+    const first = new Date(Math.max(new Date(y, m, 1).getTime(), todayMs));
+    const last = new Date(Math.min(new Date(y, m + 1, 0).getTime(), maxDate.getTime()));
+    if (first > last || !BARBER.barberId) return;
+
+    try {
+      const res = await fetch(`/api/public/slots/${BARBER.barberId}/range?start=${toISODate(first)}&end=${toISODate(last)}`);
+      if (!res.ok) return;
+      const days = await res.json();
+
+      // User may have navigated to another month meanwhile
+      if (calendarState.viewYear !== y || calendarState.viewMonth !== m) return;
+
+      Object.entries(days).forEach(([iso, slots]) => {
+        if (slots && slots.length) return;
+        const cell = document.querySelector(`#calGrid .cal-cell[data-iso="${iso}"]`);
+        if (cell) cell.classList.add("full");
+      });
+    } catch (err) {
+      console.warn("Could not load month availability:", err);
+    }
   }
 
   // ================= RENDER TIMES =================
@@ -66,11 +66,18 @@ document.addEventListener("DOMContentLoaded", () => {
   const calendarModal = document.getElementById("calendarModal");
   let cachedAppointments = [];
 
+  const pad2 = (n) => String(n).padStart(2, "0");
+
   window.openCalendar = function () {
     if (calendarModal) {
       calendarModal.classList.add("active");
-      // Fetch latest appointments
-      fetch("/api/barber/appointments")
+      // Fetch only the month the calendar shows
+      const now = new Date();
+      const y = now.getFullYear();
+      const m = now.getMonth();
+      const first = `${y}-${pad2(m + 1)}-01`;
+      const last = `${y}-${pad2(m + 1)}-${pad2(new Date(y, m + 1, 0).getDate())}`;
+      fetch(`/api/barber/appointments?start_date=${first}&end_date=${last}`)
         .then(r => r.json())
         .then(data => {
           cachedAppointments = data;
@@ -483,6 +490,7 @@ document.addEventListener("DOMContentLoaded", () => {
         }
       })
         .then(r => r.json().catch(() => ({ ok: false, error: "Invalid response" })))
+        .then(res => (res.ok && res.status_url) ? waitForMediaJob(res.status_url) : res)
         .then(res => {
           if (res.ok || res.success) {
             showToast(successMsg || "Upload success!");
@@ -553,6 +561,22 @@ document.addEventListener("DOMContentLoaded", () => {
     });
   }
 
+  // Uploads are resized in the background; poll until the variants are live
+  function waitForMediaJob(statusUrl, attempts = 60) {
+    return fetch(statusUrl, { headers: { "Accept": "application/json" } })
+      .then(r => r.json())
+      .then(job => {
+        if (job.status === "processing" && attempts > 1) {
+          return new Promise(resolve => setTimeout(resolve, 1000))
+            .then(() => waitForMediaJob(statusUrl, attempts - 1));
+        }
+        if (job.status !== "done") {
+          return { ok: false, error: job.error || "Processing timed out" };
+        }
+        return job;
+      });
+  }
+
   handleUpload("photoInput", "/upload-photo", "Profile photo updated!");
   handleUpload("mediaInput", "/upload-media", "Media uploaded successfully!");
 
@@ -644,6 +668,82 @@ document.addEventListener("DOMContentLoaded", () => {
     });
   }
 
+  // Upcoming list: next page on demand (cursor from the server-rendered page)
+  const loadMoreBtn = document.getElementById("loadMoreAppts");
+  const apptRows = document.getElementById("apptRows");
+
+  function apptRow(a) {
+    const tr = document.createElement("tr");
+
+    const client = document.createElement("td");
+    client.dataset.label = "Client";
+    client.textContent = a.client_name || "Unknown";
+
+    const phone = document.createElement("td");
+    phone.dataset.label = "Phone";
+    const tel = document.createElement("a");
+    tel.href = `tel:${a.client_phone || ""}`;
+    tel.textContent = a.client_phone || "";
+    phone.appendChild(tel);
+
+    const when = document.createElement("td");
+    when.dataset.label = "When";
+    const day = document.createElement("div");
+    day.style.fontWeight = "600";
+    day.textContent = a.date;
+    const time = document.createElement("div");
+    time.className = "muted small";
+    time.textContent = a.start_time;
+    when.append(day, time);
+
+    const status = document.createElement("td");
+    status.dataset.label = "Status";
+    const badge = document.createElement("span");
+    badge.className = `status-badge status-${a.status}`;
+    badge.textContent = a.status;
+    status.appendChild(badge);
+
+    const actions = document.createElement("td");
+    actions.dataset.label = "Actions";
+    actions.style.textAlign = "right";
+    if (a.status === "booked") {
+      const cancel = document.createElement("button");
+      cancel.className = "cancel-btn";
+      cancel.title = "Cancel Appointment";
+      cancel.textContent = "Cancel";
+      cancel.onclick = () => window.cancelAppointment(a.id, cancel);
+      actions.appendChild(cancel);
+    }
+
+    tr.append(client, phone, when, status, actions);
+    return tr;
+  }
+
+  if (loadMoreBtn && apptRows) {
+    loadMoreBtn.addEventListener("click", () => {
+      const cursor = loadMoreBtn.dataset.cursor;
+      if (!cursor) return;
+      loadMoreBtn.disabled = true;
+
+      fetch(`/api/barber/appointments?limit=25&include_cancelled=1&cursor=${encodeURIComponent(cursor)}`)
+        .then(r => r.json())
+        .then(res => {
+          (res.appointments || []).forEach(a => apptRows.appendChild(apptRow(a)));
+          if (res.next_cursor) {
+            loadMoreBtn.dataset.cursor = res.next_cursor;
+            loadMoreBtn.disabled = false;
+          } else {
+            loadMoreBtn.remove();
+          }
+        })
+        .catch(err => {
+          console.error("Failed to load more appointments", err);
+          showToast("Could not load more appointments.");
+          loadMoreBtn.disabled = false;
+        });
+    });
+  }
+
   // Cancel Appointment Logic
   window.cancelAppointment = function (apptId, btn) {
     if (!apptId || !btn) return;
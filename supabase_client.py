@@ -1,13 +1,89 @@
-from supabase import create_client
+"""
+Single factory for Supabase clients.
+
+app.py and db.py both import `supabase` / `supabase_admin` from here, so
+every PostgREST and Storage call shares one keep-alive httpx pool per
+process (per gunicorn worker) instead of each client opening its own
+connections and TLS sessions.
+
+Tuning (env):
+  SUPABASE_POOL_SIZE        max open connections per worker (default 20)
+  SUPABASE_POOL_KEEPALIVE   idle keep-alive connections kept (default 10)
+  SUPABASE_TIMEOUT          read/write timeout in seconds (default 15)
+  SUPABASE_CONNECT_TIMEOUT  connect timeout in seconds (default 5)
+  SUPABASE_HTTP2            "1"/"0"; default on when the h2 package is installed
+"""
 import os
 
+import httpx
+from supabase import create_client, acreate_client, Client, AsyncClient, ClientOptions, AsyncClientOptions
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", 20))
+POOL_KEEPALIVE = int(os.getenv("SUPABASE_POOL_KEEPALIVE", 10))
+TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", 15))
+CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", 5))
+
+
+def _http2_enabled():
+    flag = os.getenv("SUPABASE_HTTP2")
+    if flag is not None and flag.strip().lower() in ("0", "false", "no", "off"):
+        return False
+    try:
+        import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        return True
+    except ImportError:
+        return False
+
+
+def _pool_settings():
+    return {
+        "http2": _http2_enabled(),
+        "limits": httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=POOL_KEEPALIVE,
+        ),
+        "timeout": httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+        "follow_redirects": True,
+    }
+
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+def build_http_client():
+    """Persistent keep-alive pool shared by every Supabase client in this process."""
+    return httpx.Client(**_pool_settings())
+
+
+http_client = build_http_client()
+
+
+def get_client(key) -> Client:
+    """Build a Supabase client for `key` on the shared connection pool."""
+    options = ClientOptions(
+        httpx_client=http_client,
+        postgrest_client_timeout=TIMEOUT,
+    )
+    return create_client(SUPABASE_URL, key, options=options)
+
+
+async def get_async_client(key) -> AsyncClient:
+    """
+    Async client with its own httpx.AsyncClient pool (same tuning).
+    An AsyncClient is bound to the event loop it is first used on, so
+    callers keep one per loop (see db_async).
+    """
+    options = AsyncClientOptions(
+        httpx_client=httpx.AsyncClient(**_pool_settings()),
+        postgrest_client_timeout=TIMEOUT,
+    )
+    return await acreate_client(SUPABASE_URL, key, options=options)
+
+
+supabase = get_client(SUPABASE_KEY)
 
 # Server-side admin client (service role)
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 supabase_admin = None
 if SUPABASE_SERVICE_ROLE_KEY:
-    supabase_admin = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    supabase_admin = get_client(SUPABASE_SERVICE_ROLE_KEY)
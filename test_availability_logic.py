@@ -6,6 +6,8 @@ from unittest.mock import MagicMock, patch
 os.environ["SUPABASE_URL"] = "https://example.supabase.co"
 os.environ["SUPABASE_KEY"] = "fake-key"
 
+from flask import Flask
+from flask_caching import Cache
 from availability import AvailabilityService
 
 class TestAvailabilityLogic(unittest.TestCase):
@@ -78,5 +80,320 @@ class TestAvailabilityLogic(unittest.TestCase):
             # 11:00 is booked (format 2).
             self.assertEqual(slots, ["09:00"], f"Expected 09:00 only. Got {slots}")
 
+    def test_range_batches_fetches(self):
+        hours = [
+            {"weekday": "mon", "start_time": "09:00", "end_time": "11:00", "is_closed": False},
+            {"weekday": "tue", "start_time": "09:00", "end_time": "11:00", "is_closed": True},
+        ]
+        overrides = [{"date": "2024-01-01", "start_time": "10:00", "end_time": "11:00", "is_closed": False}]
+        appts = [{"date": "2024-01-08", "start_time": "09:00", "end_time": "10:00", "status": "booked"}]
+
+        with patch('db.get_weekly_hours_raw', return_value=hours) as m_hours, \
+             patch('db.get_date_overrides_range_raw', return_value=overrides) as m_ov, \
+             patch('db.get_appointments_range_raw', return_value=appts) as m_appts:
+
+            # 2024-01-01 .. 2024-01-09 (Mon .. Tue)
+            res = self.service.get_availability_range("barber1", "2024-01-01", "2024-01-09", 60)
+            days = res["days"]
+
+            self.assertEqual(m_hours.call_count, 1)
+            self.assertEqual(m_ov.call_count, 1)
+            self.assertEqual(m_appts.call_count, 1)
+
+            self.assertEqual(len(days), 9)
+            self.assertEqual(days["2024-01-01"], ["10:00"])  # override
+            self.assertEqual(days["2024-01-02"], [])  # closed tuesday
+            self.assertEqual(days["2024-01-08"], ["10:00"])  # 09:00 booked
+
+    def test_range_rejects_reversed_dates(self):
+        with self.assertRaises(ValueError):
+            self.service.get_availability_range("barber1", "2024-01-09", "2024-01-01", 60)
+    def test_concurrent_fetch_mode_uses_async_bridge(self):
+        service = AvailabilityService(self.mock_cache, fetch_mode="concurrent")
+        hours = [{"weekday": "mon", "start_time": "09:00", "end_time": "11:00", "is_closed": False}]
+
+        with patch('db_async.fetch_day_inputs_sync', return_value=(hours, [], [])) as m_fetch, \
+             patch('db.get_weekly_hours_raw') as m_sync:
+            res = service.get_availability("barber1", "2023-12-25", 60)
+
+        m_fetch.assert_called_once_with("barber1", "2023-12-25")
+        m_sync.assert_not_called()
+        self.assertEqual(res["slots"], ["09:00", "10:00"])
+
+    def test_sql_engine_uses_rpc(self):
+        service = AvailabilityService(self.mock_cache, engine="sql")
+        open_days = {"2024-01-01": ["10:00"], "2024-01-03": ["09:00", "10:00"]}
+
+        with patch('db.get_open_slots_range', return_value=open_days) as m_rpc, \
+             patch('db.get_weekly_hours_raw') as m_hours:
+            day = service.get_availability("barber1", "2024-01-03", 60)
+            res = service.get_availability_range("barber1", "2024-01-01", "2024-01-03", 60)
+
+        m_hours.assert_not_called()
+        m_rpc.assert_any_call("barber1", "2024-01-03", "2024-01-03", 60)
+        m_rpc.assert_called_with("barber1", "2024-01-01", "2024-01-03", 60)
+        self.assertEqual(day["slots"], ["09:00", "10:00"])
+        self.assertEqual(res["days"], {"2024-01-01": ["10:00"], "2024-01-02": [], "2024-01-03": ["09:00", "10:00"]})
+
+
+class TestAsyncFetchers(unittest.TestCase):
+    def test_reads_run_concurrently(self):
+        import asyncio
+        import time
+        import db_async
+
+        class FakeQuery:
+            def __init__(self, rows):
+                self.rows = rows
+            def select(self, *a):
+                return self
+            def eq(self, *a):
+                return self
+            async def execute(self):
+                await asyncio.sleep(0.2)
+                return MagicMock(data=self.rows)
+
+        fake_client = MagicMock()
+        fake_client.table.side_effect = lambda name: FakeQuery([{"table": name}])
+
+        async def fake_get_client():
+            return fake_client
+
+        with patch('db_async.get_client', side_effect=fake_get_client):
+            t0 = time.monotonic()
+            hours, overrides, appts = db_async.fetch_day_inputs_sync("barber1", "2023-12-25")
+            elapsed = time.monotonic() - t0
+
+        self.assertEqual(hours, [{"table": "barber_weekly_hours"}])
+        self.assertEqual(overrides, [{"table": "schedule_overrides"}])
+        self.assertEqual(appts, [{"table": "appointments"}])
+        self.assertLess(elapsed, 0.5)  # sequential would be >= 0.6s
+
+    def test_concurrent_first_calls_share_one_client(self):
+        import asyncio
+        import db_async
+
+        created = []
+
+        async def slow_create(key):
+            await asyncio.sleep(0.05)
+            created.append(MagicMock())
+            return created[-1]
+
+        async def first_calls():
+            return await asyncio.gather(*(db_async.get_client() for _ in range(3)))
+
+        with patch('db_async.get_async_client', side_effect=slow_create):
+            clients = asyncio.run(first_calls())
+
+        self.assertEqual(len(created), 1)
+        self.assertTrue(all(c is created[0] for c in clients))
+
+
+class TestAvailabilityInvalidation(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        self.cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+        self.service = AvailabilityService(self.cache)
+        self.hours = [{"weekday": "mon", "start_time": "09:00", "end_time": "12:00", "is_closed": False}]
+
+    def _get(self, duration, appts):
+        with patch('db.get_weekly_hours_raw', return_value=self.hours), \
+             patch('db.get_date_override_raw', return_value=[]), \
+             patch('db.get_appointments_raw', return_value=appts):
+            return self.service.get_availability("barber1", "2030-01-07", duration)
+
+    def test_invalidate_covers_any_duration(self):
+        # 20 and 120 were never in the old hard-coded duration list
+        for duration in (20, 120):
+            self.assertFalse(self._get(duration, [])["cached"])
+            self.assertTrue(self._get(duration, [])["cached"])
+
+        self.service.invalidate_day("barber1", "2030-01-07")
+
+        booked = [{"start_time": "09:00", "end_time": "11:00", "status": "booked"}]
+        res = self._get(120, booked)
+        self.assertFalse(res["cached"])
+        self.assertEqual(res["slots"], [])
+        self.assertFalse(self._get(20, booked)["cached"])
+
+    def test_invalidation_is_per_barber(self):
+        self._get(60, [])
+        self.service.invalidate_barber("someone-else")
+        self.assertTrue(self._get(60, [])["cached"])
+
+    def test_concurrent_misses_are_coalesced(self):
+        import threading
+        import time
+
+        def slow_appts(*args):
+            time.sleep(0.2)
+            return []
+
+        results = []
+        with patch('db.get_weekly_hours_raw', return_value=self.hours), \
+             patch('db.get_date_override_raw', return_value=[]), \
+             patch('db.get_appointments_raw', side_effect=slow_appts) as m_appts:
+            threads = [
+                threading.Thread(target=lambda: results.append(
+                    self.service.get_availability("barber1", "2030-01-07", 60)))
+                for _ in range(8)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(m_appts.call_count, 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(r["slots"] == ["09:00", "10:00", "11:00"] for r in results))
+        self.assertEqual(self.service.stats()["single_flight"]["coalesced_local"], 7)
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        self.cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+        self.service = AvailabilityService(self.cache, soft_ttl=30)
+        self.hours = [{"weekday": "mon", "start_time": "09:00", "end_time": "12:00", "is_closed": False}]
+
+    def test_stale_entry_served_and_refreshed_in_background(self):
+        booked = [{"start_time": "09:00", "end_time": "10:00", "status": "booked"}]
+        with patch('db.get_weekly_hours_raw', return_value=self.hours), \
+             patch('db.get_date_override_raw', return_value=[]), \
+             patch('db.get_appointments_raw', side_effect=[[], booked]) as m_appts, \
+             patch('availability.time.time') as m_time:
+            m_time.return_value = 1000.0
+            first = self.service.get_availability("barber1", "2030-01-07", 60)
+            self.assertEqual(first["slots"], ["09:00", "10:00", "11:00"])
+
+            # Past the soft TTL: stale slots come back immediately...
+            m_time.return_value = 1031.0
+            stale = self.service.get_availability("barber1", "2030-01-07", 60)
+            self.assertTrue(stale["cached"])
+            self.assertEqual(stale["slots"], ["09:00", "10:00", "11:00"])
+
+            # ...and the background refresh replaces them
+            self.service._refresher.shutdown(wait=True)
+            self.assertEqual(m_appts.call_count, 2)
+            fresh = self.service.get_availability("barber1", "2030-01-07", 60)
+            self.assertEqual(fresh["slots"], ["10:00", "11:00"])
+            self.assertEqual(self.service.stats()["swr"]["refreshes"], 1)
+
+class TestBitmapStore(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        self.cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+        self.service = AvailabilityService(self.cache, store="bitmap")
+        self.hours = [{"weekday": "mon", "start_time": "09:00", "end_time": "12:00", "is_closed": False}]
+        self.appts = []
+
+    def _get(self, duration, date="2030-01-07"):
+        with patch('db.get_weekly_hours_raw', return_value=self.hours), \
+             patch('db.get_date_override_raw', return_value=[]), \
+             patch('db.get_appointments_raw', return_value=self.appts) as m_appts:
+            res = self.service.get_availability("barber1", date, duration)
+        return res, m_appts.call_count
+
+    def test_one_fetch_serves_every_duration(self):
+        res, fetches = self._get(60)
+        self.assertEqual(res["slots"], ["09:00", "10:00", "11:00"])
+        self.assertEqual(fetches, 1)
+
+        for duration, expected in ((30, 6), (45, 4), (90, 2)):
+            res, fetches = self._get(duration)
+            self.assertTrue(res["cached"])
+            self.assertEqual(fetches, 0)
+            self.assertEqual(len(res["slots"]), expected)
+
+    def test_booking_updates_bitmap_without_fetch(self):
+        self._get(60)
+        self.service.record_booking("barber1", "2030-01-07", "10:00", "10:30")
+
+        res, fetches = self._get(30)
+        self.assertEqual(fetches, 0)
+        self.assertEqual(res["slots"], ["09:00", "09:30", "10:30", "11:00", "11:30"])
+
+    def test_bitmap_changes_expire_off_grid_slot_lists(self):
+        # 42 minutes is off the bitmap grid, so it is served from a cached slot list
+        self.assertEqual(self._get(42)[0]["slots"], ["09:00", "09:42", "10:24", "11:06"])
+        self.assertTrue(self._get(42)[0]["cached"])
+
+        self.appts = [{"start_time": "09:00", "end_time": "09:42", "status": "booked"}]
+        self.service.record_booking("barber1", "2030-01-07", "09:00", "09:42")
+        res, fetches = self._get(42)
+        self.assertFalse(res["cached"])
+        self.assertEqual(res["slots"], ["09:42", "10:24", "11:06"])
+
+        self.appts = []
+        with patch('db.get_weekly_hours_raw', return_value=self.hours), \
+             patch('db.get_date_override_raw', return_value=[]), \
+             patch('db.get_appointments_raw', return_value=[]):
+            self.service.invalidate_day("barber1", "2030-01-07")
+        self.assertEqual(self._get(42)[0]["slots"], ["09:00", "09:42", "10:24", "11:06"])
+
+    def test_cancel_rebuilds_day(self):
+        self.appts = [{"start_time": "10:00", "end_time": "11:00", "status": "booked"}]
+        self.assertEqual(self._get(60)[0]["slots"], ["09:00", "11:00"])
+
+        self.appts = [{"start_time": "10:00", "end_time": "11:00", "status": "cancelled"}]
+        with patch('db.get_weekly_hours_raw', return_value=self.hours), \
+             patch('db.get_date_override_raw', return_value=[]), \
+             patch('db.get_appointments_raw', return_value=self.appts):
+            self.service.invalidate_day("barber1", "2030-01-07")
+
+        res, fetches = self._get(60)
+        self.assertEqual(fetches, 0)
+        self.assertEqual(res["slots"], ["09:00", "10:00", "11:00"])
+
+    def test_open_ended_booking_uses_queried_duration(self):
+        self.appts = [{"start_time": "10:00", "end_time": None, "status": "booked"}]
+        self.assertEqual(self._get(30)[0]["slots"], ["09:00", "09:30", "10:30", "11:00", "11:30"])
+        self.assertEqual(self._get(60)[0]["slots"], ["09:00", "11:00"])
+
+    def test_off_grid_duration_falls_back(self):
+        # 42 minutes does not fit 5-minute units: minute-exact path is used
+        res, _ = self._get(42)
+        self.assertEqual(res["slots"], ["09:00", "09:42", "10:24", "11:06"])
+
+    def test_matches_calculated_slots(self):
+        import random
+        rnd = random.Random(3)
+        plain = AvailabilityService(MagicMock())
+        for i in range(200):
+            duration = rnd.choice([15, 20, 30, 45, 60, 90])
+            open_m = rnd.randrange(360, 720, 5)
+            close_m = rnd.randrange(open_m, 1440, 5)
+            hours = [{"weekday": "mon", "start_time": f"{open_m // 60:02d}:{open_m % 60:02d}",
+                      "end_time": f"{close_m // 60:02d}:{close_m % 60:02d}", "is_closed": False}]
+            appts = []
+            for _ in range(rnd.randint(0, 8)):
+                s = rnd.randrange(300, 1380)
+                end = rnd.choice([s + rnd.choice([10, 30, 60]), None])
+                appts.append({
+                    "start_time": f"{s // 60:02d}:{s % 60:02d}",
+                    "end_time": end and f"{end // 60:02d}:{end % 60:02d}",
+                    "status": rnd.choice(["booked", "cancelled"]),
+                })
+
+            record = self.service._bitmap_record("2030-01-07", hours, [], appts)
+            self.assertEqual(
+                self.service._slots_from_bitmap("2030-01-07", record, duration),
+                plain._calculate_slots("2030-01-07", hours, [], appts, duration),
+            )
+
+    def test_range_reads_bitmaps(self):
+        with patch('db.get_weekly_hours_raw', return_value=self.hours), \
+             patch('db.get_date_overrides_range_raw', return_value=[]) as m_ov, \
+             patch('db.get_appointments_range_raw', return_value=[]):
+            first = self.service.get_availability_range("barber1", "2030-01-07", "2030-01-08", 60)
+            second = self.service.get_availability_range("barber1", "2030-01-07", "2030-01-08", 30)
+
+        self.assertEqual(m_ov.call_count, 1)
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+        self.assertEqual(first["days"], {"2030-01-07": ["09:00", "10:00", "11:00"], "2030-01-08": []})
+        self.assertEqual(len(second["days"]["2030-01-07"]), 6)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,201 @@
+import os
+import random
+import unittest
+import uuid
+import datetime
+from unittest.mock import MagicMock
+
+# Mock env vars BEFORE imports to satisfy supabase_client
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "fake-key")
+
+from availability import AvailabilityService
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+# Parity between the SQL engine (availability_rpc.sql) and the Python engine
+# (AvailabilityService._calculate_slots). Needs a throwaway Postgres, e.g.
+#   TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest test_availability_parity.py
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+MIGRATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "availability_rpc.sql")
+
+# Minimal copies of the production tables. Time columns deliberately mix
+# `time` and `text` so both value shapes PostgREST can return are covered.
+SCHEMA = """
+create table barbers (id uuid primary key, slot_duration int);
+create table barber_weekly_hours (
+  barber_id uuid, weekday text, start_time time, end_time time, is_closed boolean
+);
+create table schedule_overrides (
+  barber_id uuid, date text, start_time text, end_time text, is_closed boolean
+);
+create table appointments (
+  barber_id uuid, date text, start_time text, end_time text, status text
+);
+"""
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+DURATIONS = [15, 20, 30, 45, 60, 90]
+START_DATE = datetime.date(2030, 1, 7)  # a Monday, far from "today"
+DAYS = 21
+ROUNDS = 40
+
+
+def _hhmm(mins, seconds=False):
+    s = f"{mins // 60:02d}:{mins % 60:02d}"
+    return s + ":00" if seconds else s
+
+
+def _text_time(rng, mins, day):
+    # Every shape to_minutes accepts: HH:MM, HH:MM:SS, ISO datetime
+    shape = rng.choice(["hhmm", "hhmmss", "iso"])
+    if shape == "iso":
+        return f"{day.isoformat()}T{_hhmm(mins, seconds=True)}"
+    return _hhmm(mins, seconds=shape == "hhmmss")
+
+
+@unittest.skipUnless(psycopg and TEST_DATABASE_URL, "TEST_DATABASE_URL and psycopg required")
+class TestSqlPythonParity(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.conn = psycopg.connect(TEST_DATABASE_URL, autocommit=True)
+        cls.schema = f"availability_parity_{uuid.uuid4().hex[:8]}"
+        with cls.conn.cursor() as cur:
+            cur.execute(f"create schema {cls.schema}")
+            cur.execute(f"set search_path to {cls.schema}")
+            cur.execute(SCHEMA)
+            with open(MIGRATION) as f:
+                cur.execute(f.read())
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.conn.cursor() as cur:
+            cur.execute(f"drop schema {cls.schema} cascade")
+        cls.conn.close()
+
+    def setUp(self):
+        self.service = AvailabilityService(MagicMock())
+
+    def _seed(self, rng, barber_id):
+        duration = rng.choice(DURATIONS)
+        with self.conn.cursor() as cur:
+            cur.execute("insert into barbers values (%s, %s)", (barber_id, duration))
+
+            for wd in WEEKDAYS:
+                if rng.random() < 0.1:
+                    continue  # no row at all => closed
+                open_m = rng.randrange(6 * 60, 12 * 60, 5)
+                close_m = rng.randrange(open_m, 23 * 60, 5)
+                cur.execute(
+                    "insert into barber_weekly_hours values (%s, %s, %s, %s, %s)",
+                    (barber_id, wd, _hhmm(open_m), _hhmm(close_m), rng.random() < 0.15),
+                )
+
+            for i in range(DAYS):
+                day = START_DATE + datetime.timedelta(days=i)
+                if rng.random() < 0.2:
+                    open_m = rng.randrange(7 * 60, 14 * 60, 5)
+                    close_m = rng.randrange(open_m, 23 * 60 + 55, 5)
+                    cur.execute(
+                        "insert into schedule_overrides values (%s, %s, %s, %s, %s)",
+                        (
+                            barber_id, day.isoformat(),
+                            _text_time(rng, open_m, day), _text_time(rng, close_m, day),
+                            rng.random() < 0.3,
+                        ),
+                    )
+
+                for _ in range(rng.randrange(0, 6)):
+                    start_m = rng.randrange(6 * 60, 22 * 60, 5)
+                    end = rng.choice([
+                        _text_time(rng, start_m + rng.choice([10, 25, 30, 45, 60, 120]), day),
+                        _text_time(rng, start_m - 30, day),  # inverted: ignored by both
+                        None,
+                        "",
+                    ])
+                    cur.execute(
+                        "insert into appointments values (%s, %s, %s, %s, %s)",
+                        (
+                            barber_id, day.isoformat(), _text_time(rng, start_m, day), end,
+                            rng.choice(["booked", "booked", "cancelled", None]),
+                        ),
+                    )
+        return duration
+
+    def _rows(self, sql, barber_id):
+        # ::text casts reproduce the JSON strings PostgREST hands to Python
+        with self.conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+            cur.execute(sql, (barber_id,))
+            return cur.fetchall()
+
+    def _python_days(self, barber_id, duration):
+        hours = self._rows(
+            "select weekday, start_time::text as start_time, end_time::text as end_time, is_closed "
+            "from barber_weekly_hours where barber_id = %s", barber_id)
+        overrides = self._rows(
+            "select date, start_time, end_time, is_closed from schedule_overrides where barber_id = %s",
+            barber_id)
+        appts = self._rows(
+            "select date, start_time, end_time, status from appointments where barber_id = %s",
+            barber_id)
+
+        days = {}
+        for i in range(DAYS):
+            d = (START_DATE + datetime.timedelta(days=i)).isoformat()
+            days[d] = self.service._calculate_slots(
+                d, hours,
+                [o for o in overrides if o["date"] == d],
+                [a for a in appts if a["date"] == d],
+                duration,
+            )
+        return days
+
+    def _sql_days(self, barber_id, duration=None):
+        end = START_DATE + datetime.timedelta(days=DAYS - 1)
+        with self.conn.cursor() as cur:
+            cur.execute("select * from get_open_slots(%s, %s, %s, %s)", (barber_id, START_DATE, end, duration))
+            rows = cur.fetchall()
+        days = {(START_DATE + datetime.timedelta(days=i)).isoformat(): [] for i in range(DAYS)}
+        for slot_date, slot_time in rows:
+            days[slot_date].append(slot_time)
+        return days
+
+    def test_randomized_schedules_match(self):
+        seed = int(os.getenv("PARITY_SEED", random.randrange(1 << 30)))
+        rng = random.Random(seed)
+        for _ in range(ROUNDS):
+            barber_id = str(uuid.uuid4())
+            duration = self._seed(rng, barber_id)
+            expected = self._python_days(barber_id, duration)
+
+            # Duration from barbers.slot_duration and passed explicitly
+            self.assertEqual(self._sql_days(barber_id), expected, f"PARITY_SEED={seed}")
+            other = rng.choice(DURATIONS)
+            self.assertEqual(
+                self._sql_days(barber_id, other), self._python_days(barber_id, other), f"PARITY_SEED={seed}"
+            )
+
+    def test_today_drops_past_slots(self):
+        barber_id = str(uuid.uuid4())
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        with self.conn.cursor() as cur:
+            cur.execute("insert into barbers values (%s, %s)", (barber_id, 30))
+            cur.execute(
+                "insert into schedule_overrides values (%s, %s, %s, %s, %s)",
+                (barber_id, today.isoformat(), "00:00", "23:59", False),
+            )
+            cur.execute("select slot_time from get_open_slots(%s, %s, %s)", (barber_id, today, today))
+            sql_slots = [r[0] for r in cur.fetchall()]
+
+        py_slots = self.service._calculate_slots(
+            today.isoformat(), [], [{"start_time": "00:00", "end_time": "23:59", "is_closed": False}], [], 30
+        )
+        # Allow for the clock ticking over a minute between the two calls
+        self.assertLessEqual(len(set(sql_slots) ^ set(py_slots)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,73 +8,35 @@ os.environ["SUPABASE_URL"] = "https://example.supabase.co"
 os.environ["SUPABASE_KEY"] = "fake-key"
 os.environ["SECRET_KEY"] = "test-secret"
 
-from app import app
+from app import app, cache
 
 class BookingTestCase(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
         self.app.testing = True
+        # Barber settings are cached between requests; start each test cold
+        cache.clear()
 
-    @patch("app.supabase")
-    @patch("app.availability_service")
-    def test_booking_success(self, mock_avail, mock_supabase):
-        # Mock Barber Duration Fetch
-        # barber_res.data[0].get("slot_duration")
-        mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [{"slot_duration": 60}]
-        
-        # Mock Existing Appointments (Empty -> No Overlap)
-        # We need to be careful because multiple calls to supabase happen.
-        # 1. Barber fetch (for duration)
-        # 2. Existing appts fetch (for overlap)
-        # 3. Insert
-        
-        # Helper to side_effect the execute result based on table name or context could be hard.
-        # Simpler approach: verify the execute() call chain returns what we need sequentially.
-        
-        # We can use side_effect on the final .data property access if we mock the chain better,
-        # but supabase chain is .table().select().eq()...execute().data
-        
-        # Let's mock the execute return values logic
-        def execute_side_effect(*args, **kwargs):
-            # Create a mock result object
-            res = MagicMock()
-            # Default empty
-            res.data = []
-            
-            # Identify which query this is by looking at earlier calls in chain? 
-            # It's hard with standard mocks. 
-            # However, we can know the order of execution in the function.
-            # 1. barbers query (duration)
-            # 2. appointments query (overlap check)
-            # 3. appointments insert
-            return res
-
-        # Setup distinct return values for the sequence of execute() calls
-        # 1. Duration check -> return [{"slot_duration": 60}]
-        res1 = MagicMock()
-        res1.data = [{"slot_duration": 60}]
-        
-        # 2. Overlap check -> return [] (no overlap)
-        res2 = MagicMock()
-        res2.data = []
-        
-        # 3. Insert -> return [{"id": "new-id", ...}]
-        res3 = MagicMock()
-        res3.data = [{"id": "new-123", "status": "booked", "start_time": "10:00", "end_time": "11:00"}]
-        
-        # Apply side effect to the end of the chain... 
-        # Chain: table() -> select()/insert() -> eq()/etc -> execute()
-        # All intermediate methods return a builder.
-        # We mock the builder.
-        
+    def _barber_builder(self, mock_supabase):
+        # Only the barber settings lookup (slot_duration) still goes through app.supabase
+        res = MagicMock()
+        res.data = [{"slot_duration": 60}]
         builder = MagicMock()
         mock_supabase.table.return_value = builder
         builder.select.return_value = builder
-        builder.insert.return_value = builder
         builder.eq.return_value = builder
-        builder.neq.return_value = builder
-        
-        builder.execute.side_effect = [res1, res2, res3]
+        builder.execute.return_value = res
+        return builder
+
+    @patch("app.db.book_appointment")
+    @patch("app.supabase")
+    @patch("app.availability_service")
+    def test_booking_success(self, mock_avail, mock_supabase, mock_book):
+        self._barber_builder(mock_supabase)
+        mock_book.return_value = {
+            "status": "booked",
+            "appointment": {"id": "new-123", "status": "booked", "start_time": "10:00", "end_time": "11:00"},
+        }
 
         payload = {
             "barber_id": "barber-1",
@@ -91,23 +53,14 @@ class BookingTestCase(unittest.TestCase):
         self.assertEqual(resp.status_code, 201)
         data = resp.get_json()
         self.assertEqual(data["id"], "new-123")
-        
+        mock_avail.record_booking.assert_called_once_with("barber-1", "2024-01-01", "10:00", "11:00")
+
+    @patch("app.db.book_appointment")
     @patch("app.supabase")
-    def test_booking_overlap_exact(self, mock_supabase):
-        # 1. Duration check
-        res1 = MagicMock()
-        res1.data = [{"slot_duration": 60}]
-        
-        # 2. Overlap check -> return EXISTING appointment 10:00-11:00
-        res2 = MagicMock()
-        res2.data = [{"start_time": "10:00", "end_time": "11:00"}]
-        
-        builder = MagicMock()
-        mock_supabase.table.return_value = builder
-        builder.select.return_value = builder
-        builder.eq.return_value = builder
-        builder.neq.return_value = builder
-        builder.execute.side_effect = [res1, res2]
+    def test_booking_overlap_exact(self, mock_supabase, mock_book):
+        self._barber_builder(mock_supabase)
+        # RPC found an existing appointment 10:00-11:00
+        mock_book.return_value = {"status": "conflict", "conflict": {"start": "10:00", "end": "11:00"}}
 
         payload = {
             "barber_id": "barber-1",
@@ -123,29 +76,20 @@ class BookingTestCase(unittest.TestCase):
         
         self.assertEqual(resp.status_code, 409)
         self.assertIn("unavailable", resp.get_json()["error"])
+        self.assertEqual(resp.get_json()["conflict"], {"start": "10:00", "end": "11:00"})
         
+    @patch("app.db.book_appointment")
     @patch("app.supabase")
-    def test_booking_overlap_partial(self, mock_supabase):
-        # 1. Duration check
-        res1 = MagicMock()
-        res1.data = [{"slot_duration": 60}]
-        
-        # 2. Overlap check -> Existing appt 10:30-11:30
-        res2 = MagicMock()
-        res2.data = [{"start_time": "10:30", "end_time": "11:30"}]
-        
-        builder = MagicMock()
-        mock_supabase.table.return_value = builder
-        builder.select.return_value = builder
-        builder.eq.return_value = builder
-        builder.neq.return_value = builder
-        builder.execute.side_effect = [res1, res2]
+    @patch("app.availability_service")
+    def test_booking_sends_normalized_row(self, mock_avail, mock_supabase, mock_book):
+        self._barber_builder(mock_supabase)
+        mock_book.return_value = {"status": "booked", "appointment": {"id": "x"}}
 
-        # Request 10:00 (ends 11:00) -> Overlaps 10:30-11:00 segment
+        # HH:MM:SS input is stored as HH:MM, end derived from slot_duration
         payload = {
             "barber_id": "barber-1",
             "date": "2024-01-01",
-            "start_time": "10:00", 
+            "start_time": "12:00:00", 
             "client_name": "Partial",
             "client_phone": "000"
         }
@@ -154,7 +98,9 @@ class BookingTestCase(unittest.TestCase):
                              data=json.dumps(payload), 
                              content_type="application/json")
         
-        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.status_code, 201)
+        row = mock_book.call_args[0][0]
+        self.assertEqual((row["start_time"], row["end_time"], row["status"]), ("12:00", "13:00", "booked"))
 
     def test_validation_bad_date(self):
         payload = {
@@ -183,39 +129,12 @@ class BookingTestCase(unittest.TestCase):
         self.assertIn("Invalid time", resp.get_json()["error"])
 
 
+    @patch("app.db.book_appointment")
     @patch("app.supabase")
-    def test_booking_success_fallback(self, mock_supabase):
-        # 1. Duration check
-        res1 = MagicMock()
-        res1.data = [{"slot_duration": 60}]
-        
-        # 2. Overlap check -> Empty (Safe)
-        res2 = MagicMock()
-        res2.data = []
-        
-        # 3. Insert -> EMPTY (Simulate issue)
-        res3 = MagicMock()
-        res3.data = []
-        
-        # 4. Fallback Verify -> Success
-        res4 = MagicMock()
-        res4.data = [{"id": "fallback-id", "status": "booked"}]
-        
-        builder = MagicMock()
-        mock_supabase.table.return_value = builder
-        builder.select.return_value = builder
-        builder.insert.return_value = builder
-        builder.eq.return_value = builder
-        builder.neq.return_value = builder
-        builder.order.return_value = builder
-        builder.limit.return_value = builder
-        
-        # The sequence of execute calls:
-        # 1. Barber duration
-        # 2. Overlap check
-        # 3. Insert
-        # 4. Fallback Select
-        builder.execute.side_effect = [res1, res2, res3, res4]
+    def test_booking_unconfirmed_is_error(self, mock_supabase, mock_book):
+        self._barber_builder(mock_supabase)
+        # RPC answered without a row: never report success
+        mock_book.return_value = {}
 
         payload = {
             "barber_id": "barber-1",
@@ -229,9 +148,58 @@ class BookingTestCase(unittest.TestCase):
                              data=json.dumps(payload), 
                              content_type="application/json")
         
-        self.assertEqual(resp.status_code, 201)
-        data = resp.get_json()
-        self.assertEqual(data["id"], "fallback-id")
+        self.assertEqual(resp.status_code, 500)
+
+    @patch("app.supabase")
+    @patch("app.availability_service")
+    def test_slot_duration_lookup_is_cached(self, mock_avail, mock_supabase):
+        mock_avail.get_availability.return_value = {"slots": ["09:00"], "cached": True}
+        builder = MagicMock()
+        mock_supabase.table.return_value = builder
+        builder.select.return_value = builder
+        builder.eq.return_value = builder
+        builder.execute.return_value.data = [{"id": "barber-1", "slot_duration": 20, "plan": "free"}]
+
+        for _ in range(3):
+            resp = self.app.get("/api/public/slots/barber-1?date=2024-01-01")
+            self.assertEqual(resp.get_json(), ["09:00"])
+
+        self.assertEqual(builder.execute.call_count, 1)
+        mock_avail.get_availability.assert_called_with("barber-1", "2024-01-01", 20)
+
+    @patch("app.supabase")
+    def test_premium_check_is_cached(self, mock_supabase):
+        builder = MagicMock()
+        mock_supabase.table.return_value = builder
+        builder.select.return_value = builder
+        builder.eq.return_value = builder
+        builder.execute.return_value.data = [{"id": "barber-1", "plan": "premium", "premium_expires_at": None}]
+
+        with self.app.session_transaction() as sess:
+            sess["barberId"] = "barber-1"
+
+        for _ in range(3):
+            resp = self.app.post("/upload-photo", headers={"Accept": "application/json"})
+            self.assertEqual(resp.status_code, 400)  # passed the premium gate
+            self.assertEqual(resp.get_json()["error"], "No file part")
+
+        self.assertEqual(builder.execute.call_count, 1)
+
+    @patch("app.supabase")
+    def test_expired_premium_is_denied(self, mock_supabase):
+        builder = MagicMock()
+        mock_supabase.table.return_value = builder
+        builder.select.return_value = builder
+        builder.eq.return_value = builder
+        builder.execute.return_value.data = [
+            {"id": "barber-1", "plan": "premium", "premium_expires_at": "2020-01-01T00:00:00+00:00"}
+        ]
+
+        with self.app.session_transaction() as sess:
+            sess["barberId"] = "barber-1"
+
+        resp = self.app.post("/upload-photo", headers={"Accept": "application/json"})
+        self.assertEqual(resp.status_code, 302)
 
 if __name__ == '__main__':
     unittest.main()
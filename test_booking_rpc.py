@@ -0,0 +1,134 @@
+import os
+import random
+import threading
+import unittest
+import uuid
+
+try:
+    import psycopg
+    from psycopg.types.json import Jsonb
+except ImportError:
+    psycopg = None
+
+from intervals import format_minutes, free_starts, merge_intervals
+
+# book_appointment (booking_rpc.sql) against a throwaway Postgres, e.g.
+#   TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest test_booking_rpc.py
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = """
+create table appointments (
+  id uuid primary key default gen_random_uuid(),
+  barber_id uuid, date text, start_time text, end_time text, status text,
+  client_name text, client_phone text
+);
+-- availability_rpc.sql is loaded first and types its lookups on this table
+create table schedule_overrides (
+  barber_id uuid, date text, start_time text, end_time text, is_closed boolean
+);
+"""
+
+
+@unittest.skipUnless(psycopg and TEST_DATABASE_URL, "TEST_DATABASE_URL and psycopg required")
+class TestBookAppointmentRpc(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.schema = f"booking_rpc_{uuid.uuid4().hex[:8]}"
+        with psycopg.connect(TEST_DATABASE_URL, autocommit=True) as conn:
+            conn.execute(f"create schema {cls.schema}")
+            conn.execute(f"set search_path to {cls.schema}")
+            conn.execute(SCHEMA)
+            for name in ("availability_rpc.sql", "booking_rpc.sql"):
+                with open(os.path.join(HERE, name)) as f:
+                    conn.execute(f.read())
+
+    @classmethod
+    def tearDownClass(cls):
+        with psycopg.connect(TEST_DATABASE_URL, autocommit=True) as conn:
+            conn.execute(f"drop schema {cls.schema} cascade")
+
+    def _connect(self):
+        conn = psycopg.connect(TEST_DATABASE_URL, autocommit=True)
+        conn.execute(f"set search_path to {self.schema}")
+        return conn
+
+    def _book(self, conn, barber_id, start, end, date="2030-01-07"):
+        row = {"barber_id": barber_id, "date": date, "start_time": start, "end_time": end,
+               "status": "booked", "client_name": "Test"}
+        return conn.execute("select book_appointment(%s)", (Jsonb(row),)).fetchone()[0]
+
+    def test_books_and_reports_conflicts(self):
+        barber_id = str(uuid.uuid4())
+        with self._connect() as conn:
+            first = self._book(conn, barber_id, "10:00", "11:00")
+            self.assertEqual(first["status"], "booked")
+            self.assertTrue(first["appointment"]["id"])
+            self.assertEqual(first["appointment"]["client_name"], "Test")
+
+            clash = self._book(conn, barber_id, "10:30", "11:30")
+            self.assertEqual(clash, {"status": "conflict", "conflict": {"start": "10:00", "end": "11:00"}})
+
+            # Touching intervals and other days/barbers are fine
+            self.assertEqual(self._book(conn, barber_id, "11:00", "12:00")["status"], "booked")
+            self.assertEqual(self._book(conn, barber_id, "10:00", "11:00", date="2030-01-08")["status"], "booked")
+            self.assertEqual(self._book(conn, str(uuid.uuid4()), "10:00", "11:00")["status"], "booked")
+
+            # Cancelled rows free the slot
+            conn.execute("update appointments set status = 'cancelled' where barber_id = %s and start_time = '11:00'",
+                         (barber_id,))
+            self.assertEqual(self._book(conn, barber_id, "11:00", "12:00")["status"], "booked")
+
+    def test_conflicts_match_python_intervals(self):
+        # intervals.py docstring: slot listings and bookings agree on overlaps
+        rnd = random.Random(11)
+        with self._connect() as conn:
+            for _ in range(15):
+                barber_id = str(uuid.uuid4())
+                busy = []
+                for _ in range(rnd.randint(0, 6)):
+                    s = rnd.randrange(480, 1140, 5)
+                    busy.append((s, s + rnd.choice([15, 30, 60, 90])))
+                for start, end in busy:
+                    conn.execute(
+                        "insert into appointments (barber_id, date, start_time, end_time, status) "
+                        "values (%s, '2030-01-07', %s, %s, 'booked')",
+                        (barber_id, format_minutes(start), format_minutes(end)),
+                    )
+                duration = rnd.choice([15, 30, 45, 60])
+                candidates = list(range(480, 1200 - duration + 1, 15))
+                free = set(free_starts(candidates, duration, merge_intervals(busy)))
+                for s in candidates:
+                    with conn.transaction(force_rollback=True):
+                        status = self._book(conn, barber_id, format_minutes(s), format_minutes(s + duration))["status"]
+                    self.assertEqual(status == "booked", s in free, (busy, s, duration))
+
+    def test_concurrent_requests_book_once(self):
+        barber_id = str(uuid.uuid4())
+        results = []
+        barrier = threading.Barrier(8)
+
+        def worker(i):
+            with self._connect() as conn:
+                barrier.wait()
+                # All overlap 10:00-11:00 with different offsets
+                start = f"10:{i * 5:02d}"
+                end = f"11:{i * 5:02d}"
+                results.append(self._book(conn, barber_id, start, end)["status"])
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sorted(results), ["booked"] + ["conflict"] * 7)
+        with self._connect() as conn:
+            count = conn.execute(
+                "select count(*) from appointments where barber_id = %s", (barber_id,)
+            ).fetchone()[0]
+        self.assertEqual(count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from flask import Flask
+from flask_caching import Cache
+
+import generation as gens
+
+
+class TestGeneration(unittest.TestCase):
+    def setUp(self):
+        self.cache = Cache(Flask(__name__), config={'CACHE_TYPE': 'SimpleCache'})
+
+    def test_seeded_once_then_stable(self):
+        first = gens.current(self.cache, "g")
+        self.assertGreater(first, 0)
+        self.assertEqual(gens.current(self.cache, "g"), first)
+
+    def test_bump_moves_and_reseeds_after_eviction(self):
+        first = gens.current(self.cache, "g")
+        gens.bump(self.cache, "g")
+        self.assertEqual(gens.current(self.cache, "g"), first + 1)
+
+        self.cache.delete("g")
+        gens.bump(self.cache, "g")
+        # Never restarts from a value old keys could have used
+        self.assertGreater(gens.current(self.cache, "g"), first + 1)
+
+    def test_join(self):
+        self.assertEqual(gens.join(5, "7"), "5.7")
+
+
+if __name__ == '__main__':
+    unittest.main()
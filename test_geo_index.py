@@ -0,0 +1,171 @@
+import random
+import sys
+import threading
+import time
+import unittest
+
+from flask import Flask
+from flask_caching import Cache
+
+import generation as gens
+from geo_index import GEO_GEN_KEY, GeoIndex, haversine_km
+from geocoder import GazetteerGeocoder, NullGeocoder, parse_latlon
+
+AUSTIN = (30.2672, -97.7431)
+
+
+def point(pid, barber, lat, lon):
+    return {"point_id": pid, "barber_id": barber, "lat": lat, "lon": lon}
+
+
+class TestGeoIndex(unittest.TestCase):
+    def test_haversine_known_distance(self):
+        # Austin -> Dallas is ~293 km great-circle
+        self.assertAlmostEqual(haversine_km(*AUSTIN, 32.7767, -96.7970), 293, delta=3)
+        self.assertEqual(haversine_km(*AUSTIN, *AUSTIN), 0)
+
+    def test_radius_matches_brute_force(self):
+        rng = random.Random(7)
+        points = [
+            point(f"b:{i}", f"barber{i}", AUSTIN[0] + rng.uniform(-0.5, 0.5), AUSTIN[1] + rng.uniform(-0.5, 0.5))
+            for i in range(2000)
+        ]
+        index = GeoIndex(lambda: points)
+        for radius in (0.5, 2, 5, 25):
+            got = index.nearby(*AUSTIN, radius_km=radius, limit=10_000)
+            expected = sorted(
+                (haversine_km(*AUSTIN, p["lat"], p["lon"]), p["barber_id"]) for p in points
+            )
+            expected = [b for d, b in expected if d <= radius]
+            self.assertEqual([r["barber_id"] for r in got], expected)
+            self.assertEqual([r["distance_km"] for r in got], sorted(r["distance_km"] for r in got))
+
+    def test_one_row_per_barber_at_closest_location(self):
+        index = GeoIndex(lambda: [
+            point("b:1", "1", AUSTIN[0] + 0.03, AUSTIN[1]),
+            point("l:9", "1", AUSTIN[0] + 0.001, AUSTIN[1]),
+            point("b:2", "2", AUSTIN[0] + 0.01, AUSTIN[1]),
+        ])
+        got = index.nearby(*AUSTIN, radius_km=5)
+        self.assertEqual([(r["barber_id"], r["point_id"]) for r in got], [("1", "l:9"), ("2", "b:2")])
+
+    def test_nearest_widens_radius(self):
+        index = GeoIndex(lambda: [
+            point("b:near", "near", AUSTIN[0] + 0.01, AUSTIN[1]),
+            point("b:far", "far", AUSTIN[0] + 0.5, AUSTIN[1]),  # ~55 km
+        ])
+        self.assertEqual(len(index.nearby(*AUSTIN, radius_km=5)), 1)
+        self.assertEqual([r["barber_id"] for r in index.nearest(*AUSTIN, k=2)], ["near", "far"])
+        self.assertEqual([r["barber_id"] for r in index.nearest(*AUSTIN, k=2, max_radius_km=10)], ["near"])
+
+    def test_incremental_upsert_and_remove(self):
+        index = GeoIndex(lambda: [point("b:1", "1", *AUSTIN)])
+        self.assertEqual(len(index.nearby(*AUSTIN)), 1)
+
+        index.upsert(point("b:2", "2", AUSTIN[0] + 0.01, AUSTIN[1]))
+        # Moving a point leaves nothing behind in its old cell
+        index.upsert(point("b:1", "1", 40.0, -74.0))
+        self.assertEqual([r["barber_id"] for r in index.nearby(*AUSTIN)], ["2"])
+        self.assertEqual([r["barber_id"] for r in index.nearby(40.0, -74.0)], ["1"])
+
+        index.remove("b:2")
+        self.assertEqual(index.nearby(*AUSTIN), [])
+        self.assertEqual(index.stats()["points"], 1)
+
+    def test_queries_survive_concurrent_upserts(self):
+        index = GeoIndex(lambda: [point(f"b:{i}", str(i), AUSTIN[0] + i * 0.1, AUSTIN[1]) for i in range(50)])
+        index.nearby(*AUSTIN)
+        stop = threading.Event()
+
+        def churn():
+            rng = random.Random(3)
+            while not stop.is_set():
+                pid = f"l:{rng.randrange(500)}"
+                index.upsert(point(pid, pid, AUSTIN[0] + rng.uniform(-5, 5), AUSTIN[1] + rng.uniform(-5, 5)))
+                index.remove(f"l:{rng.randrange(500)}")
+
+        writer = threading.Thread(target=churn)
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # interleave the threads mid-iteration
+        writer.start()
+        try:
+            deadline = time.time() + 0.5
+            while time.time() < deadline:
+                index.nearby(*AUSTIN, radius_km=100, limit=10_000)
+                index.nearby(*AUSTIN, radius_km=1)
+        finally:
+            stop.set()
+            writer.join()
+            sys.setswitchinterval(interval)
+
+    def test_other_workers_replay_published_changes(self):
+        cache = Cache(Flask(__name__), config={'CACHE_TYPE': 'SimpleCache'})
+        data = [point("b:1", "1", *AUSTIN), point("b:2", "2", AUSTIN[0] + 0.01, AUSTIN[1])]
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return list(data)
+
+        writer = GeoIndex(loader, cache=cache, check_interval=0)
+        reader = GeoIndex(loader, cache=cache, check_interval=0)
+        writer.nearby(*AUSTIN)
+        reader.nearby(*AUSTIN)
+
+        writer.upsert(point("l:9", "9", AUSTIN[0] + 0.02, AUSTIN[1]))
+        writer.remove("b:2")
+        writer.upsert(point("b:1", "1", 40.0, -74.0))
+        self.assertEqual([r["barber_id"] for r in writer.nearby(*AUSTIN)], ["9"])
+        self.assertEqual([r["barber_id"] for r in reader.nearby(*AUSTIN)], ["9"])
+        self.assertEqual(reader.stats()["replayed"], 3)
+
+        reader.remove_barber("9")
+        self.assertEqual(writer.nearby(*AUSTIN), [])
+        self.assertEqual(len(loads), 2)  # the initial loads only
+
+    def test_rebuilds_in_background_when_changes_are_gone(self):
+        cache = Cache(Flask(__name__), config={'CACHE_TYPE': 'SimpleCache'})
+        data = [point("b:1", "1", *AUSTIN)]
+        index = GeoIndex(lambda: list(data), cache=cache, check_interval=0)
+        self.assertEqual(len(index.nearby(*AUSTIN)), 1)
+
+        data.append(point("b:2", "2", *AUSTIN))
+        self.assertEqual(len(index.nearby(*AUSTIN)), 1)  # same generation: no reload
+
+        # Another worker's change that has already expired from the cache
+        gens.bump(cache, GEO_GEN_KEY)
+        index.nearby(*AUSTIN)  # serves the old snapshot, starts the rebuild
+        deadline = time.time() + 2
+        while index.stats()["rebuilds"] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(index.nearby(*AUSTIN)), 2)
+
+    def test_query_latency(self):
+        rng = random.Random(1)
+        points = [
+            point(f"b:{i}", str(i), rng.uniform(25, 49), rng.uniform(-124, -67)) for i in range(100_000)
+        ]
+        index = GeoIndex(lambda: points)
+        index.nearby(*AUSTIN)
+        start = time.perf_counter()
+        for _ in range(20):
+            index.nearby(*AUSTIN, radius_km=25)
+        self.assertLess((time.perf_counter() - start) / 20, 0.05)
+
+
+class TestGeocoder(unittest.TestCase):
+    def test_gazetteer_matches_most_specific_suffix(self):
+        geo = GazetteerGeocoder(places={"austin, tx": (30.27, -97.74), "austin": (1.0, 1.0), "dallas": (32.78, -96.8)})
+        self.assertEqual(geo.geocode("12 Main St, Austin,  TX"), (30.27, -97.74))
+        self.assertEqual(geo.geocode("Dallas"), (32.78, -96.8))
+        self.assertIsNone(geo.geocode("Nowhere"))
+
+    def test_literal_coordinates(self):
+        self.assertEqual(NullGeocoder().geocode(" 30.5, -97.25 "), (30.5, -97.25))
+        self.assertIsNone(NullGeocoder().geocode("Austin"))
+        self.assertIsNone(parse_latlon("91", "0"))
+        self.assertIsNone(parse_latlon("x", None))
+
+
+if __name__ == '__main__':
+    unittest.main()
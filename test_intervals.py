@@ -0,0 +1,108 @@
+import random
+import unittest
+
+import slot_mask
+import availability_bitmap
+from intervals import (
+    to_minutes, format_minutes, busy_intervals,
+    merge_intervals, free_starts,
+)
+
+
+def naive_free(candidates, duration, busy):
+    return [
+        s for s in candidates
+        if not any(s < b_end and s + duration > b_start for b_start, b_end in busy)
+    ]
+
+
+class TestIntervals(unittest.TestCase):
+    def test_to_minutes_formats(self):
+        self.assertEqual(to_minutes("09:30"), 570)
+        self.assertEqual(to_minutes("9:30:00"), 570)
+        self.assertEqual(to_minutes("2023-01-01T09:30:00"), 570)
+        self.assertEqual(to_minutes(None), 0)
+        self.assertEqual(format_minutes(570), "09:30")
+
+    def test_busy_intervals_skips_cancelled_and_defaults_end(self):
+        rows = [
+            {"start_time": "10:00", "end_time": "11:00", "status": "booked"},
+            {"start_time": "12:00", "end_time": "13:00", "status": "cancelled"},
+            {"start_time": "14:00", "end_time": None, "status": "booked"},
+        ]
+        self.assertEqual(busy_intervals(rows, 30), [(600, 660), (840, 870)])
+
+    def test_merge_intervals(self):
+        merged = merge_intervals([(600, 660), (540, 600), (700, 720), (710, 715)])
+        self.assertEqual(merged, [(540, 660), (700, 720)])
+
+    def test_sweep_matches_naive(self):
+        rnd = random.Random(42)
+        for _ in range(300):
+            duration = rnd.choice([15, 20, 30, 45, 60, 90])
+            candidates = list(range(480, 1200 - duration + 1, duration))
+            busy = []
+            for _ in range(rnd.randint(0, 12)):
+                s = rnd.randrange(420, 1260, 5)
+                busy.append((s, s + rnd.choice([10, 15, 30, 60, 120])))
+            merged = merge_intervals(busy)
+
+            self.assertEqual(free_starts(candidates, duration, merged), naive_free(candidates, duration, busy))
+
+
+@unittest.skipUnless(slot_mask.HAS_NUMPY, "NumPy not installed")
+class TestSlotMask(unittest.TestCase):
+    def test_vectorized_matches_sweep(self):
+        rnd = random.Random(7)
+        for _ in range(300):
+            duration = rnd.choice([15, 20, 30, 45, 60, 90])
+            candidates = list(range(480, 1200 - duration + 1, duration))
+            busy = []
+            for _ in range(rnd.randint(0, 12)):
+                s = rnd.randrange(420, 1260, 5)
+                busy.append((s, s + rnd.choice([10, 15, 30, 60, 120])))
+            merged = merge_intervals(busy)
+
+            self.assertEqual(
+                slot_mask.free_starts_vectorized(candidates, duration, merged),
+                free_starts(candidates, duration, merged),
+            )
+
+    def test_empty_candidates(self):
+        self.assertEqual(slot_mask.free_starts_vectorized([], 30, [(600, 660)]), [])
+
+
+class TestAvailabilityBitmap(unittest.TestCase):
+    def test_bitmap_matches_sweep(self):
+        rnd = random.Random(11)
+        for _ in range(300):
+            duration = rnd.choice([15, 20, 30, 45, 60, 90])
+            open_m = rnd.randrange(360, 720, 5)
+            close_m = rnd.randrange(open_m, 1440, rnd.choice([1, 5]))
+            candidates = list(range(open_m, close_m - duration + 1, duration))
+            busy = []
+            for _ in range(rnd.randint(0, 12)):
+                s = rnd.randrange(300, 1380, rnd.choice([1, 5]))  # off-grid too
+                busy.append((s, s + rnd.choice([7, 10, 15, 30, 60, 120])))
+            merged = merge_intervals(busy)
+
+            bits = availability_bitmap.build(open_m, close_m, merged)
+            self.assertEqual(
+                availability_bitmap.free_starts(bits, open_m, close_m, duration),
+                free_starts(candidates, duration, merged),
+            )
+
+    def test_mark_busy_clears_only_overlapping_units(self):
+        bits = availability_bitmap.build(540, 720, [])  # 09:00-12:00
+        bits = availability_bitmap.mark_busy(bits, 600, 660)
+        self.assertEqual(availability_bitmap.free_starts(bits, 540, 720, 60), [540, 660])
+        self.assertEqual(availability_bitmap.free_starts(bits, 540, 720, 30), [540, 570, 660, 690])
+
+    def test_aligned(self):
+        self.assertTrue(availability_bitmap.aligned(540, 45))
+        self.assertFalse(availability_bitmap.aligned(541, 45))
+        self.assertFalse(availability_bitmap.aligned(540, 42))
+
+
+if __name__ == '__main__':
+    unittest.main()
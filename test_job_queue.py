@@ -0,0 +1,148 @@
+import os
+import tempfile
+import time
+import unittest
+
+from job_queue import (
+    JOB_KEY_TTL, JOB_PURGE_INTERVAL, JobQueue, RedisBackend, SQLiteBackend, retry_delay,
+)
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class QueueBehaviour:
+    """Shared cases, run against each backend."""
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.queue = JobQueue(self.make_backend())
+        self.calls = []
+
+    def test_runs_registered_handler(self):
+        self.queue.register("greet", lambda p: self.calls.append(p["name"]))
+        self.assertIsNotNone(self.queue.enqueue("greet", {"name": "ann"}))
+        self.assertTrue(self.queue.run_once())
+        self.assertEqual(self.calls, ["ann"])
+        self.assertFalse(self.queue.run_once())
+        self.assertEqual(self.queue.stats()["queued"], 0)
+
+    def test_idempotency_key_dedupes(self):
+        self.queue.register("greet", lambda p: self.calls.append(p["name"]))
+        self.assertIsNotNone(self.queue.enqueue("greet", {"name": "a"}, key="evt_1"))
+        self.assertIsNone(self.queue.enqueue("greet", {"name": "a"}, key="evt_1"))
+        while self.queue.run_once():
+            pass
+        # Still deduped after the first run finished
+        self.assertIsNone(self.queue.enqueue("greet", {"name": "a"}, key="evt_1"))
+        self.assertEqual(self.calls, ["a"])
+        self.assertEqual(self.queue.stats()["duplicates"], 2)
+
+    def test_failure_retries_with_backoff(self):
+        def flaky(payload):
+            self.calls.append(1)
+            if len(self.calls) < 2:
+                raise RuntimeError("boom")
+        self.queue.register("flaky", flaky)
+        self.queue.enqueue("flaky", {})
+
+        self.assertTrue(self.queue.run_once())
+        # Not due again until the backoff passes
+        self.assertFalse(self.queue.run_once())
+        self.assertTrue(self.queue.run_once(now=time.time() + retry_delay(1) + 1))
+        self.assertEqual(len(self.calls), 2)
+        stats = self.queue.stats()
+        self.assertEqual((stats["retried"], stats["done"], stats["queued"]), (1, 1, 0))
+
+    def test_dead_after_max_attempts(self):
+        self.queue.register("broken", lambda p: 1 / 0)
+        self.queue.enqueue("broken", {}, max_attempts=2)
+        later = time.time() + 3600
+        self.assertTrue(self.queue.run_once())
+        self.assertTrue(self.queue.run_once(now=later))
+        self.assertFalse(self.queue.run_once(now=later * 2))
+        stats = self.queue.stats()
+        self.assertEqual((stats["dead"], stats["queued"]), (1, 0))
+
+    def test_dead_job_calls_on_dead_once(self):
+        dead = []
+        self.queue.register("broken", lambda p: 1 / 0, on_dead=lambda p, err: dead.append((p, err)))
+        self.queue.enqueue("broken", {"id": 7}, max_attempts=1)
+        self.queue.run_once()
+        self.assertEqual(dead, [({"id": 7}, "ZeroDivisionError: division by zero")])
+        self.assertFalse(self.queue.run_once(now=time.time() + 3600))
+
+    def test_dead_job_frees_its_key(self):
+        self.queue.register("broken", lambda p: 1 / 0)
+        self.queue.enqueue("broken", {}, key="evt_9", max_attempts=1)
+        self.assertIsNone(self.queue.enqueue("broken", {}, key="evt_9"))
+        self.queue.run_once()
+        self.assertIsNotNone(self.queue.enqueue("broken", {}, key="evt_9"))
+
+    def test_unknown_handler_is_retried_not_lost(self):
+        self.queue.enqueue("later", {"x": 1})
+        self.queue.run_once()
+        self.queue.register("later", lambda p: self.calls.append(p["x"]))
+        self.queue.run_once(now=time.time() + 3600)
+        self.assertEqual(self.calls, [1])
+
+    def test_expired_lease_is_reclaimed(self):
+        self.queue.register("greet", lambda p: self.calls.append(p))
+        self.queue.enqueue("greet", {})
+        # A worker claims the job and dies without finishing it
+        self.assertIsNotNone(self.queue.backend.claim(time.time()))
+        self.assertFalse(self.queue.run_once())
+        self.assertTrue(self.queue.run_once(now=time.time() + 3600))
+        self.assertEqual(len(self.calls), 1)
+
+
+class TestSQLiteQueue(QueueBehaviour, unittest.TestCase):
+    def make_backend(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        return SQLiteBackend(self.path)
+
+    def test_purge_drops_done_jobs_after_key_window(self):
+        self.queue.register("greet", lambda p: None)
+        self.queue.enqueue("greet", {}, key="k")
+        self.queue.run_once()
+        self.assertTrue(self.queue.purge())
+        # Throttled, and recent jobs keep their key
+        self.assertFalse(self.queue.purge())
+        self.assertIsNone(self.queue.enqueue("greet", {}, key="k"))
+
+        self.assertTrue(self.queue.purge(now=time.time() + JOB_KEY_TTL + JOB_PURGE_INTERVAL + 1))
+        count = self.queue.backend._conn().execute("select count(*) from jobs").fetchone()[0]
+        self.assertEqual(count, 0)
+
+    def test_jobs_survive_a_restart(self):
+        self.queue.enqueue("greet", {"name": "bo"}, key="k")
+        restarted = JobQueue(SQLiteBackend(self.path))
+        restarted.register("greet", lambda p: self.calls.append(p["name"]))
+        self.assertIsNone(restarted.enqueue("greet", {"name": "bo"}, key="k"))
+        self.assertTrue(restarted.run_once())
+        self.assertEqual(self.calls, ["bo"])
+
+
+@unittest.skipUnless(fakeredis, "fakeredis not installed")
+class TestRedisQueue(QueueBehaviour, unittest.TestCase):
+    def make_backend(self):
+        return RedisBackend(fakeredis.FakeRedis())
+
+    def test_failed_add_does_not_keep_the_key(self):
+        self.queue.register("greet", lambda p: self.calls.append(p["name"]))
+        # An invalid score makes the script fail after its checks
+        with self.assertRaises(Exception):
+            self.queue.enqueue("greet", {"name": "a"}, key="evt_1", delay=float("nan"))
+        self.assertIsNotNone(self.queue.enqueue("greet", {"name": "a"}, key="evt_1"))
+        self.assertTrue(self.queue.run_once())
+        self.assertEqual(self.calls, ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import io
+import os
+import threading
+import time
+import unittest
+
+from flask import Flask
+from flask_caching import Cache
+from PIL import Image
+
+from media_pipeline import (
+    VARIANTS, ImageTooLarge, MediaPipeline, UploadTooLarge, render_variants, stream_to_temp, variant_url,
+)
+
+
+def image_file(size=(2400, 1200), fmt="JPEG"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 80, 40)).save(buf, format=fmt)
+    buf.seek(0)
+    return buf
+
+
+class TestMediaHelpers(unittest.TestCase):
+    def test_stream_to_temp_enforces_limit(self):
+        path = stream_to_temp(io.BytesIO(b"x" * 1000), max_bytes=1000)
+        self.assertEqual(os.path.getsize(path), 1000)
+        os.remove(path)
+        with self.assertRaises(UploadTooLarge):
+            stream_to_temp(io.BytesIO(b"x" * 1001), max_bytes=1000)
+
+    def test_render_variants_sizes(self):
+        path = stream_to_temp(image_file(), 10 * 1024 * 1024)
+        try:
+            out = render_variants(path)
+        finally:
+            os.remove(path)
+        for name, edge in VARIANTS.items():
+            im = Image.open(io.BytesIO(out[(name, "webp")]))
+            self.assertEqual(im.format, "WEBP")
+            self.assertEqual(max(im.size), edge)
+            self.assertEqual(im.size[0], 2 * im.size[1])  # aspect ratio kept
+
+    def test_oversized_images_rejected_before_decoding(self):
+        path = stream_to_temp(image_file((400, 300), "PNG"), 10 * 1024 * 1024)
+        try:
+            with self.assertRaises(ImageTooLarge):
+                render_variants(path, max_pixels=400 * 300 - 1)
+        finally:
+            os.remove(path)
+
+    def test_small_images_are_not_upscaled(self):
+        path = stream_to_temp(image_file((100, 50), "PNG"), 10 * 1024 * 1024)
+        try:
+            out = render_variants(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(Image.open(io.BytesIO(out[("full", "webp")])).size, (100, 50))
+
+    def test_variant_url(self):
+        url = "https://cdn.example/avatars/b1/job/card.webp"
+        self.assertEqual(variant_url(url, "thumb"), "https://cdn.example/avatars/b1/job/thumb.webp")
+        self.assertEqual(variant_url(url + "?t=1", "full"), "https://cdn.example/avatars/b1/job/full.webp?t=1")
+        self.assertEqual(variant_url("https://x/legacy/me.jpg", "thumb"), "https://x/legacy/me.jpg")
+        self.assertIsNone(variant_url(None, "thumb"))
+
+
+class TestMediaPipeline(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        self.cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+        self.uploaded = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.recorded = []
+
+    def upload(self, path, data, content_type):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+            self.uploaded[path] = content_type
+        return f"https://cdn.example/{path}"
+
+    def wait(self, pipeline, job_id):
+        deadline = time.time() + 5
+        while pipeline.status(job_id)["status"] == "processing" and time.time() < deadline:
+            time.sleep(0.01)
+        return pipeline.status(job_id)
+
+    def test_job_uploads_variants_concurrently_and_records_them(self):
+        pipeline = MediaPipeline(self.cache, self.upload, self.recorded.append, upload_concurrency=3)
+        path = stream_to_temp(image_file(), 10 * 1024 * 1024)
+        job_id = pipeline.submit("photo", "b1", path, "avatars/b1")
+        self.assertEqual(pipeline.status(job_id)["status"], "processing")
+
+        job = self.wait(pipeline, job_id)
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(set(job["variants"]), set(VARIANTS))
+        self.assertEqual(job["url"], f"https://cdn.example/avatars/b1/{job_id}/card.webp")
+        self.assertEqual(set(self.uploaded.values()), {"image/webp"})
+        self.assertEqual(self.max_in_flight, 3)
+        self.assertEqual(self.recorded[0]["barber_id"], "b1")
+        self.assertFalse(os.path.exists(path))
+
+    def test_bad_image_fails_and_cleans_up(self):
+        pipeline = MediaPipeline(self.cache, self.upload, self.recorded.append)
+        path = stream_to_temp(io.BytesIO(b"not an image"), 1024)
+        job = self.wait(pipeline, pipeline.submit("gallery", "b1", path, "portfolio/b1"))
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(self.recorded, [])
+        self.assertEqual(self.uploaded, {})
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from flask import Flask
+from flask_caching import Cache
+
+from availability import AvailabilityService
+from next_slots import NextSlotsRefresher, first_slots
+
+
+class TestNextSlots(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        self.cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+        self.compute = MagicMock(return_value={
+            "2030-01-02": ["09:00", "10:00"],
+            "2030-01-01": [],
+            "2030-01-03": ["11:00"],
+        })
+        self.store = MagicMock()
+        self.list_stale = MagicMock(return_value=["b2", "b3"])
+        self.on_batch = MagicMock()
+        self.refresher = NextSlotsRefresher(
+            self.cache, self.compute, self.store, self.list_stale, on_batch=self.on_batch, n=2
+        )
+
+    def test_first_slots_in_date_order(self):
+        self.assertEqual(first_slots(self.compute.return_value, 3),
+                         ["2030-01-02 09:00", "2030-01-02 10:00", "2030-01-03 11:00"])
+        self.assertEqual(first_slots({}, 3), [])
+
+    def test_refresh_stores_first_n(self):
+        self.assertEqual(self.refresher.refresh("b1"), ["2030-01-02 09:00", "2030-01-02 10:00"])
+        self.store.assert_called_once_with("b1", ["2030-01-02 09:00", "2030-01-02 10:00"])
+        start, end = self.compute.call_args.args[1:]
+        self.assertLess(start, end)
+
+    def test_sweep_refreshes_stale_and_bumps_once(self):
+        self.assertEqual(self.refresher.sweep(limit=10), 2)
+        self.assertEqual(self.list_stale.call_args.args[1], 10)
+        self.assertEqual(self.store.call_count, 2)
+        self.on_batch.assert_called_once()
+
+    def test_failed_barber_does_not_stop_batch(self):
+        self.compute.side_effect = [RuntimeError("db down"), {"2030-01-01": ["09:00"]}]
+        self.assertEqual(self.refresher.refresh_many(["b1", "b2"]), 1)
+        self.assertEqual(self.refresher.stats()["errors"], 1)
+
+    def test_availability_changes_queue_a_background_refresh(self):
+        service = AvailabilityService(self.cache)
+        service.add_listener(self.refresher.mark_dirty)
+
+        service.invalidate_barber("b1")
+        service.invalidate_day("b1", "2030-01-02")
+        self.refresher.start(sweep_interval=0)
+
+        deadline = time.time() + 2
+        while not self.store.called and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        # Both changes collapse into one refresh of b1
+        self.assertEqual([c.args[0] for c in self.store.call_args_list], ["b1"])
+        self.list_stale.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import unittest
+import uuid
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+# expire_premium (premium_expiry_migration.sql) against a throwaway Postgres, e.g.
+#   TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest test_premium_expiry_rpc.py
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = """
+create table barbers (
+  id uuid primary key default gen_random_uuid(),
+  name text, plan text, premium_expires_at timestamptz
+);
+"""
+
+NOW = "2030-06-01T00:00:00+00:00"
+
+# name, plan, premium_expires_at
+BARBERS = [
+    ("expired", "premium", "2030-05-01T00:00:00+00:00"),
+    ("open_ended", "premium", None),
+    ("active", "premium", "2030-07-01T00:00:00+00:00"),
+    ("free", "free", "2030-05-01T00:00:00+00:00"),
+]
+
+
+@unittest.skipUnless(psycopg and TEST_DATABASE_URL, "TEST_DATABASE_URL and psycopg required")
+class TestExpirePremiumRpc(unittest.TestCase):
+    def setUp(self):
+        self.schema = f"premium_rpc_{uuid.uuid4().hex[:8]}"
+        self.conn = psycopg.connect(TEST_DATABASE_URL, autocommit=True)
+        self.conn.execute(f"create schema {self.schema}")
+        self.conn.execute(f"set search_path to {self.schema}, public")
+        self.conn.execute(SCHEMA)
+        with open(os.path.join(HERE, "premium_expiry_migration.sql")) as f:
+            self.conn.execute(f.read())
+        for row in BARBERS:
+            self.conn.execute("insert into barbers (name, plan, premium_expires_at) values (%s, %s, %s)", row)
+
+    def tearDown(self):
+        self.conn.execute(f"drop schema {self.schema} cascade")
+        self.conn.close()
+
+    def _expire(self):
+        rows = self.conn.execute(
+            "select b.name from expire_premium(%s) e join barbers b on b.id::text = e.barber_id", (NOW,)
+        ).fetchall()
+        return sorted(r[0] for r in rows)
+
+    def _plan(self, name):
+        return self.conn.execute("select plan from barbers where name = %s", (name,)).fetchone()[0]
+
+    def test_downgrades_only_expired_premium(self):
+        self.assertEqual(self._expire(), ["expired"])
+        self.assertEqual(self._plan("expired"), "free")
+        # Untouched: still paid up, or premium with no expiry
+        self.assertEqual(self._plan("active"), "premium")
+        self.assertEqual(self._plan("open_ended"), "premium")
+
+    def test_second_run_is_a_no_op(self):
+        self._expire()
+        self.assertEqual(self._expire(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
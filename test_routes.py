@@ -4,15 +4,20 @@ os.environ["SUPABASE_URL"] = "https://example.supabase.co"
 os.environ["SUPABASE_KEY"] = "fake-key"
 os.environ["SECRET_KEY"] = "test-secret"
 
+import io
 import unittest
 from unittest.mock import MagicMock, patch
 import sys
+from datetime import datetime
+
+from flask.sessions import SecureCookieSessionInterface
 
 # Mock modules that depend on Supabase if needed, or rely on env mock
 # App import will trigger db import which triggers supabase client creation.
 # Env vars above should satisfy the client creation check.
 
-from app import app
+from app import app, cache, search_cache, geo_index, store_coordinates
+import db
 
 class RouteTestCase(unittest.TestCase):
     def setUp(self):
@@ -46,5 +51,452 @@ class RouteTestCase(unittest.TestCase):
         # Verify it redirects to login
         self.assertIn('/login', rv.headers['Location'])
 
+    def test_unchanged_session_not_rewritten(self):
+        with self.app.session_transaction() as sess:
+            sess["barberId"] = "barber-1"
+
+        # First request records the sliding-expiry touch
+        rv = self.app.get('/terms')
+        self.assertIn('Set-Cookie', rv.headers)
+
+        # Later requests leave the session alone
+        rv = self.app.get('/terms')
+        self.assertNotIn('Set-Cookie', rv.headers)
+
+    def test_cookie_session_has_expiry(self):
+        with patch.object(app, "session_interface", SecureCookieSessionInterface()):
+            with self.app.session_transaction() as sess:
+                sess["barberId"] = "barber-1"
+            rv = self.app.get('/terms')
+        self.assertIn("Expires=", rv.headers["Set-Cookie"])
+
+    @patch("app.ensure_default_weekly_hours")
+    @patch("app.supabase")
+    def test_book_view_has_no_appointment_data(self, mock_supabase, _ensure):
+        builder = MagicMock()
+        mock_supabase.table.return_value = builder
+        builder.select.return_value = builder
+        builder.eq.return_value = builder
+        builder.execute.side_effect = [
+            MagicMock(data=[{"id": "barber-1", "name": "Bob"}]),
+            MagicMock(data=[]),
+        ]
+
+        rv = self.app.get('/b/barber-1')
+        self.assertEqual(rv.status_code, 200)
+        self.assertNotIn("bk-booked", rv.get_data(as_text=True))
+        tables = [c.args[0] for c in mock_supabase.table.call_args_list]
+        self.assertNotIn("appointments", tables)
+
+class AppointmentPagingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        with self.app.session_transaction() as sess:
+            sess["barberId"] = "barber-1"
+
+    @patch("app.ensure_default_weekly_hours")
+    @patch("app.db.list_barber_appointments_page")
+    @patch("app.supabase")
+    def test_dashboard_loads_first_page_only(self, mock_supabase, mock_page, mock_ensure):
+        builder = MagicMock()
+        mock_supabase.table.return_value = builder
+        builder.select.return_value = builder
+        builder.eq.return_value = builder
+        builder.execute.return_value = MagicMock(data=[{"id": "barber-1", "name": "Bob", "plan": "free"}])
+        mock_page.return_value = (
+            [{"id": "a1", "date": "2030-01-07", "start_time": "10:00", "status": "booked",
+              "client_name": "Ann", "client_phone": "1"}],
+            "2030-01-07|10:00|a1",
+        )
+
+        rv = self.app.get('/dashboard', headers={"Accept": "application/json"})
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.get_json()["next_cursor"], "2030-01-07|10:00|a1")
+        self.assertEqual(mock_page.call_args.kwargs["limit"], 25)
+        mock_ensure.assert_not_called()
+
+        rv = self.app.get('/dashboard')
+        self.assertEqual(rv.status_code, 200)
+        self.assertIn('data-cursor="2030-01-07|10:00|a1"', rv.get_data(as_text=True))
+
+    @patch("app.db.list_barber_appointments_page")
+    def test_api_paged_mode(self, mock_page):
+        mock_page.return_value = ([{"id": "a2"}], None)
+        rv = self.app.get('/api/barber/appointments?limit=1000&cursor=2030-01-07|10:00|a1')
+        self.assertEqual(rv.get_json(), {"appointments": [{"id": "a2"}], "next_cursor": None})
+        self.assertEqual(mock_page.call_args.kwargs["limit"], 200)
+        self.assertEqual(mock_page.call_args.kwargs["cursor"], "2030-01-07|10:00|a1")
+
+    def test_api_rejects_bad_cursor(self):
+        rv = self.app.get('/api/barber/appointments?cursor=2030-01-07|10:00),id.gt.(|x')
+        self.assertEqual(rv.status_code, 400)
+
+    def test_cursor_round_trip(self):
+        row = {"id": "3f2a-9", "date": "2030-01-07", "start_time": "09:30:00"}
+        cursor = db.encode_appointment_cursor(row)
+        self.assertEqual(db.decode_appointment_cursor(cursor), ("2030-01-07", "09:30:00", "3f2a-9"))
+        with self.assertRaises(ValueError):
+            db.decode_appointment_cursor("2030-01-07|09:30")
+
+
+class FindProTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        cache.clear()
+
+    @patch.object(search_cache, "searcher")
+    def test_search_is_paged_on_server(self, mock_search):
+        mock_search.return_value = [
+            {"id": str(i), "name": f"Pro {i}", "profession": "Barber", "address": "Austin", "photo_url": None}
+            for i in range(21)
+        ]
+        rv = self.app.post('/find-pro', json={"city": "Austin", "service": "Barber", "page": 2})
+
+        mock_search.assert_called_once_with("austin", "barber", limit=21, offset=20)
+        body = rv.get_json()
+        self.assertEqual(len(body), 20)
+        self.assertEqual(body[0], {"barberId": "0", "name": "Pro 0", "profession": "Barber",
+                                   "location": "Austin", "media_url": None, "plan": None,
+                                   "next_open": None})
+
+    @patch.object(search_cache, "searcher")
+    def test_results_page_links_next_page(self, mock_search):
+        mock_search.return_value = [{"id": str(i), "name": "P", "address": "Austin"} for i in range(21)]
+        rv = self.app.post('/find-pro', data={"city": "Austin"})
+        html = rv.get_data(as_text=True)
+        self.assertIn('name="page" value="2"', html)
+        self.assertNotIn('name="page" value="0"', html)
+
+    @patch.object(search_cache, "searcher")
+    def test_filter_by_availability(self, mock_search):
+        mock_search.return_value = [{"id": "1", "name": "P", "address": "Austin",
+                                     "next_open": f"{datetime.utcnow().date().isoformat()} 15:30"}]
+        rv = self.app.post('/find-pro', data={"city": "Austin", "sort": "earliest", "available": "today"})
+        kwargs = mock_search.call_args.kwargs
+        self.assertEqual((kwargs["sort"], kwargs["available_today"]), ("earliest", True))
+        html = rv.get_data(as_text=True)
+        self.assertIn("Today at 15:30", html)
+        self.assertIn('value="earliest" selected', html)
+
+    @patch.object(search_cache, "searcher")
+    def test_repeat_search_is_cached_until_barber_changes(self, mock_search):
+        mock_search.return_value = [{"id": "1", "name": "P", "address": "Austin"}]
+        self.app.post('/find-pro', json={"city": "Austin"})
+        self.app.post('/find-pro', json={"city": "  AUSTIN "})
+        self.assertEqual(mock_search.call_count, 1)
+
+        search_cache.invalidate()
+        self.app.post('/find-pro', json={"city": "austin"})
+        self.assertEqual(mock_search.call_count, 2)
+
+
+class ScheduleBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        with self.app.session_transaction() as sess:
+            sess["barberId"] = "barber-1"
+
+    @patch("app.availability_service")
+    @patch("app.db.upsert_weekly_hours")
+    def test_weekly_hours_saved_in_one_upsert(self, mock_upsert, mock_avail):
+        days = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+        hours = [{"weekday": d, "start_time": "09:00", "end_time": "17:00", "is_closed": d == "sun"} for d in days]
+        rv = self.app.post('/api/barber/weekly-hours/barber-1', json=hours)
+        self.assertEqual(rv.status_code, 200)
+        mock_upsert.assert_called_once_with("barber-1", hours)
+        mock_avail.invalidate_barber.assert_called_once_with("barber-1")
+
+        rv = self.app.post('/api/barber/weekly-hours/barber-1', json=[{"weekday": "funday"}])
+        self.assertEqual(rv.status_code, 400)
+
+    @patch("app.availability_service")
+    @patch("app.db.upsert_overrides")
+    def test_vacation_range_is_one_write(self, mock_upsert, mock_avail):
+        rv = self.app.post('/api/barber/overrides', json={"start_date": "2030-12-24", "end_date": "2030-12-27"})
+        self.assertEqual(rv.status_code, 200)
+        barber_id, rows = mock_upsert.call_args.args
+        self.assertEqual(barber_id, "barber-1")
+        self.assertEqual([r["date"] for r in rows], ["2030-12-24", "2030-12-25", "2030-12-26", "2030-12-27"])
+        self.assertTrue(all(r["is_closed"] for r in rows))
+        mock_avail.invalidate_barber.assert_called_once_with("barber-1")
+
+    @patch("app.availability_service")
+    @patch("app.db.upsert_overrides")
+    def test_special_hours_need_times(self, mock_upsert, mock_avail):
+        rv = self.app.post('/api/barber/overrides', json={"dates": ["2030-01-02"], "is_closed": False})
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.post('/api/barber/overrides', json={"start_date": "2030-01-05", "end_date": "2030-01-01"})
+        self.assertEqual(rv.status_code, 400)
+        mock_upsert.assert_not_called()
+
+    @patch("app.availability_service")
+    @patch("db.supabase")
+    def test_saving_an_override_twice_updates_it(self, mock_supabase, mock_avail):
+        stored = {}
+
+        def upsert(rows, on_conflict=None):
+            # schedule_overrides has a unique (barber_id, date) index
+            for row in rows:
+                key = (row["barber_id"], row["date"])
+                if key in stored and on_conflict != "barber_id,date":
+                    raise Exception("duplicate key value violates unique constraint")
+                stored[key] = row
+            return MagicMock(execute=MagicMock(return_value=MagicMock(data=rows)))
+
+        mock_supabase.table.return_value.upsert.side_effect = upsert
+        row = {"barber_id": "barber-1", "date": "2030-01-02", "is_closed": True}
+        for is_closed in (True, False):
+            rv = self.app.post('/api/barber/override', json=dict(row, is_closed=is_closed))
+            self.assertEqual(rv.status_code, 200)
+        self.assertEqual(stored, {("barber-1", "2030-01-02"): dict(row, is_closed=False)})
+        mock_avail.invalidate_day.assert_called_with("barber-1", "2030-01-02")
+
+        rv = self.app.post('/api/barber/override', json={"date": "2030-01-02"})
+        self.assertEqual(rv.status_code, 400)
+
+    @patch("app.availability_service")
+    @patch("app.db.delete_overrides")
+    def test_delete_range(self, mock_delete, mock_avail):
+        rv = self.app.delete('/api/barber/overrides', json={"dates": ["2030-01-03", "2030-01-02"]})
+        self.assertEqual(rv.status_code, 200)
+        mock_delete.assert_called_once_with("barber-1", ["2030-01-02", "2030-01-03"])
+        mock_avail.invalidate_barber.assert_called_once_with("barber-1")
+
+
+class MediaUploadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        with self.app.session_transaction() as sess:
+            sess["barberId"] = "barber-1"
+
+    @patch("app.barber_settings.effective_plan", return_value="premium")
+    @patch("app.media_pipeline.submit", return_value="job1")
+    def test_upload_is_queued_not_sent_inline(self, mock_submit, _plan):
+        rv = self.app.post('/upload-photo', data={"photo": (io.BytesIO(b"img"), "me.png")},
+                           headers={"X-Requested-With": "XMLHttpRequest"})
+        self.assertEqual(rv.status_code, 202)
+        self.assertEqual(rv.get_json()["status_url"], "/api/media/jobs/job1")
+        kind, barber_id, temp_path, base = mock_submit.call_args.args
+        self.assertEqual((kind, barber_id, base), ("photo", "barber-1", "avatars/barber-1"))
+        with open(temp_path, "rb") as f:
+            self.assertEqual(f.read(), b"img")
+        os.remove(temp_path)
+
+    @patch("app.barber_settings.effective_plan", return_value="premium")
+    @patch("app.media_pipeline.submit")
+    def test_oversized_upload_rejected(self, mock_submit, _plan):
+        big = io.BytesIO(b"x" * (5 * 1024 * 1024 + 1))
+        rv = self.app.post('/upload-media', data={"file": (big, "big.jpg")},
+                           headers={"X-Requested-With": "XMLHttpRequest"})
+        self.assertEqual(rv.status_code, 400)
+        mock_submit.assert_not_called()
+
+    @patch("app.media_pipeline.status")
+    def test_job_status_only_for_owner(self, mock_status):
+        mock_status.return_value = {"barber_id": "someone-else", "status": "done"}
+        self.assertEqual(self.app.get('/api/media/jobs/j').status_code, 404)
+        mock_status.return_value = {"barber_id": "barber-1", "status": "done", "url": "u"}
+        self.assertEqual(self.app.get('/api/media/jobs/j').get_json()["url"], "u")
+
+
+class BarbersNearTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_requires_coordinates(self):
+        self.assertEqual(self.app.get('/api/public/barbers/near?lat=abc&lon=1').status_code, 400)
+
+    @patch("app.db.get_barber_cards")
+    @patch.object(geo_index, "nearby")
+    def test_radius_search_shape(self, mock_nearby, mock_cards):
+        mock_nearby.return_value = [{
+            "point_id": "l:7", "barber_id": "b1", "lat": 30.27, "lon": -97.74,
+            "address": "Austin", "location_name": "Downtown", "distance_km": 1.25,
+        }, {
+            # Deleted since this worker last synced its index
+            "point_id": "b:gone", "barber_id": "gone", "lat": 30.27, "lon": -97.74,
+            "address": "", "location_name": None, "distance_km": 2.0,
+        }]
+        mock_cards.return_value = {"b1": {"id": "b1", "name": "Pro", "profession": "Barber", "photo_url": None}}
+        rv = self.app.get('/api/public/barbers/near?lat=30.26&lon=-97.74&radius_km=5&limit=10')
+        self.assertEqual(rv.status_code, 200)
+        mock_nearby.assert_called_once_with(30.26, -97.74, radius_km=5.0, limit=10)
+        self.assertEqual(rv.get_json()["barbers"], [{
+            "barberId": "b1", "name": "Pro", "profession": "Barber", "location": "Austin",
+            "location_name": "Downtown", "media_url": None, "distance_km": 1.25,
+        }])
+
+    @patch("app.search_cache.invalidate")
+    @patch.object(geo_index, "upsert")
+    @patch("app.db.set_coordinates")
+    def test_geocoded_point_is_patched_not_reloaded(self, mock_set, mock_upsert, mock_invalidate):
+        mock_set.return_value = {"id": "loc-1", "barber_id": "b1", "name": "Downtown",
+                                 "address": "Austin", "lat": 30.27, "lon": -97.74}
+        store_coordinates("barber_locations", "loc-1", 30.27, -97.74)
+        point = mock_upsert.call_args.args[0]
+        self.assertEqual((point["point_id"], point["barber_id"]), ("l:loc-1", "b1"))
+        mock_invalidate.assert_not_called()
+
+    @patch.object(geo_index, "nearest", return_value=[])
+    def test_without_radius_returns_nearest(self, mock_nearest):
+        self.app.get('/api/public/barbers/near?lat=30.26&lon=-97.74')
+        mock_nearest.assert_called_once_with(30.26, -97.74, k=20)
+
+
+class BackgroundJobsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def post_event(self, event):
+        with patch("app.stripe.Webhook.construct_event", return_value=event):
+            return self.app.post('/stripe/webhook', data=b"{}", headers={"Stripe-Signature": "sig"})
+
+    @patch("app.db.release_event")
+    @patch("app.db.claim_event", return_value=True)
+    @patch("app.supabase")
+    @patch("app.jobs.enqueue", return_value="job1")
+    def test_webhook_only_enqueues(self, mock_enqueue, mock_supabase, mock_claim, mock_release):
+        event = {
+            "id": "evt_1",
+            "type": "checkout.session.completed",
+            "data": {"object": {"id": "cs_1", "customer": "cus_1", "customer_details": {"email": "a@b.c"},
+                                "metadata": {"barber_id": "barber-1", "promo_code": "ABC"}}},
+        }
+        rv = self.post_event(event)
+        self.assertEqual(rv.status_code, 200)
+        mock_claim.assert_called_once_with("evt_1", "checkout.session.completed")
+        name, payload = mock_enqueue.call_args.args
+        self.assertEqual(name, "stripe.checkout_completed")
+        self.assertEqual((payload["barber_id"], payload["session_id"], payload["customer_id"]),
+                         ("barber-1", "cs_1", "cus_1"))
+        self.assertEqual(mock_enqueue.call_args.kwargs["key"], "stripe:evt_1")
+        mock_supabase.table.assert_not_called()
+
+        # Stripe retries if the job could not be queued, and the retry can claim again
+        mock_enqueue.side_effect = ConnectionError("down")
+        rv = self.post_event(event)
+        self.assertEqual(rv.status_code, 500)
+        mock_release.assert_called_once_with("evt_1")
+
+    @patch("app.db.claim_event", return_value=False)
+    @patch("app.jobs.enqueue")
+    def test_webhook_replay_is_a_no_op(self, mock_enqueue, mock_claim):
+        rv = self.post_event({"id": "evt_old", "type": "invoice.paid",
+                              "data": {"object": {"id": "in_1", "customer": "cus_1"}}})
+        self.assertEqual(rv.status_code, 200)
+        mock_enqueue.assert_not_called()
+
+    @patch("app.db.claim_event")
+    @patch("app.jobs.enqueue")
+    def test_webhook_ignores_unhandled_types(self, mock_enqueue, mock_claim):
+        rv = self.post_event({"id": "evt_2", "type": "charge.refunded", "data": {"object": {}}})
+        self.assertEqual(rv.status_code, 200)
+        mock_claim.assert_not_called()
+        mock_enqueue.assert_not_called()
+
+    @patch("app.db.release_event")
+    def test_dead_stripe_job_releases_its_event(self, mock_release):
+        from app import jobs
+        jobs.dead_handlers["stripe.invoice_paid"]({"event_id": "evt_1"}, "RuntimeError: boom")
+        mock_release.assert_called_once_with("evt_1")
+
+    @patch("app.add_premium_month")
+    @patch("app.db.barber_id_for_stripe_customer", return_value="barber-1")
+    def test_invoice_paid_extends_renewals_only(self, mock_lookup, mock_add_month):
+        from app import extend_premium_for_invoice
+        extend_premium_for_invoice({"customer_id": "cus_1", "billing_reason": "subscription_create"})
+        mock_add_month.assert_not_called()
+        extend_premium_for_invoice({"customer_id": "cus_1", "billing_reason": "subscription_cycle"})
+        mock_add_month.assert_called_once_with("barber-1")
+
+    @patch("app.stripe")
+    @patch("app.supabase")
+    @patch("app.jobs.enqueue", return_value="job1")
+    def test_delete_account_only_enqueues(self, mock_enqueue, mock_supabase, mock_stripe):
+        with self.app.session_transaction() as sess:
+            sess["barberId"] = "barber-1"
+            sess["user_email"] = "a@b.c"
+        rv = self.app.post('/api/barber/delete')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual([c.args[0] for c in mock_enqueue.call_args_list],
+                         ["stripe.cancel_subscriptions", "account.delete"])
+        mock_supabase.table.assert_not_called()
+        mock_stripe.Customer.list.assert_not_called()
+        with self.app.session_transaction() as sess:
+            self.assertNotIn("barberId", sess)
+
+    @patch("app.barber_settings")
+    @patch("app.supabase")
+    def test_account_delete_job_raises_for_retry(self, mock_supabase, mock_settings):
+        from app import delete_account_data
+        mock_supabase.table.return_value.delete.return_value.eq.return_value.execute.side_effect = RuntimeError("db")
+        with self.assertRaises(RuntimeError):
+            delete_account_data({"barber_id": "barber-1"})
+        mock_settings.invalidate.assert_not_called()
+
+
+class PremiumExpiryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    @patch("app.search_cache.invalidate")
+    @patch("app.barber_settings.invalidate")
+    @patch("app.db.expire_premium")
+    def test_batch_endpoint(self, mock_expire, mock_settings, mock_search):
+        mock_expire.return_value = ["b1", "b2", "b3"]
+        self.assertEqual(self.app.post('/api/internal/premium/expire').status_code, 403)
+        mock_expire.assert_not_called()
+
+        with patch.dict(os.environ, {"INTERNAL_API_TOKEN": "tok"}):
+            rv = self.app.post('/api/internal/premium/expire', headers={"X-Internal-Token": "tok"})
+        self.assertEqual(rv.get_json(), {"ok": True, "downgraded": 3})
+        self.assertEqual(mock_settings.call_count, 3)
+        mock_search.assert_called_once()
+
+    @patch("app.db.list_barber_appointments_page", return_value=([], None))
+    @patch("app.supabase")
+    def test_dashboard_never_writes_plan(self, mock_supabase, _appts):
+        with self.app.session_transaction() as sess:
+            sess["barberId"] = "barber-1"
+        builder = mock_supabase.table.return_value
+        builder.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[
+            {"id": "barber-1", "plan": "premium", "premium_expires_at": "2020-01-01T00:00:00"},
+        ])
+        rv = self.app.get('/dashboard', headers={"Accept": "application/json"})
+        self.assertEqual(rv.get_json()["barber"]["plan"], "free")
+        builder.update.assert_not_called()
+
+
+class InternalLimitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    @patch("app.next_slots.sweep")
+    @patch("app.db.list_missing_coordinates")
+    def test_bad_limit_is_400(self, mock_missing, mock_sweep):
+        headers = {"X-Internal-Token": "tok"}
+        with patch.dict(os.environ, {"INTERNAL_API_TOKEN": "tok"}):
+            for path in ('/api/internal/geocode-backfill', '/api/internal/next-slots/refresh'):
+                rv = self.app.post(path + '?limit=abc', headers=headers)
+                self.assertEqual(rv.status_code, 400)
+        mock_missing.assert_not_called()
+        mock_sweep.assert_not_called()
+
+    @patch("app.db.list_missing_coordinates", return_value=[])
+    def test_limit_is_clamped(self, mock_missing):
+        with patch.dict(os.environ, {"INTERNAL_API_TOKEN": "tok"}):
+            rv = self.app.post('/api/internal/geocode-backfill?limit=-5', headers={"X-Internal-Token": "tok"})
+        self.assertEqual(rv.get_json(), {"ok": True, "geocoded": 0, "unresolved": 0})
+        self.assertEqual(mock_missing.call_args.kwargs["limit"], 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+from flask_caching import Cache
+
+from search_cache import SearchCache, normalize, parse_warm_queries
+
+
+def rows(n):
+    return [{"id": str(i), "name": f"P{i}", "profession": "Barber", "address": "Austin", "photo_url": None}
+            for i in range(n)]
+
+
+class TestSearchCache(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        self.cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+        self.searcher = MagicMock(return_value=rows(3))
+        self.search = SearchCache(self.cache, self.searcher, page_size=2)
+
+    def test_pages_are_cached_in_compact_shape(self):
+        barbers, has_more = self.search.get_page("Austin", "Barber", 1)
+        self.assertTrue(has_more)
+        self.assertEqual(barbers[0], {"barberId": "0", "name": "P0", "profession": "Barber",
+                                      "location": "Austin", "media_url": None, "plan": None,
+                                      "next_open": None})
+        self.searcher.assert_called_once_with("austin", "barber", limit=3, offset=0)
+
+        self.search.get_page(" austin ", "BARBER", 1)
+        self.assertEqual(self.searcher.call_count, 1)
+        self.assertEqual(self.search.stats()["hits"], 1)
+
+        # Other pages are separate entries
+        self.search.get_page("austin", "barber", 2)
+        self.searcher.assert_called_with("austin", "barber", limit=3, offset=2)
+
+    def test_invalidate_orphans_every_page(self):
+        self.search.get_page("austin", "", 1)
+        self.search.get_page("dallas", "", 1)
+        self.search.invalidate()
+        self.search.get_page("austin", "", 1)
+        self.search.get_page("dallas", "", 1)
+        self.assertEqual(self.searcher.call_count, 4)
+
+    def test_availability_searches_are_keyed_and_invalidated_separately(self):
+        self.search.get_page("austin", "", 1)
+        self.search.get_page("austin", "", 1, sort="earliest", available_today=True)
+        self.assertEqual(self.searcher.call_count, 2)
+        kwargs = self.searcher.call_args.kwargs
+        self.assertEqual((kwargs["sort"], kwargs["available_today"]), ("earliest", True))
+        self.assertRegex(kwargs["now"], r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$")
+
+        # New next-open slots orphan availability pages without moving the
+        # search generation; relevance pages stay cached
+        gen = self.search.generation()
+        self.search.invalidate_availability()
+        self.assertEqual(self.search.generation(), gen)
+        self.search.get_page("austin", "", 1, sort="earliest", available_today=True)
+        self.assertEqual(self.searcher.call_count, 3)
+        self.search.get_page("austin", "", 1)
+        self.assertEqual(self.searcher.call_count, 3)
+
+    @patch("search_cache.SEARCH_POPULAR_MAX", 4)
+    def test_popular_counter_is_bounded(self):
+        for _ in range(6):
+            self.search.get_page("austin", "", 1)
+        for i in range(10):
+            self.search.get_page(f"city{i}", "", 1)
+        self.assertLessEqual(len(self.search._popular), 4)
+        self.assertEqual(self.search.popular(1), [("austin", "")])
+
+    def test_warm_precomputes_popular_first_pages(self):
+        for _ in range(3):
+            self.search.get_page("austin", "", 1)
+        self.search.get_page("dallas", "nails", 1)
+        self.assertEqual(self.search.popular(1), [("austin", "")])
+
+        self.search.invalidate()
+        self.assertEqual(self.search.warm(), 2)
+        self.assertEqual(self.search.warm(), 0)  # already hot
+
+        calls = self.searcher.call_count
+        self.search.get_page("dallas", "nails", 1)
+        self.assertEqual(self.searcher.call_count, calls)
+
+    def test_warm_queries_from_env_format(self):
+        self.assertEqual(parse_warm_queries("Austin|Barber, dallas ,|x"), [("austin", "barber"), ("dallas", "")])
+        self.assertEqual(normalize("  New   York "), "new york")
+
+
+if __name__ == '__main__':
+    unittest.main()
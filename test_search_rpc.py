@@ -0,0 +1,107 @@
+import os
+import unittest
+import uuid
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+# search_barbers (search_migration.sql + next_slots_migration.sql) against a throwaway Postgres, e.g.
+#   TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest test_search_rpc.py
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = """
+create table barbers (
+  id uuid primary key default gen_random_uuid(),
+  name text, profession text, address text, photo_url text, plan text, bio text
+);
+"""
+
+BARBERS = [
+    ("Ann", "Barber", "12 Main St, Austin, TX", "free"),
+    ("Bob", "Barber", "Austin", "premium"),
+    ("Cid", "Nail Tech", "Austin TX", "premium"),
+    ("Dee", "Barber", "Dallas, TX", "premium"),
+    ("Eve", "Hair Stylist", "100% Austin_Studio", "free"),
+]
+
+NEXT_OPEN = {
+    "Ann": ["2030-01-01 09:00", "2030-01-02 10:00"],
+    "Bob": ["2030-01-01 15:00"],
+    "Eve": ["2030-01-02 08:00"],
+}
+
+
+@unittest.skipUnless(psycopg and TEST_DATABASE_URL, "TEST_DATABASE_URL and psycopg required")
+class TestSearchBarbersRpc(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.schema = f"search_rpc_{uuid.uuid4().hex[:8]}"
+        cls.conn = psycopg.connect(TEST_DATABASE_URL, autocommit=True)
+        if not cls.conn.execute("select 1 from pg_available_extensions where name = 'pg_trgm'").fetchone():
+            cls.conn.close()
+            raise unittest.SkipTest("pg_trgm extension not available")
+        cls.conn.execute(f"create schema {cls.schema}")
+        cls.conn.execute(f"set search_path to {cls.schema}, public")
+        cls.conn.execute(SCHEMA)
+        for migration in ("search_migration.sql", "next_slots_migration.sql"):
+            with open(os.path.join(HERE, migration)) as f:
+                cls.conn.execute(f.read())
+        for name, profession, address, plan in BARBERS:
+            cls.conn.execute(
+                "insert into barbers (name, profession, address, plan, next_open_slots) values (%s, %s, %s, %s, %s)",
+                (name, profession, address, plan, NEXT_OPEN.get(name)),
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.execute(f"drop schema {cls.schema} cascade")
+        cls.conn.close()
+
+    def _names(self, city, service=None, limit=20, offset=0):
+        rows = self.conn.execute(
+            "select name from search_barbers(%s, %s, %s, %s)", (city, service, limit, offset)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def test_premium_first_then_closest_match(self):
+        # Premium Bob/Cid before free Ann/Eve; exact "Austin" ranks above "Austin TX"
+        names = self._names("austin")
+        self.assertEqual(names[:2], ["Bob", "Cid"])
+        self.assertEqual(sorted(names[2:]), ["Ann", "Eve"])
+
+    def test_service_filter_and_paging(self):
+        self.assertEqual(self._names("AUSTIN", "barb"), ["Bob", "Ann"])
+        self.assertEqual(self._names("austin", limit=2, offset=2), self._names("austin")[2:])
+
+    def test_wildcards_in_input_are_literal(self):
+        self.assertEqual(self._names("100%"), ["Eve"])
+        self.assertEqual(self._names("n_s"), ["Eve"])
+        self.assertEqual(self._names("%"), ["Eve"])
+
+    def test_earliest_opening_sort_and_today_filter(self):
+        rows = self.conn.execute(
+            "select name, next_open from search_barbers('austin', null, 20, 0, 'earliest', '2030-01-01 12:00')"
+        ).fetchall()
+        # Ann's 09:00 slot has passed, so her next opening is tomorrow
+        self.assertEqual(rows[:3], [("Bob", "2030-01-01 15:00"), ("Eve", "2030-01-02 08:00"),
+                                    ("Ann", "2030-01-02 10:00")])
+        self.assertEqual(rows[3], ("Cid", None))
+
+        rows = self.conn.execute(
+            "select name from search_barbers('austin', null, 20, 0, 'earliest', '2030-01-01 12:00', true)"
+        ).fetchall()
+        self.assertEqual(rows, [("Bob",)])
+
+    def test_projection(self):
+        cur = self.conn.execute("select * from search_barbers('austin')")
+        self.assertEqual(
+            [c.name for c in cur.description],
+            ["id", "name", "profession", "address", "photo_url", "plan", "next_open"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
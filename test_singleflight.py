@@ -0,0 +1,60 @@
+import threading
+import unittest
+
+from flask import Flask
+from flask_caching import Cache
+
+from singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        self.flight = SingleFlight(Cache(app, config={'CACHE_TYPE': 'SimpleCache'}), wait_timeout=2.0)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def _lead_in_background(self, fn):
+        errors = []
+
+        def run():
+            try:
+                self.flight.do("k", fn, lambda: None)
+            except Exception as e:
+                errors.append(e)
+
+        t = threading.Thread(target=run)
+        t.start()
+        self.started.wait(1)
+        return t, errors
+
+    def test_waiter_shares_leader_result(self):
+        def slow():
+            self.started.set()
+            self.release.wait(1)
+            return "value"
+
+        t, _ = self._lead_in_background(slow)
+        threading.Timer(0.05, self.release.set).start()
+        self.assertEqual(self.flight.do("k", lambda: "other", lambda: None), ("value", False))
+        t.join()
+        self.assertEqual(self.flight.stats()["coalesced_local"], 1)
+
+    def test_failed_leader_is_not_a_timeout(self):
+        def boom():
+            self.started.set()
+            self.release.wait(1)
+            raise RuntimeError("db down")
+
+        t, errors = self._lead_in_background(boom)
+        threading.Timer(0.05, self.release.set).start()
+        self.assertEqual(self.flight.do("k", lambda: "fallback", lambda: None), ("fallback", True))
+        t.join()
+        self.assertEqual(len(errors), 1)
+        stats = self.flight.stats()
+        self.assertEqual(stats["leader_errors"], 1)
+        self.assertEqual(stats["wait_timeouts"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+"""
+Background job worker: `python worker.py` (Procfile "worker" process).
+
+Imports the app for its registered job handlers without starting the web
+process's in-process workers, then runs the queue until interrupted.
+Only useful with the Redis backend; the SQLite fallback is local to a host.
+"""
+import logging
+import os
+
+os.environ["JOB_WORKER_INPROCESS"] = "0"
+
+from app import jobs  # noqa: E402
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Job worker started ({jobs.stats().get('backend')} backend)")
+    try:
+        jobs.run_worker()
+    except KeyboardInterrupt:
+        pass